@@ -0,0 +1,49 @@
+"""
+APIView with coroutine handlers, for endpoints that mostly wait on other
+services (SMS, geocoding, translation, push):
+
+    class SendOtpAPI(AsyncAPIView):
+        async def post(self, request):
+            ...
+            return Response(response)
+
+Under ASGI the handler runs on the event loop, so a slow provider holds a
+coroutine instead of a worker thread. The ORM must be reached through its
+async methods (aget, afirst, asave, ...) or sync_to_async. Authentication,
+permissions and throttling stay synchronous and run on the request's
+thread before the handler is awaited, so request.user is ready to use.
+"""
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authenticators and permissions may query the database
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            # OPTIONS and the not-allowed handler are inherited, synchronous ones
+            if isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,144 @@
+"""
+Response caching for APIView handlers, invalidated by tags:
+
+    class DashboardAPIView(APIView):
+        @cache_response(tags=("notifications", "vehicles"), key_func=shared_key)
+        def get(self, request, *args, **kwargs):
+            ...
+
+Every tag has a version stamp in the cache and a response is stored under
+the versions of its tags, so bumping a tag orphans every response built
+from it. Tags are bumped after commit by the model signals registered with
+invalidate_on_change(). Set-based writes (update(), bulk_create()) send no
+signals, they call invalidate_tags() themselves or are bounded by the
+timeout.
+
+A miss is computed on the primary even in a ReplicaReadMixin view. The
+first request after a write would otherwise often read a lagging replica
+and keep that stale result under the new tag versions, for every user and
+the whole timeout. Misses cost primary load, hits cost nothing.
+
+The cache is an optimization only: when it fails, the error is logged and
+the request is served as a miss.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .metrics import request_metrics, body_status
+from .routers import use_primary
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def user_key(request):
+    """The response depends on who asks and on every query parameter."""
+    return f"{request.user.pk}:{request.get_full_path()}"
+
+
+def shared_key(request):
+    """Every authorized user gets the same response for the same URL."""
+    return request.get_full_path()
+
+
+def daily_shared_key(request):
+    """As shared_key, for views whose defaults depend on today's date."""
+    return f"{timezone.localdate().isoformat()}:{request.get_full_path()}"
+
+
+def log_cache_error(e):
+    error = f"\nType: {type(e).__name__}"
+    error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+    error += f"\nLine: {e.__traceback__.tb_lineno}"
+    error += f"\nMessage: {str(e)}"
+    logger.error(error)
+
+
+def tag_version_key(tag):
+    return f"cache:tag:{tag}"
+
+
+def invalidate_tags(*tags):
+    """Bump the tags once the current transaction commits, readers meanwhile still see the old rows."""
+    def bump():
+        # The write has committed, a cache outage must not turn it into an error
+        try:
+            for tag in tags:
+                key = tag_version_key(tag)
+                cache.add(key, 1, timeout=None)
+                cache.incr(key)
+        except Exception as e:
+            log_cache_error(e)
+    transaction.on_commit(bump)
+
+
+def invalidate_on_change(model, *tags):
+    """Bump `tags` whenever a `model` row is saved or deleted."""
+    def changed(sender, **kwargs):
+        invalidate_tags(*tags)
+
+    uid = f"cache:{model._meta.label}:{','.join(tags)}"
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+
+
+def response_key(view, request, key_func, tags):
+    version_keys = [tag_version_key(tag) for tag in tags]
+    versions = cache.get_many(version_keys)
+    digest = hashlib.md5(key_func(request).encode(), usedforsecurity=False).hexdigest()
+    stamp = ".".join(str(versions.get(key, 0)) for key in version_keys)
+    return f"view:{type(view).__module__}.{type(view).__qualname__}:{digest}:{stamp}"
+
+
+def is_cacheable(response):
+    if response.status_code != 200 or response.streaming:
+        return False
+    # Views report failures as {"status": 400, ...} in a 200 response
+    status = body_status(response.data)
+    return status is None or status < 400
+
+
+def cache_name(request):
+    match = request.resolver_match
+    return (match.view_name or match.url_name) if match else "unresolved"
+
+
+def cache_response(timeout=None, key_func=user_key, tags=()):
+    """
+    Caches the data and status of successful responses of a handler.
+    Headers are not kept, views setting an ETag validate on their own instead.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            try:
+                key = response_key(view, request, key_func, tags)
+                cached = cache.get(key)
+            except Exception as e:
+                log_cache_error(e)
+                key = cached = None
+            request_metrics.record_cache(cache_name(request), hit=cached is not None)
+            if cached is not None:
+                data, status = cached
+                return Response(data, status=status)
+
+            with use_primary():
+                response = handler(view, request, *args, **kwargs)
+            if key is not None and is_cacheable(response):
+                try:
+                    cache.set(
+                        key, (response.data, response.status_code),
+                        settings.VIEW_CACHE_TIMEOUT if timeout is None else timeout)
+                except Exception as e:
+                    log_cache_error(e)
+            return response
+        return wrapper
+    return decorator
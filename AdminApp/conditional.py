@@ -0,0 +1,72 @@
+"""
+Conditional GET (ETag / Last-Modified) for list and detail endpoints.
+
+A scope's validators are its newest `updated_at` and its row count, read in
+one aggregate query, so an unchanged poll is answered with 304 Not Modified
+before anything is serialized:
+
+    validators = Validators.for_queryset(request, notifications)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    ...
+    return validators.apply(Response(data))
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.db.models.functions import Greatest
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class Validators:
+
+    def __init__(self, last_modified, *parts):
+        self.last_modified = last_modified
+        digest = hashlib.md5(
+            "|".join(str(part) for part in (last_modified, *parts)).encode(), usedforsecurity=False)
+        # Weak, the same data can be rendered or compressed differently
+        self.etag = f"W/{quote_etag(digest.hexdigest())}"
+
+    @classmethod
+    def for_queryset(cls, request, queryset, fields=("updated_at",), **aggregates):
+        """
+        `fields` may span relations, the newest of them wins. Extra aggregates
+        cover state that changes without a write (e.g. expiring reservations).
+        The row count is kept on `count`, views need not query it again.
+        """
+        newest = Max(fields[0]) if len(fields) == 1 else Max(Greatest(*fields))
+        version = queryset.aggregate(last_modified=newest, count=Count("pk"), **aggregates)
+        last_modified = version.pop("last_modified")
+        # The response depends on who asks and on every query parameter
+        validators = cls(last_modified, request.user.pk, request.get_full_path(), *version.values())
+        validators.count = version["count"]
+        return validators
+
+    @classmethod
+    def for_instance(cls, request, instance, field="updated_at"):
+        """A detail endpoint validates against the row it already loaded."""
+        return cls(getattr(instance, field), request.user.pk, request.get_full_path())
+
+    def not_modified(self, request):
+        """
+        The 304 response if the client's copy is current, otherwise None.
+        Only If-None-Match is honoured, a newest timestamp misses deletions.
+        """
+        response = get_conditional_response(request, etag=self.etag)
+        if response is not None:
+            return self.apply(response)
+        return None
+
+    def apply(self, response):
+        response["ETag"] = self.etag
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.timestamp())
+        # Clients keep their copy but must revalidate every time
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def timestamp(self):
+        return int(self.last_modified.timestamp()) if self.last_modified else None
@@ -0,0 +1,119 @@
+# metrics.py
+import threading
+from collections import defaultdict
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def body_status(data):
+    """
+    The status views report in the body ({"status": 400, ...} in a 200
+    response), None if the payload has none.
+    """
+    if isinstance(data, dict) and isinstance(data.get("status"), int):
+        return data["status"]
+    return None
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a view runs more queries than its query_budget (QUERY_BUDGET_STRICT only)."""
+
+
+class RequestMetrics:
+    """
+    Per-process request metrics keyed by URL name. Every worker keeps its own
+    numbers, Prometheus sums them across scrape targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.requests = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.seconds = defaultdict(float)
+        self.response_bytes = defaultdict(int)
+        self.budget_exceeded = defaultdict(int)
+        self.body_errors = defaultdict(int)
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.cache_lookups = defaultdict(int)
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def record(self, url_name, method, status, queries, db_seconds, seconds, size, over_budget=False,
+               reported_status=None):
+        with self._lock:
+            self.requests[(url_name, method, status)] += 1
+            # Most views answer 200 and put their failure in the body
+            if reported_status is not None and reported_status >= 400:
+                self.body_errors[(url_name, reported_status)] += 1
+            self.queries[url_name] += queries
+            self.db_seconds[url_name] += db_seconds
+            self.seconds[url_name] += seconds
+            self.response_bytes[url_name] += size
+            if over_budget:
+                self.budget_exceeded[url_name] += 1
+            buckets = self.buckets[url_name]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+
+    def record_cache(self, name, hit):
+        with self._lock:
+            self.cache_lookups[(name, "hit" if hit else "miss")] += 1
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests handled, by URL name, method and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (url_name, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{url_name="{url_name}",method="{method}",status="{status}"}} {count}')
+
+            counters = (
+                ("http_request_db_queries_total", "Database queries run", self.queries),
+                ("http_request_db_seconds_total", "Time spent in database queries", self.db_seconds),
+                ("http_response_bytes_total", "Response body bytes sent", self.response_bytes),
+                ("http_query_budget_exceeded_total", "Requests over the view's query budget", self.budget_exceeded),
+            )
+            for name, help_text, values in counters:
+                lines.append(f"# HELP {name} {help_text}, by URL name.")
+                lines.append(f"# TYPE {name} counter")
+                for url_name, value in sorted(values.items()):
+                    lines.append(f'{name}{{url_name="{url_name}"}} {value}')
+
+            lines.append("# HELP http_request_duration_seconds Request duration, by URL name.")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for url_name, buckets in sorted(self.buckets.items()):
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(
+                        f'http_request_duration_seconds_bucket{{url_name="{url_name}",le="{bound}"}} {count}')
+                total = sum(count for (name, _, _), count in self.requests.items() if name == url_name)
+                lines.append(f'http_request_duration_seconds_bucket{{url_name="{url_name}",le="+Inf"}} {total}')
+                lines.append(f'http_request_duration_seconds_sum{{url_name="{url_name}"}} {self.seconds[url_name]}')
+                lines.append(f'http_request_duration_seconds_count{{url_name="{url_name}"}} {total}')
+
+            lines.append(
+                "# HELP http_response_body_errors_total Responses reporting a failure in their body status,"
+                " by URL name and that status.")
+            lines.append("# TYPE http_response_body_errors_total counter")
+            for (url_name, status), count in sorted(self.body_errors.items()):
+                lines.append(f'http_response_body_errors_total{{url_name="{url_name}",status="{status}"}} {count}')
+
+            lines.append("# HELP cache_lookups_total Cache lookups, by cache name and result.")
+            lines.append("# TYPE cache_lookups_total counter")
+            for (name, result), count in sorted(self.cache_lookups.items()):
+                lines.append(f'cache_lookups_total{{cache="{name}",result="{result}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
@@ -1,25 +1,295 @@
 # middleware.py
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from rest_framework_simplejwt.tokens import AccessToken
 from .models import BlacklistedAccessToken
+from .metrics import request_metrics, body_status, QueryBudgetExceeded
+from .routers import SAFE_METHODS, pin_to_primary
 from django.http import JsonResponse
+from django.db import connections
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+import logging
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class HybridMiddleware(ABC):
+    """
+    Base for middleware that runs natively in both stacks. Under ASGI with
+    async views nothing is pushed to a thread just to pass the middleware.
+    Subclasses implement both call() and __acall__().
+    """
+    sync_capable = True
+    async_capable = True
 
-class AccessTokenBlacklistMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.call(request)
+
+    @abstractmethod
+    def call(self, request):
+        """Handle the request under WSGI or with a sync view chain."""
+
+    @abstractmethod
+    async def __acall__(self, request):
+        """Handle the request when the chain below is async."""
+
+
+class AccessTokenBlacklistMiddleware(HybridMiddleware):
+
+    def call(self, request):
+        jti, error = self.read_token(request)
+        try:
+            # Check if the jti is blacklisted
+            if jti and BlacklistedAccessToken.objects.filter(jti=jti).exists():
+                error = self.blacklisted()
+        except Exception:
+            error = self.invalid()
+        if error is not None:
+            return error
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        jti, error = self.read_token(request)
+        try:
+            if jti and await BlacklistedAccessToken.objects.filter(jti=jti).aexists():
+                error = self.blacklisted()
+        except Exception:
+            error = self.invalid()
+        if error is not None:
+            return error
+        return await self.get_response(request)
+
+    def read_token(self, request):
+        """The bearer token's jti, or the error response for a malformed token."""
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             access_token_str = auth_header.split(" ")[1]
             try:
                 access_token = AccessToken(access_token_str)
-                jti = access_token["jti"]
-
-                # Check if the jti is blacklisted
-                if BlacklistedAccessToken.objects.filter(jti=jti).exists():
-                    return JsonResponse({"error": "Access token has been blacklisted."}, status=401)
+                return access_token["jti"], None
             except Exception:
-                return JsonResponse({"error": "Invalid access token."}, status=401)
+                return None, self.invalid()
+        return None, None
+
+    def blacklisted(self):
+        return JsonResponse({"error": "Access token has been blacklisted."}, status=401)
 
+    def invalid(self):
+        return JsonResponse({"error": "Invalid access token."}, status=401)
+
+
+class PrimaryPinMiddleware(HybridMiddleware):
+    """
+    After a user writes, their reads stay on the primary for
+    REPLICA_PIN_SECONDS, so replica lag never hides their own changes.
+    """
+
+    def call(self, request):
         response = self.get_response(request)
+        self.pin(request)
         return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            # A session user is only loaded on first access, from the database
+            await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        if not settings.DATABASE_REPLICA or request.method in SAFE_METHODS:
+            return
+        # DRF copies the token's user onto the underlying request
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user)
+
+
+class QueryMetricsMiddleware(HybridMiddleware):
+    """
+    Records query count, DB time, total time and response size per URL name,
+    and checks them against the `query_budget` a view class may declare.
+    """
+
+    def call(self, request):
+        stats = {"queries": 0, "db_seconds": 0.0}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.count_queries(stack, stats)
+            response = self.get_response(request)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = {"queries": 0, "db_seconds": 0.0}
+        start = time.perf_counter()
+        stack = ExitStack()
+        # Connections belong to a thread, the ORM runs on the request's sync thread
+        await sync_to_async(self.count_queries)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    def count_queries(self, stack, stats):
+        def count(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats["queries"] += 1
+                stats["db_seconds"] += time.perf_counter() - start
+
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(count))
+
+    def record(self, request, response, stats, seconds):
+        match = request.resolver_match
+        url_name = (match.view_name or match.url_name) if match else "unresolved"
+        size = 0 if response.streaming else len(response.content)
+
+        budget = getattr(getattr(match.func, "view_class", None), "query_budget", None) if match else None
+        over_budget = budget is not None and stats["queries"] > budget
+
+        request_metrics.record(
+            url_name, request.method, response.status_code, stats["queries"],
+            stats["db_seconds"], seconds, size, over_budget,
+            reported_status=body_status(getattr(response, "data", None)),
+        )
+
+        if over_budget:
+            message = f"{url_name} ran {stats['queries']} queries, budget is {budget}"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+
+class StreamCompressor:
+    """Incremental gzip/brotli, every chunk is flushed so clients can parse rows as they arrive."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31 writes the gzip header and trailer
+            self.compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        if self.encoding == "br":
+            return self.compressor.process(chunk) + self.compressor.flush()
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """
+    Negotiated brotli or gzip compression for JSON and text responses.
+    Buffered responses are compressed from COMPRESSION_MIN_SIZE bytes on,
+    streams chunk by chunk whatever their size.
+
+    Views whose responses carry secrets (access and refresh tokens) set
+    `compress_response = False`. A compressed secret next to input the
+    attacker controls leaks through the response size (BREACH).
+    """
+    content_types = ("application/json", "text/")
+
+    def call(self, request):
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        match = request.resolver_match
+        if match and not getattr(getattr(match.func, "view_class", None), "compress_response", True):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header("Content-Encoding") or \
+                not response.get("Content-Type", "").startswith(self.content_types):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = self.negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.compress_async(encoding, response.streaming_content)
+            else:
+                response.streaming_content = self.compress_sequence(encoding, response.streaming_content)
+            # The compressed size is unknown until the stream ends
+            del response.headers["Content-Length"]
+        else:
+            compressor = StreamCompressor(encoding)
+            content = compressor.compress(response.content) + compressor.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+
+        # A strong ETag no longer matches the bytes sent
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def negotiate(self, accept_encoding):
+        accepted = set()
+        for coding in accept_encoding.lower().split(","):
+            name, _, params = coding.partition(";")
+            params = params.replace(" ", "")
+            try:
+                weight = float(params[2:]) if params.startswith("q=") else 1.0
+            except ValueError:
+                weight = 1.0
+            # q=0 explicitly refuses the coding
+            if weight > 0:
+                accepted.add(name.strip())
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def compress_sequence(self, encoding, sequence):
+        compressor = StreamCompressor(encoding)
+        for chunk in sequence:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+    async def compress_async(self, encoding, sequence):
+        compressor = StreamCompressor(encoding)
+        async for chunk in sequence:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
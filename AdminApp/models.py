@@ -51,7 +51,7 @@ class User(AbstractBaseUser):
         max_length=255,
         unique=True,
     )
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
     number = models.CharField(
         max_length=15, unique=True, null=True, default=None)
     is_active = models.BooleanField(default=False)
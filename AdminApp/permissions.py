@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from django.conf import settings
 
 class IsProfileOwner(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -6,3 +7,15 @@ class IsProfileOwner(permissions.BasePermission):
         if not profile_id:
             return False
         return str(request.user.id) == profile_id
+
+
+class IsMetricsScraper(permissions.BasePermission):
+    """
+    Metrics are for admins, and for the scraper addresses in
+    METRICS_ALLOWED_IPS when the app is reached without a proxy.
+    """
+
+    def has_permission(self, request, view):
+        if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+            return True
+        return bool(request.user and request.user.is_authenticated and request.user.role == "admin")
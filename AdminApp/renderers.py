@@ -1,12 +1,138 @@
 from rest_framework import renderers
-import json
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.utils import encoders
+from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+import itertools
+import orjson
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ends a stream that failed after it started, see StreamingJSONResponse
+STREAM_ERROR = "The response was cut short, retry the request."
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    Encodes straight to bytes with orjson. Anything orjson does not know
+    (Decimal, lazy strings, querysets) and datetimes go through DRF's
+    encoder so the output matches the stock JSONRenderer.
+    """
+    charset = "utf-8"
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    encoder = encoders.JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self.encoder.default, option=options)
+
+
+class UserRenderer(FastJSONRenderer):
+    """Wraps validation and API exception payloads in {"errors": ...}."""
 
-class UserRenderer(renderers.JSONRenderer):
-    charset= "utf-8"
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        response = ""
-        if "ErrorDetail" in str(data):
-            response = json.dumps({"errors": data})
+        if self.is_error(data, renderer_context):
+            data = {"errors": data}
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def is_error(self, data, renderer_context):
+        response = (renderer_context or {}).get("response")
+        if response is None or response.status_code < 400:
+            return False
+        # Raised exceptions went through the exception handler
+        if response.exception:
+            return True
+        # A view returning serializer.errors itself
+        return isinstance(data, dict) and any(self.is_error_detail(value) for value in data.values())
+
+    def is_error_detail(self, value):
+        # Error payloads are ErrorDetail leaves in lists and nested dicts
+        while isinstance(value, (list, dict)) and value:
+            value = value[0] if isinstance(value, list) else next(iter(value.values()))
+        return isinstance(value, ErrorDetail)
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    A JSON document whose `key` holds a large list, serialized row by row
+    from queryset.iterator() so memory stays flat whatever the table size:
+
+        {**envelope, key: [to_representation(row), ...]}
+
+    With key=None the document is the bare list. Rows for which
+    to_representation returns None are left out.
+
+    The first chunk_size rows are rendered in the constructor, so a failing
+    query or serializer still fails the view. Once the status line is out a
+    failure can only be logged: the document is closed with an "error" key
+    (or, for a bare list, a last {"error": ...} element) so the client can
+    tell the list is incomplete.
+    """
+
+    def __init__(self, request, queryset, to_representation, envelope=None, key="data",
+                 chunk_size=500, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        # Rows are read after the view returned, on the database it routed to
+        queryset = queryset.using(queryset.db)
+        chunks = self.render_chunks(queryset, to_representation, envelope or {}, key, chunk_size)
+        chunks = itertools.chain((next(chunks),), chunks)
+        # Under ASGI every chunk is pulled on the request's thread, the event loop never blocks
+        if hasattr(request, "scope"):
+            chunks = self.pull_chunks(chunks)
+        super().__init__(chunks, **kwargs)
+
+    @staticmethod
+    def encode(data):
+        return orjson.dumps(data, default=FastJSONRenderer.encoder.default, option=FastJSONRenderer.options)
+
+    def render_chunks(self, queryset, to_representation, envelope, key, chunk_size):
+        if key is None:
+            opening, closing = b"[", b"]"
         else:
-            response = json.dumps(data)
-        return response
\ No newline at end of file
+            # The envelope without its closing brace, then the list
+            head = self.encode(envelope)[:-1]
+            opening, closing = head + (b"," if envelope else b"") + self.encode(key) + b":[", b"]}"
+
+        # Nothing goes out before the first rows are rendered
+        started = False
+        rows = []
+        try:
+            for instance in queryset.iterator(chunk_size=chunk_size):
+                data = to_representation(instance)
+                if data is None:
+                    continue
+                rows.append(self.encode(data))
+                if len(rows) >= chunk_size:
+                    yield (b"," if started else opening) + b",".join(rows)
+                    started = True
+                    rows = []
+        except Exception as e:
+            if not started:
+                raise
+            error = f"\nType: {type(e).__name__}"
+            error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+            error += f"\nLine: {e.__traceback__.tb_lineno}"
+            error += f"\nMessage: {str(e)}"
+            logger.error(error)
+            if key is None:
+                yield b"," + self.encode({"error": STREAM_ERROR}) + closing
+            else:
+                yield b"]," + self.encode("error") + b":" + self.encode(STREAM_ERROR) + b"}"
+            return
+
+        if started:
+            yield (b"," + b",".join(rows) if rows else b"") + closing
+        else:
+            yield opening + b",".join(rows) + closing
+
+    @staticmethod
+    async def pull_chunks(chunks):
+        pull = sync_to_async(next, thread_sensitive=True)
+        while (chunk := await pull(chunks, None)) is not None:
+            yield chunk
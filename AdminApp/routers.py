@@ -0,0 +1,97 @@
+"""
+Read-replica routing for reporting views.
+
+A view opts in with ReplicaReadMixin. Once the user is authenticated, the
+reads of that request go to settings.DATABASE_REPLICA, and writes always
+go to the primary:
+
+    class DashboardAPIView(ReplicaReadMixin, APIView):
+        ...
+
+A user who wrote recently is pinned to the primary for REPLICA_PIN_SECONDS,
+so their own changes never look lost because of replication lag. The pin
+lives in the default cache, which must be shared by all workers (Redis)
+for it to hold across them. When the cache fails, reads go to the primary.
+Code in a reporting view that reads in order to write runs under
+`use_primary()`.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The alias reads of the current request go to, None routes them to the primary
+read_alias = ContextVar("read_alias", default=None)
+
+PIN_KEY = "primary-pin:{}"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+@contextmanager
+def use_primary():
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def log_error(e):
+    error = f"\nType: {type(e).__name__}"
+    error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+    error += f"\nLine: {e.__traceback__.tb_lineno}"
+    error += f"\nMessage: {str(e)}"
+    logger.error(error)
+
+
+def pin_to_primary(user):
+    # Runs after the write committed, it must not fail the response
+    try:
+        cache.set(PIN_KEY.format(user.pk), 1, timeout=settings.REPLICA_PIN_SECONDS)
+    except Exception as e:
+        log_error(e)
+
+
+def is_pinned(user):
+    try:
+        return cache.get(PIN_KEY.format(user.pk)) is not None
+    except Exception as e:
+        log_error(e)
+        # Without the pin, the primary is the safe choice
+        return True
+
+
+class ReplicaReadMixin:
+    """For APIViews whose reads may lag the primary by a few seconds."""
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Authentication and permission checks have read from the primary
+        user = request.user
+        if settings.DATABASE_REPLICA and not (user.is_authenticated and is_pinned(user)):
+            read_alias.set(settings.DATABASE_REPLICA)
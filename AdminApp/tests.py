@@ -1,3 +1,235 @@
-from django.test import TestCase
+import json
+from unittest import mock
+
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core import mail
+from django.test import override_settings
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from django.test import RequestFactory
+
+from config.testing import QueryCountTestCase, PASSWORD
+from AdminApp.metrics import request_metrics
+from AdminApp.models import User
+from AdminApp.renderers import StreamingJSONResponse, STREAM_ERROR
+from AdminApp.routers import ReplicaRouter, read_alias
 
 # Create your tests here.
+
+
+class AccountEndpointQueryTests(QueryCountTestCase):
+
+    def test_sign_up(self):
+        data = {
+            "email": "new.staff@kana.test", "name": "New Staff", "number": "9111111111",
+            "password": PASSWORD, "password2": PASSWORD,
+        }
+        with self.assertMaxQueries(4):
+            response = self.client.post(reverse("SignUp"), data, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_sign_in(self):
+        data = {"email": self.staff_user.email, "password": PASSWORD}
+        with self.assertMaxQueries(2):
+            response = self.client.post(reverse("SignIn"), data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        self.authenticate(self.staff_user)
+        with self.assertMaxQueries(3):
+            response = self.client.post(reverse("logout"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_check_refresh(self):
+        refresh = RefreshToken.for_user(self.staff_user)
+        data = {"access": str(refresh.access_token), "refresh": str(refresh)}
+        with self.assertMaxQueries(1):
+            response = self.client.post(reverse("token_check_refresh"), data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_password(self):
+        self.authenticate(self.staff_user)
+        data = {"current": PASSWORD, "password": "new-password", "confirm": "new-password"}
+        with self.assertMaxQueries(3):
+            response = self.client.post(reverse("changepassword"), data, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_reset_password_email(self):
+        with self.assertMaxQueries(2):
+            response = self.client.post(
+                "/api/user/reset-password-email/", {"email": self.staff_user.email}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_reset_password(self):
+        uid = urlsafe_base64_encode(force_bytes(self.staff_user.id))
+        token = PasswordResetTokenGenerator().make_token(self.staff_user)
+        data = {"password": "new-password", "password2": "new-password"}
+        with self.assertMaxQueries(2):
+            response = self.client.post(reverse("resetpassword", args=[uid, token]), data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfileEndpointQueryTests(QueryCountTestCase):
+
+    def test_profile(self):
+        self.authenticate(self.staff_user)
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse("profile"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_all_profiles(self):
+        self.authenticate(self.admin)
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("profiles"))
+            profiles = self.get_json(response)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.admin.id, [profile["id"] for profile in profiles])
+
+    def test_profile_edit(self):
+        self.authenticate(self.staff_user)
+        with self.assertMaxQueries(4):
+            response = self.client.post(
+                f"{reverse('profile-edit')}?profile_id={self.staff_user.id}", {"name": "Renamed"}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_user_edit(self):
+        self.authenticate(self.admin)
+        with self.assertMaxQueries(4):
+            response = self.client.post(
+                f"{reverse('user-edit')}?user_id={self.staff_user.id}", {"is_blocked": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_get_user(self):
+        self.authenticate(self.admin)
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("get-user-by-id"), {"user_id": self.staff_user.id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics(self):
+        self.authenticate(self.admin)
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_count_body_errors(self):
+        request_metrics.reset()
+        self.authenticate(self.driver)
+        response = self.client.get(reverse("locked-notifications"), {"since": "yesterday"})
+        self.assertEqual((response.status_code, response.data["status"]), (200, 400))
+        self.client.get(reverse("locked-notifications"))
+        self.assertEqual(dict(request_metrics.body_errors), {("locked-notifications", 400): 1})
+
+        self.authenticate(self.admin)
+        body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('http_response_body_errors_total{url_name="locked-notifications",status="400"} 1', body)
+
+    def test_metrics_need_token(self):
+        # The test client comes from 127.0.0.1, no address is trusted by default
+        response = self.client.get(reverse("metrics"))
+        self.assertIn(response.status_code, (401, 403))
+
+        with override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"]):
+            response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+
+
+# The test database has no replica, "default" stands in for one
+@override_settings(DATABASE_REPLICA="default")
+class ReplicaRoutingTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.staff_user)
+        # Aliases the router picked, None is the primary
+        self.routed = []
+
+        def db_for_read(router, model, **hints):
+            self.routed.append(read_alias.get())
+            return read_alias.get()
+
+        patcher = mock.patch.object(ReplicaRouter, "db_for_read", db_for_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reporting_view_reads_from_replica(self):
+        response = self.client.get(reverse("all-vehicle-info"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("default", self.routed)
+
+    def test_cached_reporting_miss_reads_from_primary(self):
+        # A stale replica result would be cached for every user
+        response = self.client.get(reverse("dashboard-view"))
+        self.assertEqual(response.data["status"], 200)
+        self.assertEqual(set(self.routed), {None})
+
+    def test_other_views_read_from_primary(self):
+        response = self.client.get(reverse("profile"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.routed), {None})
+
+    def test_write_pins_user_to_primary(self):
+        response = self.client.post(
+            f"{reverse('profile-edit')}?profile_id={self.staff_user.id}", {"name": "Renamed"}, format="json")
+        self.assertEqual(response.data["status"], 200)
+        self.routed.clear()
+
+        response = self.client.get(reverse("all-vehicle-info"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.routed), {None})
+
+    def test_cache_down_reads_from_primary(self):
+        with mock.patch("AdminApp.routers.cache") as cache:
+            cache.get.side_effect = cache.set.side_effect = ConnectionError("cache is down")
+            response = self.client.post(
+                f"{reverse('profile-edit')}?profile_id={self.staff_user.id}", {"name": "Renamed"}, format="json")
+            self.assertEqual(response.data["status"], 200)
+
+            response = self.client.get(reverse("all-vehicle-info"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.routed), {None})
+
+
+class StreamingJSONResponseTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get("/")
+        self.users = User.objects.order_by("email")
+
+    def stream(self, to_representation, **kwargs):
+        response = StreamingJSONResponse(self.request, self.users, to_representation, chunk_size=2, **kwargs)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_stream(self):
+        emails = list(self.users.values_list("email", flat=True))
+        body = self.stream(lambda user: user.email, envelope={"status": 200})
+        self.assertEqual(body, {"status": 200, "data": emails})
+        self.assertEqual(self.stream(lambda user: user.email, key=None), emails)
+
+    def test_first_rows_fail_the_view(self):
+        def fail(user):
+            raise ValueError("broken row")
+        with self.assertRaises(ValueError):
+            StreamingJSONResponse(self.request, self.users, fail, chunk_size=2)
+
+    def test_failure_after_start_is_marked(self):
+        rendered = []
+
+        def fail_third(user):
+            if len(rendered) == 2:
+                raise ValueError("broken row")
+            rendered.append(user.email)
+            return user.email
+
+        with self.assertLogs("AdminApp.renderers", "ERROR"):
+            body = self.stream(fail_third, envelope={"status": 200})
+        self.assertEqual(body, {"status": 200, "data": rendered, "error": STREAM_ERROR})
+
+        rendered.clear()
+        with self.assertLogs("AdminApp.renderers", "ERROR"):
+            body = self.stream(fail_third, key=None)
+        self.assertEqual(body, rendered + [{"error": STREAM_ERROR}])
@@ -1,5 +1,5 @@
 from django.urls import path
-from AdminApp.views import UserSignUp, UserSignIn, UserProfile, GetAllProfiles, ChangePassword, PasswordResetEmail, PasswordReset, UserLogout, EditUserById, GetUserByIdView, EditProfileById, TokenRefreshView
+from AdminApp.views import UserSignUp, UserSignIn, UserProfile, GetAllProfiles, ChangePassword, PasswordResetEmail, PasswordReset, UserLogout, EditUserById, GetUserByIdView, EditProfileById, TokenRefreshView, MetricsView
 
 urlpatterns = [
     path('SignUp', UserSignUp.as_view(), name="SignUp"),
@@ -14,4 +14,5 @@ urlpatterns = [
     path('reset-password-email/', PasswordResetEmail.as_view(), name="resetpassword"),
     path('reset-password/<uid>/<token>/', PasswordReset.as_view(), name="resetpassword"),
     path('token/check-refresh/', TokenRefreshView.as_view(), name='token_check_refresh'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
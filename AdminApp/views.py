@@ -10,14 +10,16 @@ from rest_framework_simplejwt.tokens import AccessToken
 
 from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
 from django.conf import settings
 
-from AdminApp.renderers import UserRenderer
+from AdminApp.renderers import UserRenderer, StreamingJSONResponse
 from AdminApp.serializers import SignUpSerializer, SignInSerializer, ProfileSerializer, ChangePasswordSerializer, PasswordResetEmailSerializer, PasswordResetSerializer, GetAllProfilesSerializer, UserEditByIdSerializer, UserDetailSerializer, ProfileEditByIdSerializer
 
 from MemberApp.views import IsAdminUser
 
-from .permissions import IsProfileOwner
+from .permissions import IsProfileOwner, IsMetricsScraper
+from .metrics import request_metrics
 
 from .models import BlacklistedAccessToken
 from AdminApp.models import User
@@ -42,6 +44,8 @@ def get_tokens_for_user(user):
 
 class UserSignUp(APIView):
     renderer_classes = [UserRenderer]
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
 
     def post(self, request, format=None):
         serializer = SignUpSerializer(data=request.data)
@@ -53,6 +57,8 @@ class UserSignUp(APIView):
 
 class UserSignIn(APIView):
     renderer_classes = [UserRenderer]
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
 
     def post(self, request, format=None):
         serializer = SignInSerializer(data=request.data)
@@ -83,8 +89,8 @@ class GetAllProfiles(APIView):
     def get(self, request, format=None):
         current_user_id = request.user.id
         users = User.objects.exclude(id=current_user_id).exclude(password="")
-        serializer = GetAllProfilesSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = GetAllProfilesSerializer()
+        return StreamingJSONResponse(request, users, serializer.to_representation, key=None)
 
 
 class EditProfileById(APIView):
@@ -254,6 +260,9 @@ class UserLogout(APIView):
         
 
 class TokenRefreshView(APIView):
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
+
     def post(self, request):
         access_token = request.data.get('access_token', request.data.get('access'))
         refresh_token = request.data.get('refresh_token', request.data.get('refresh'))
@@ -347,3 +356,10 @@ class TokenRefreshView(APIView):
         hours, remainder = divmod(total_seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
         return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class MetricsView(APIView):
+    permission_classes = [IsMetricsScraper]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(request_metrics.render(), content_type="text/plain; version=0.0.4")
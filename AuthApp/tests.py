@@ -1,3 +1,142 @@
-from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.testing import QueryCountTestCase
+from AdminApp.metrics import request_metrics
+from AdminApp.models import User
+from AuthApp.models import Driver
+from MemberApp.models import VehicleInfo
 
 # Create your tests here.
+
+
+class DriverAuthQueryTests(QueryCountTestCase):
+
+    def test_sign_up(self):
+        data = {"full_name": "New Driver", "email": "new.driver@kana.test", "number": "919876543210"}
+        with self.assertMaxQueries(9):
+            response = self.client.post(reverse("sign_up", args=[1]), data, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_refresh_token(self):
+        refresh = RefreshToken.for_user(self.driver)
+        with self.assertMaxQueries(6):
+            response = self.client.post(reverse("token_refresh"), {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_tokens_not_compressed(self):
+        # BREACH: a compressed token next to reflected input leaks through the size
+        refresh = RefreshToken.for_user(self.driver)
+        response = self.client.post(
+            reverse("token_refresh"), {"refresh": str(refresh)}, format="json", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+        self.authenticate(self.admin)
+        response = self.client.get(reverse("driver-info"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_send_otp(self):
+        with self.assertMaxQueries(3):
+            response = self.client.post(reverse("send_otp"), {"phone": f"91{self.driver.number}"}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_verify_otp(self):
+        data = {"phone": f"91{self.driver.number}", "otp": "123456"}
+        with self.assertMaxQueries(7):
+            response = self.client.post(reverse("verify_otp"), data, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_docs_status(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse("docs_status"), {"phone": self.driver.number})
+        self.assertEqual(response.data["status"], 200)
+
+    def test_update_location(self):
+        data = {
+            "phone": self.driver.number, "latitude": "21.1702", "longitude": "72.8311",
+            "location_status": "ON_LOCATION",
+        }
+        with self.assertMaxQueries(2):
+            response = self.client.post(reverse("update_location"), data, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    async def test_update_location_async(self):
+        # Async middleware and view, queries still counted on the ORM's thread
+        request_metrics.reset()
+        data = {
+            "phone": self.driver.number, "latitude": "21.1702", "longitude": "72.8311",
+            "location_status": "IN_TRANSIT",
+        }
+        response = await self.async_client.post(reverse("update_location"), data, content_type="application/json")
+        self.assertEqual(response.data["status"], 200)
+        self.assertEqual(request_metrics.queries["update_location"], 2)
+        vehicle = await VehicleInfo.objects.aget(alternate_number=self.driver.number)
+        self.assertEqual(vehicle.location_status, "IN_TRANSIT")
+
+    def test_user_profile(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("driver_profile"), {"phone": self.driver.number})
+        self.assertEqual(response.data["status"], 200)
+
+    def test_user_profile_not_modified(self):
+        params = {"phone": self.driver.number}
+        etag = self.get_etag(reverse("driver_profile"), params)
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse("driver_profile"), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Driver.objects.get(number=self.driver.number).save()
+        response = self.client.get(reverse("driver_profile"), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class DriverManagementQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+        # A driver without a vehicle can be deleted
+        self.spare_user = User.objects.create(
+            email="spare@kana.test", name="Spare", number="9777777777", is_active=True)
+        self.spare_driver = Driver.objects.create(
+            user=self.spare_user, name="Spare", email="spare@kana.test", number="9777777777")
+
+    def test_delete_user(self):
+        with self.assertMaxQueries(18):
+            response = self.client.post(f"{reverse('delete_user')}?driver_id={self.spare_user.id}")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_delete_partner(self):
+        with self.assertMaxQueries(19):
+            response = self.client.post(f"{reverse('delete-partner')}?driver_id={self.spare_driver.id}")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_driver_info(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("driver-info"))
+            data = self.get_json(response)
+        self.assertEqual(data["status"], 200)
+        self.assertTrue(data["drivers"])
+        self.assertIn("ETag", response)
+
+    def test_driver_info_not_modified(self):
+        etag = self.get_etag(reverse("driver-info"))
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("driver-info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_driver(self):
+        driver = Driver.objects.get(number=self.driver.number)
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("get-driver-by-id"), {"driver_id": driver.id})
+        self.assertEqual(response.data["status"], 200)
+
+    def test_update_driver(self):
+        driver = Driver.objects.get(number=self.driver.number)
+        with self.assertMaxQueries(4):
+            response = self.client.post(
+                f"{reverse('update-driver')}?driver_id={driver.id}", {"name": "Renamed"}, format="json")
+        self.assertEqual(response.data["status"], 200)
@@ -1,8 +1,5 @@
-import json
-import http.client
+import httpx
 from decouple import config
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderServiceError
 
 
 from MemberApp.models import VehicleInfo
@@ -15,10 +12,15 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+MSG91_URL = "https://control.msg91.com"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+# A slow provider must not hold a request open for ever
+HTTP_TIMEOUT = httpx.Timeout(10.0)
+
 # verify from db and validate phone number
 
 
-def verify_detail(number: str):
+async def verify_detail(number: str):
     try:
         # Ensure number is valid (non-empty and a valid phone number format)
         if not number or (10 > len(number) > 13):
@@ -29,13 +31,14 @@ def verify_detail(number: str):
         logger.info("Processing OTP for trimmed number: %s", trimmed_number)
 
         # Check if the phone number exists in Driver and VehicleInfo models
-        driver_exists = Driver.objects.filter(Q(number=trimmed_number)).first()
-        vehicle_exists = VehicleInfo.objects.filter(
-            Q(alternate_number=trimmed_number)).first()
+        driver_exists = await Driver.objects.filter(Q(number=trimmed_number)).afirst()
+        vehicle_exists = await VehicleInfo.objects.filter(
+            Q(alternate_number=trimmed_number)).afirst()
 
-        # Log successful verification
+        # Log successful verification, by id: __str__ may follow relations, which async code cannot
         logger.info(
-            "Driver exists: %s, Vehicle exists: %s", driver_exists, vehicle_exists
+            "Driver exists: %s, Vehicle exists: %s",
+            driver_exists and driver_exists.pk, vehicle_exists and vehicle_exists.pk
         )
 
         return driver_exists.number if driver_exists else False, (
@@ -49,7 +52,7 @@ def verify_detail(number: str):
 
 
 # Helper function to send otp
-def send_otp_api(number: str):
+async def send_otp_api(number: str):
     template_id = config("TEMP_ID")
     authkey = config("AUTH_KEY")
 
@@ -60,27 +63,23 @@ def send_otp_api(number: str):
         return {"status": "error", "message": error_msg}
 
     try:
-        # Establish HTTPS connection
-        conn = http.client.HTTPSConnection("control.msg91.com")
-
-        # Prepare request payload and headers
-        payload = json.dumps(
-            {"Param1": "value1", "Param2": "value2", "Param3": "value3"}
-        )
-        headers = {"Content-Type": "application/JSON"}
+        # Prepare request payload and query string
+        payload = {"Param1": "value1", "Param2": "value2", "Param3": "value3"}
+        params = {
+            "otp_length": 6,
+            "otp_expiry": 5,
+            "template_id": template_id,
+            "mobile": number.strip(),
+            "authkey": authkey,
+            "realTimeResponse": 1,
+        }
 
         # Send POST request
-        conn.request(
-            "POST",
-            f"/api/v5/otp?otp_length=6&otp_expiry=5&template_id={template_id}&mobile={number.strip()}&authkey={authkey}&realTimeResponse=1",
-            payload,
-            headers,
-        )
+        async with httpx.AsyncClient(base_url=MSG91_URL, timeout=HTTP_TIMEOUT) as client:
+            res = await client.post("/api/v5/otp", params=params, json=payload)
 
-        # Read and parse response
-        res = conn.getresponse()
-        data = res.read().decode("utf-8")
-        response_data = json.loads(data)
+        # Parse response
+        response_data = res.json()
 
         logger.info(f"OTP API Response: {response_data}")
         return response_data
@@ -99,30 +98,20 @@ def send_otp_api(number: str):
             "message": "Failed to send OTP due to an internal error.",
         }
 
-    finally:
-        # Ensure the connection is closed
-        try:
-            conn.close()
-        except Exception as e:
-            logger.warning(f"Error while closing connection: {str(e)}")
-
 
 # Verify otp from url
-def verify_otp(number: str, otp: str):
+async def verify_otp(number: str, otp: str):
     try:
         authkey = config("AUTH_KEY")
 
-        conn = http.client.HTTPSConnection("control.msg91.com")
-
         headers = {"authkey": authkey}
 
-        conn.request(
-            "GET", f"/api/v5/otp/verify?otp={otp}&mobile={number}", headers=headers
-        )
+        async with httpx.AsyncClient(base_url=MSG91_URL, timeout=HTTP_TIMEOUT) as client:
+            res = await client.get(
+                "/api/v5/otp/verify", params={"otp": otp, "mobile": number}, headers=headers
+            )
 
-        res = conn.getresponse()
-        data = res.read().decode("utf-8")
-        response_data = json.loads(data)
+        response_data = res.json()
 
         logger.info(f"verify API Response: {response_data}")
         return response_data
@@ -137,37 +126,19 @@ def verify_otp(number: str, otp: str):
         )
         logger.error(error_msg)
         return {"status": "error", "message": "Failed to verify OTP"}
-    finally:
-        # Ensure the connection is closed
-        try:
-            conn.close()
-        except Exception as e:
-            logger.warning(f"Error while closing connection: {str(e)}")
-
 
-def get_location(lat: str, long: str):
-    # Initialize Nominatim API with a more descriptive user agent
-    geolocator = Nominatim(user_agent="Kana_logic")
 
-    # Latitude & Longitude input
-    Latitude = lat
-    Longitude = long
+async def get_location(lat: str, long: str):
+    # Nominatim asks for a descriptive user agent
+    headers = {"User-Agent": "Kana_logic"}
+    params = {"lat": lat, "lon": long, "format": "json"}
 
     try:
-        location = geolocator.reverse(f"{Latitude}, {Longitude}")
-        return str(location)
-        # address = location.raw['address']
-        # Traverse the data
-        # city = address.get('city', '')
-        # state = address.get('state', '')
-        # country = address.get('country', '')
-        # code = address.get('country_code')
-        # zipcode = address.get('postcode')
-
-        # print('City : ', city)
-        # print('State : ', state)
-        # print('Country : ', country)
-        # print('Zip Code : ', zipcode)
+        async with httpx.AsyncClient(base_url=NOMINATIM_URL, timeout=HTTP_TIMEOUT) as client:
+            res = await client.get("/reverse", params=params, headers=headers)
+        res.raise_for_status()
+        # Same text geopy's Location gives for str(location)
+        return res.json().get("display_name")
     except Exception as e:
         logger.error(f"Error in get_location: {str(e)}")
         return None
@@ -1,15 +1,20 @@
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.db.models import Q, OuterRef, Subquery
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from AuthApp.models import Driver
 from AuthApp.utils import send_otp_api, verify_detail, verify_otp, get_location
 
 from AdminApp.models import User
 from AdminApp.views import get_tokens_for_user
+from AdminApp.async_views import AsyncAPIView
+from AdminApp.conditional import Validators
+from AdminApp.renderers import StreamingJSONResponse
 
 from MemberApp.models import VehicleInfo
 from MemberApp.views import IsAdminUser
@@ -22,6 +27,9 @@ logger = logging.getLogger(__name__)
 
 
 class SignUpAPI(APIView):
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
+
     def post(self, request, auth_type, *args, **kwargs):
         data = request.data
         full_name = data.get("full_name")
@@ -97,8 +105,16 @@ class SignOutAPI(APIView):
         return Response(response)
 
 
-class SendOtpAPI(APIView):
-    def post(self, request):
+class RefreshTokenAPI(TokenRefreshView):
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
+
+
+class SendOtpAPI(AsyncAPIView):
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
+
+    async def post(self, request):
         response = {"status": 400}
         try:
             phone_number = request.data.get("phone")
@@ -107,7 +123,7 @@ class SendOtpAPI(APIView):
                 return Response(response)
 
             # Check if the number exists for a driver or a vehicle
-            driver_exists, vehicle_exists = verify_detail(phone_number)
+            driver_exists, vehicle_exists = await verify_detail(phone_number)
 
             if not driver_exists and not vehicle_exists:
                 return Response(
@@ -117,12 +133,12 @@ class SendOtpAPI(APIView):
             if phone_number == "918625998872" or phone_number == "8625998872":
                 if phone_number.startswith('91') and len(phone_number) == 12:
                     phone_number = phone_number[2:].strip()
-                user_obj = Driver.objects.get(number=phone_number)
-                user = User.objects.filter(email=user_obj.email).first()
+                user_obj = await Driver.objects.aget(number=phone_number)
+                user = await User.objects.filter(email=user_obj.email).afirst()
 
-                vehicle = VehicleInfo.objects.filter(
+                vehicle = await VehicleInfo.objects.filter(
                     alternate_number=user_obj.number
-                ).first()
+                ).afirst()
                 if vehicle:
                     response.update(
                         {
@@ -134,14 +150,14 @@ class SendOtpAPI(APIView):
                     )
 
                 if user:
-                    token = get_tokens_for_user(user=user)
+                    token = await sync_to_async(get_tokens_for_user)(user=user)
                     response.update(
                         {"status": 200, "msg": "OTP verified successfully.", "token": token}
                     )
 
             else:
                 # Send OTP
-                otp_response = send_otp_api(phone_number)
+                otp_response = await send_otp_api(phone_number)
 
                 if otp_response.get("type") == "success":
                     return Response({"status": 200, "msg": "OTP sent successfully."})
@@ -159,8 +175,11 @@ class SendOtpAPI(APIView):
         return Response(response)
 
 
-class VerifyOtpAPI(APIView):
-    def post(self, request):
+class VerifyOtpAPI(AsyncAPIView):
+    # Tokens in the body, see CompressionMiddleware
+    compress_response = False
+
+    async def post(self, request):
         response = {"status": 400}
         try:
             phone_number = request.data.get("phone")
@@ -172,7 +191,7 @@ class VerifyOtpAPI(APIView):
                 )
 
             # Check if the number exists for a driver or a vehicle
-            driver_exists, vehicle_exists = verify_detail(phone_number)
+            driver_exists, vehicle_exists = await verify_detail(phone_number)
 
             if not driver_exists and not vehicle_exists:
                 return Response(
@@ -180,7 +199,7 @@ class VerifyOtpAPI(APIView):
                 )
 
             # Verify OTP
-            verify_otp_status = verify_otp(phone_number, otp)
+            verify_otp_status = await verify_otp(phone_number, otp)
 
             if verify_otp_status.get("type", None) != "success":
                 response["msg"] = "Invalid OTP."
@@ -190,12 +209,12 @@ class VerifyOtpAPI(APIView):
             response.update({"Vehicle": False, "Document": False})
 
             if driver_exists:
-                user_obj = Driver.objects.get(number=driver_exists)
-                user = User.objects.filter(email=user_obj.email).first()
+                user_obj = await Driver.objects.aget(number=driver_exists)
+                user = await User.objects.filter(email=user_obj.email).afirst()
 
-                vehicle = VehicleInfo.objects.filter(
+                vehicle = await VehicleInfo.objects.filter(
                     alternate_number=user_obj.number
-                ).first()
+                ).afirst()
                 if vehicle:
                     response.update(
                         {
@@ -211,7 +230,7 @@ class VerifyOtpAPI(APIView):
                 pass
 
             if user:
-                token = get_tokens_for_user(user=user)
+                token = await sync_to_async(get_tokens_for_user)(user=user)
                 response.update(
                     {"status": 200, "msg": "OTP verified successfully.", "token": token}
                 )
@@ -258,8 +277,8 @@ class ProfileDocsStatusAPI(APIView):
         return Response(response)
 
 
-class UpdateLocationAPI(APIView):
-    def post(self, request):
+class UpdateLocationAPI(AsyncAPIView):
+    async def post(self, request):
         response = {"status": 400}
         try:
             phone_number = request.data.get("phone")
@@ -278,18 +297,18 @@ class UpdateLocationAPI(APIView):
                 )
                 return Response(response)
 
-            vehicle_info = VehicleInfo.objects.filter(
+            vehicle_info = await VehicleInfo.objects.filter(
                 alternate_number=phone_number
-            ).first()
+            ).afirst()
 
             if vehicle_info:
-                get_location_response = get_location(latitude, longitude)
+                get_location_response = await get_location(latitude, longitude)
                 if not get_location_response:
                     return Response({"status": 500, "msg": "Failed to get location."})
 
                 vehicle_info.address = get_location_response
                 vehicle_info.location_status = status
-                vehicle_info.save()
+                await vehicle_info.asave()
 
                 response["status"] = 200
                 response["msg"] = "Location updated successfully."
@@ -315,10 +334,18 @@ class UserProfile(APIView):
             return Response(response)
 
         try:
+            # The profile is the vehicle plus the driver with the same number
+            vehicles = VehicleInfo.objects.filter(alternate_number=user_phone).annotate(
+                driver_updated_at=Subquery(
+                    Driver.objects.filter(number=OuterRef("alternate_number")).values("updated_at")[:1]))
+            validators = Validators.for_queryset(
+                request, vehicles, fields=("updated_at", "driver_updated_at"))
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+
             # Get the associated vehicle info
-            vehicle_info = VehicleInfo.objects.filter(
-                alternate_number=user_phone
-            ).first()
+            vehicle_info = vehicles.select_related("capacity").first()
 
             if vehicle_info:
                 # Get related capacity and driver info
@@ -342,6 +369,7 @@ class UserProfile(APIView):
                         # Uncomment if needed
                         # "vehicle_image": vehicle_info.image.url if vehicle_info.image else None,
                     }
+                    return validators.apply(Response(response))
                 else:
                     response["status"] = 400
                     response["msg"] = "Driver not found."
@@ -402,14 +430,20 @@ class GetAllDriverInfo(APIView):
         response = {"status": 400}
         try:
             driver_info = Driver.objects.all()
-            if not driver_info:
+
+            validators = Validators.for_queryset(request, driver_info)
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+
+            if not validators.count:
                 response["status"] = 400
                 response["message"] = "Driver not found"
             else:
-                serializer = GetAllDriversInfoSerailizer(driver_info, many=True)
-                data = serializer.data
-                response["status"] = 200
-                response["drivers"] = data
+                serializer = GetAllDriversInfoSerailizer()
+                return validators.apply(StreamingJSONResponse(
+                    request, driver_info, serializer.to_representation,
+                    envelope={"status": 200}, key="drivers"))
 
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
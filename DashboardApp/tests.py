@@ -1,3 +1,68 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+
+from django.urls import reverse
+from django.utils import timezone
+
+from config.testing import QueryCountTestCase
+from AdminApp.metrics import request_metrics
+from MemberApp.models import DriverNotification
 
 # Create your tests here.
+
+
+class DashboardEndpointQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+
+    def test_summary(self):
+        with self.assertMaxQueries(12):
+            response = self.client.get(reverse("dashboard-view"))
+        self.assertEqual(response.data["status"], 200)
+
+    def test_summary_for_range(self):
+        with self.assertMaxQueries(12):
+            response = self.client.get(reverse("dashboard-view"), {"from": "2025-01-01", "to": "2025-03-31"})
+        self.assertEqual(response.data["status"], 200)
+
+    def test_summary_cached(self):
+        request_metrics.reset()
+        first = self.client.get(reverse("dashboard-view"))
+        # Only authentication reaches the database
+        with self.assertMaxQueries(2):
+            second = self.client.get(reverse("dashboard-view"))
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(request_metrics.cache_lookups[("dashboard-view", "miss")], 1)
+        self.assertEqual(request_metrics.cache_lookups[("dashboard-view", "hit")], 1)
+
+    def test_summary_cached_per_day(self):
+        request_metrics.reset()
+        self.client.get(reverse("dashboard-view"))
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch("AdminApp.caching.timezone.localdate", return_value=tomorrow):
+            response = self.client.get(reverse("dashboard-view"))
+        self.assertEqual(response.data["status"], 200)
+        self.assertEqual(request_metrics.cache_lookups[("dashboard-view", "miss")], 2)
+
+    def test_summary_invalidated_by_writes(self):
+        request_metrics.reset()
+        self.client.get(reverse("dashboard-view"))
+        with self.captureOnCommitCallbacks(execute=True):
+            DriverNotification.objects.first().save()
+        with self.assertMaxQueries(12):
+            response = self.client.get(reverse("dashboard-view"))
+        self.assertEqual(response.data["status"], 200)
+        self.assertEqual(request_metrics.cache_lookups[("dashboard-view", "miss")], 2)
+
+    def test_summary_with_cache_down(self):
+        outage = ConnectionError("cache is down")
+        with mock.patch("AdminApp.caching.cache") as cache:
+            for method in ("get", "get_many", "set", "add", "incr"):
+                getattr(cache, method).side_effect = outage
+            response = self.client.get(reverse("dashboard-view"))
+            self.assertEqual(response.data["status"], 200)
+            # A committed write is not failed by the tag bump
+            with self.captureOnCommitCallbacks(execute=True):
+                DriverNotification.objects.first().save()
@@ -2,7 +2,9 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
-from MemberApp.models import DriverNotification, VehicleInfo
+from AdminApp.routers import ReplicaReadMixin
+from AdminApp.caching import cache_response, daily_shared_key
+from MemberApp.models import DriverNotification, VehicleInfo, Load
 from AuthApp.models import Driver
 
 from django.utils import timezone
@@ -19,9 +21,13 @@ logger = logging.getLogger(__name__)
 
 
 
-class DashboardAPIView(APIView):
+class DashboardAPIView(ReplicaReadMixin, APIView):
     permission_classes = (IsAuthenticated,)
+    query_budget = 16
 
+    # The same totals for every user, recomputed when their rows change or
+    # the day turns over, without from/to the range ends today
+    @cache_response(key_func=daily_shared_key, tags=("notifications", "vehicles", "loads", "drivers"))
     def get(self, request, *args, **kwargs):
         response = {"status": 400}
         try:
@@ -96,16 +102,30 @@ class DashboardAPIView(APIView):
                 "value": ns["count"]
             } for ns in notification_statuses)
 
+            # Load categories (claimed vs still open)
+            loads = Load.objects.filter(
+                notifications__date__gte=start_date,
+                notifications__date__lte=end_date,
+            ).aggregate(
+                total=Count("id", distinct=True),
+                claimed=Count("claim", distinct=True),
+            )
+            categories.extend([
+                {"name": "Claimed Loads", "value": loads["claimed"]},
+                {"name": "Open Loads", "value": loads["total"] - loads["claimed"]},
+            ])
+
             # 3. Get successfully read notifications data
             read_notifications = DriverNotification.objects.filter(
                 date__gte=start_date,
                 date__lte=end_date,
                 is_read=True,
                 is_accepted=True,
-            ).order_by("-created_at")
+            ).select_related("vehicle", "created_by").order_by("-created_at")
 
             notifications_data = [{
                 "id": str(notification.id),
+                "load_id": notification.load_id,
                 "vehicle_id": str(notification.vehicle.id),
                 "vehicle_model": str(notification.vehicle.model),
                 "driver_number": str(notification.vehicle.alternate_number),
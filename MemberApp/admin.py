@@ -1,5 +1,5 @@
 from django.contrib import admin
-from MemberApp.models import VehicleInfo, VehicleImage, DriverNotification, UserFCMDevice, Display
+from MemberApp.models import VehicleInfo, VehicleImage, DriverNotification, UserFCMDevice, Display, Load
 
 # Register your models here.
 
@@ -9,6 +9,8 @@ admin.site.register(VehicleImage)
 
 admin.site.register(DriverNotification)
 
+admin.site.register(Load)
+
 admin.site.register(UserFCMDevice)
 
 admin.site.register(Display)
\ No newline at end of file
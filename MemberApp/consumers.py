@@ -1,13 +1,273 @@
 import json
+import uuid
+from datetime import timedelta
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.db.models import Q
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from MemberApp.models import VehicleInfo, InboxEvent
+from services.inbox_service import inbox_group
+from services.vehicle_broadcast import VEHICLEINFO_GROUP, vehicle_group, vehicle_route, get_bootstrap
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest backlog replayed on reconnect, beyond that the app refetches over HTTP
+INBOX_REPLAY_LIMIT = 500
+
+# Vehicle attributes admin screens can filter the vehicleinfo stream on
+VEHICLE_FILTERS = ("status", "location_status", "vehicle_type")
+# Every subscribed vehicle is a channel group to join, screens wanting more
+# follow the whole fleet with attribute filters
+MAX_SUBSCRIBED_VEHICLES = 100
+
 class VehicleInfoConsumer(AsyncWebsocketConsumer):
+    """
+    Streams vehicle changes to admin screens.
+
+    Clients narrow the stream with
+    {"action": "subscribe", "filters": {"vehicle_ids": [...], "status": [...],
+    "location_status": [...], "vehicle_type": [...], "region": "..."}}.
+    Vehicle ids are routed through per-vehicle groups, the other filters are
+    matched against the routing attributes sent with each event. An empty
+    filter set subscribes to the whole fleet again.
+
+    On connect (and after every subscribe) the client gets a cached snapshot
+    {"event": "snapshot", "version": N, "vehicles": [...]}, then every change
+    with seq > N. Clients reconnect with ?since=<last seq> or send
+    {"action": "resume", "since": N}; when that is too far behind they get a
+    fresh snapshot instead of the missed events.
+    """
+
     async def connect(self):
-        await self.channel_layer.group_add("vehicleinfo_updates", self.channel_name)
+        self.filters = {}
+        self.last_seq = 0
+        self.subscribed_groups = [VEHICLEINFO_GROUP]
+        # Join before bootstrapping so nothing published in between is lost
+        await self.channel_layer.group_add(VEHICLEINFO_GROUP, self.channel_name)
         await self.accept()
 
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        try:
+            since = int(since[0]) if since else None
+        except ValueError:
+            since = None
+        await self.bootstrap(since)
+
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("vehicleinfo_updates", self.channel_name)
+        for group in self.subscribed_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "{}")
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+
+        if message.get("action") == "subscribe":
+            try:
+                filters = self.parse_filters(message.get("filters") or {})
+            except ValueError as e:
+                await self.send(text_data=json.dumps({"event": "error", "msg": str(e)}))
+                return
+            try:
+                await self.subscribe(filters)
+                await self.bootstrap()
+            except Exception as e:
+                error = f"\nType: {type(e).__name__}"
+                error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+                error += f"\nLine: {e.__traceback__.tb_lineno}"
+                error += f"\nMessage: {str(e)}"
+                logger.error(error)
+                await self.send(text_data=json.dumps({"event": "error", "msg": "Subscription failed, try again."}))
+        elif message.get("action") == "resume":
+            try:
+                await self.bootstrap(int(message.get("since", 0)))
+            except (TypeError, ValueError):
+                await self.bootstrap()
+
+    async def bootstrap(self, since=None):
+        snapshot, events = await get_bootstrap(since)
+        if snapshot is not None:
+            self.last_seq = snapshot["version"]
+            await self.send(text_data=json.dumps({
+                "event": "snapshot",
+                "version": snapshot["version"],
+                "vehicles": [
+                    vehicle for vehicle in snapshot["vehicles"]
+                    if self.wants_vehicle(vehicle["id"]) and self.matches(vehicle_route(vehicle))
+                ],
+            }))
+        elif since is not None:
+            self.last_seq = since
+
+        for event in events:
+            if event["data"]["seq"] > self.last_seq and self.wants_vehicle(event["data"]["id"]):
+                await self.send_change(event)
+            self.last_seq = max(self.last_seq, event["data"]["seq"])
+
+    def parse_filters(self, raw):
+        """The filters of a subscribe message, ValueError with the message for the client if invalid."""
+        if not isinstance(raw, dict):
+            raise ValueError("Invalid filters.")
+        filters = {}
+        for key in ("vehicle_ids",) + VEHICLE_FILTERS:
+            value = raw.get(key)
+            if value:
+                if not isinstance(value, (str, list)):
+                    raise ValueError("Invalid filters.")
+                values = [value] if isinstance(value, str) else value
+                filters[key] = {str(item) for item in values}
+
+        vehicle_ids = filters.get("vehicle_ids", ())
+        if len(vehicle_ids) > MAX_SUBSCRIBED_VEHICLES:
+            raise ValueError(f"At most {MAX_SUBSCRIBED_VEHICLES} vehicle ids can be subscribed to.")
+        try:
+            # Group names are built from the ids, only well-formed ones get there
+            vehicle_ids = {str(uuid.UUID(vehicle_id)) for vehicle_id in vehicle_ids}
+        except ValueError:
+            raise ValueError("Invalid vehicle id.")
+        if vehicle_ids:
+            filters["vehicle_ids"] = vehicle_ids
+
+        region = raw.get("region")
+        if region:
+            filters["region"] = str(region).strip().lower()
+        return filters
+
+    async def subscribe(self, filters):
+        groups = [vehicle_group(vehicle_id) for vehicle_id in filters.get("vehicle_ids", ())] \
+            or [VEHICLEINFO_GROUP]
+
+        for group in set(self.subscribed_groups) - set(groups):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in set(groups) - set(self.subscribed_groups):
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        self.filters = filters
+        self.subscribed_groups = groups
+        await self.send(text_data=json.dumps({
+            "event": "subscribed",
+            "filters": {
+                key: sorted(value) if isinstance(value, set) else value
+                for key, value in filters.items()
+            },
+        }))
+
+    def wants_vehicle(self, vehicle_id):
+        return "vehicle_ids" not in self.filters or str(vehicle_id) in self.filters["vehicle_ids"]
+
+    def matches(self, route):
+        if route is None:
+            return False
+        for key in VEHICLE_FILTERS:
+            if key in self.filters and route[key] not in self.filters[key]:
+                return False
+        if "region" in self.filters and self.filters["region"] not in (route["address"] or "").lower():
+            return False
+        return True
 
     async def send_vehicleinfo(self, event):
+        seq = event["data"].get("seq")
+        if seq is not None:
+            # Already sent while bootstrapping
+            if seq <= self.last_seq:
+                return
+            # Missed something, the backlog (or a snapshot) covers this event too.
+            # Per-vehicle subscriptions only see their own vehicles' sequence numbers.
+            if seq > self.last_seq + 1 and "vehicle_ids" not in self.filters:
+                await self.bootstrap(self.last_seq)
+                return
+            self.last_seq = seq
+        await self.send_change(event)
+
+    async def send_change(self, event):
+        route = event.get("route")
+        # Vehicles leaving the filter are still sent so the screen can drop them
+        if route and not (self.matches(route["current"]) or self.matches(route["previous"])):
+            return
         await self.send(text_data=json.dumps(event["data"]))
+
+
+class DriverInboxConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes new, claimed and withdrawn notifications to a driver's vehicles.
+
+    Every event carries its seq. Clients reconnect with ?since=<last seq> or
+    send {"action": "resume", "since": N}. Seqs are taken on insert but
+    transactions may commit out of order, so the replay also repeats the
+    events of the INBOX_REPLAY_OVERLAP_SECONDS before seq N. Clients drop the
+    seqs they already have. A resume from a pruned seq gets a resync event.
+    """
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.groups_joined = [inbox_group(vehicle_id) for vehicle_id in await self.get_vehicle_ids(user)]
+        if not self.groups_joined:
+            await self.close(code=4404)
+            return
+
+        # Join before replaying so nothing published in between is lost
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        since = query.get("since", [""])[0]
+        if since.isdigit():
+            await self.replay(int(since))
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, "groups_joined", []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "{}")
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get("action") == "resume" and str(message.get("since", "")).isdigit():
+            await self.replay(int(message["since"]))
+
+    async def inbox_event(self, event):
+        await self.send(text_data=json.dumps(event["message"]))
+
+    async def replay(self, since):
+        events = await self.get_events_since(since)
+        if events is None or len(events) > INBOX_REPLAY_LIMIT:
+            await self.send(text_data=json.dumps({"event": "resync"}))
+            return
+        for message in events:
+            await self.send(text_data=json.dumps(message))
+
+    @database_sync_to_async
+    def get_vehicle_ids(self, user):
+        if not user.number:
+            return []
+        return list(VehicleInfo.objects.filter(
+            alternate_number=user.number).values_list("id", flat=True))
+
+    @database_sync_to_async
+    def get_events_since(self, since):
+        """The events to replay, None when event `since` has been pruned."""
+        vehicle_ids = [group.removeprefix("inbox_vehicle_") for group in self.groups_joined]
+        events = InboxEvent.objects.filter(vehicle_id__in=vehicle_ids)
+        if since:
+            anchor = InboxEvent.objects.filter(id=since).values_list("created_at", flat=True).first()
+            if anchor is None:
+                return None
+            overlap = anchor - timedelta(seconds=settings.INBOX_REPLAY_OVERLAP_SECONDS)
+            events = events.filter(Q(id__gt=since) | Q(created_at__gte=overlap))
+        events = events.order_by("id")[:INBOX_REPLAY_LIMIT + 1]
+        return [event.as_message() for event in events]
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from MemberApp.models import VehicleImageUpload
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads and .part files older than CHUNKED_UPLOAD_EXPIRY_HOURS."
+
+    def handle(self, *args, **options):
+        try:
+            deleted = VehicleImageUpload.prune_stale()
+        except Exception as e:
+            error = f"\nType: {type(e).__name__}"
+            error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+            error += f"\nLine: {e.__traceback__.tb_lineno}"
+            error += f"\nMessage: {str(e)}"
+            logger.error(error)
+            deleted = 0
+        self.stdout.write(f"Deleted {deleted} stale upload(s)")
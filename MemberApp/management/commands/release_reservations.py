@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from MemberApp.models import DriverNotification
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Release driver notification reservations that have expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep sweeping every --interval seconds instead of running once (e.g. as a worker process).")
+        parser.add_argument(
+            "--interval", type=int, default=settings.RESERVATION_SWEEP_INTERVAL,
+            help="Seconds between sweeps with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = self.sweep()
+            if options["verbosity"] > 1 or not options["loop"]:
+                self.stdout.write(f"Released {released} expired reservation(s)")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
+            # A long running worker must not hold on to a dead connection
+            close_old_connections()
+
+    def sweep(self):
+        try:
+            return DriverNotification.release_expired_reservations()
+        except Exception as e:
+            error = f"\nType: {type(e).__name__}"
+            error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+            error += f"\nLine: {e.__traceback__.tb_lineno}"
+            error += f"\nMessage: {str(e)}"
+            logger.error(error)
+            return 0
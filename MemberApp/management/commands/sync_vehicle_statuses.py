@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from MemberApp.models import VehicleInfo
+from services.vehicle_broadcast import broadcaster, broadcast_status_changes
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recompute vehicle statuses from their image counts and broadcast the changes."
+
+    def handle(self, *args, **options):
+        try:
+            statuses = VehicleInfo.sync_statuses()
+            broadcast_status_changes(statuses)
+            # The broadcaster's timer thread dies with the command, send now
+            broadcaster.flush()
+        except Exception as e:
+            error = f"\nType: {type(e).__name__}"
+            error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+            error += f"\nLine: {e.__traceback__.tb_lineno}"
+            error += f"\nMessage: {str(e)}"
+            logger.error(error)
+            statuses = {}
+        self.stdout.write(f"Updated {len(statuses)} vehicle status(es)")
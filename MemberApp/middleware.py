@@ -0,0 +1,34 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+
+from AdminApp.models import BlacklistedAccessToken
+
+User = get_user_model()
+
+
+@database_sync_to_async
+def get_user_for_token(token):
+    try:
+        access_token = AccessToken(token)
+    except Exception:
+        return None
+    if BlacklistedAccessToken.objects.filter(jti=access_token["jti"]).exists():
+        return None
+    return User.objects.filter(id=access_token["user_id"], is_active=True).first()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Authenticate websocket connections from a `?token=<access token>` query string."""
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get("query_string", b"").decode())
+        token = query.get("token", [None])[0]
+        if token:
+            user = await get_user_for_token(token)
+            if user is not None:
+                scope["user"] = user
+        return await super().__call__(scope, receive, send)
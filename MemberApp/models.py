@@ -1,9 +1,14 @@
+import os
 import uuid
-from django.db import models
+import hashlib
+from django.db import models, transaction
+from django.utils import timezone as dj_timezone
 from django.core.validators import MinValueValidator, RegexValidator
 from django.conf import settings
-from datetime import timedelta, timezone
+from django.core.cache import cache
+from datetime import timedelta
 
+from AdminApp.caching import invalidate_tags
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
@@ -19,6 +24,8 @@ class VehicleCapacity(models.Model):
         unique=True,
     )
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     @property
     def description(self):
         return f"{self.capacity} T.N"
@@ -89,8 +96,11 @@ class VehicleInfo(models.Model):
         )],
     )
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     def update_status(self, save_instance=True):
         self.refresh_from_db()
+        previous_status = self.status
         image_count = self.images.count()
 
         if image_count == 0:
@@ -100,8 +110,41 @@ class VehicleInfo(models.Model):
             if image_count >= 1:
                 self.status = self.StatusChoices.IN_PROGRESS
 
-        if save_instance:
-            self.save(update_fields=["status"])
+        if save_instance and self.status != previous_status:
+            self.save(update_fields=["status", "updated_at"])
+
+    @classmethod
+    def sync_statuses(cls, queryset=None):
+        """
+        Set-based version of update_status for many vehicles at once.
+        Returns {vehicle_id: (previous_status, new_status)} for the rows that changed.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        queryset = queryset.annotate(image_count=models.Count('images'))
+
+        to_incomplete = dict(queryset.filter(image_count=0).exclude(
+            status=cls.StatusChoices.IN_COMPLETE).values_list('id', 'status'))
+        to_in_progress = dict(queryset.filter(
+            image_count__gte=1, status=cls.StatusChoices.IN_COMPLETE).values_list('id', 'status'))
+
+        if to_incomplete:
+            cls.objects.filter(id__in=to_incomplete).update(
+                status=cls.StatusChoices.IN_COMPLETE, updated_at=dj_timezone.now())
+        if to_in_progress:
+            cls.objects.filter(id__in=to_in_progress).update(
+                status=cls.StatusChoices.IN_PROGRESS, updated_at=dj_timezone.now())
+        if to_incomplete or to_in_progress:
+            invalidate_tags("vehicles")
+
+        changed = {
+            vehicle_id: (status, cls.StatusChoices.IN_COMPLETE)
+            for vehicle_id, status in to_incomplete.items()
+        }
+        changed.update({
+            vehicle_id: (status, cls.StatusChoices.IN_PROGRESS)
+            for vehicle_id, status in to_in_progress.items()
+        })
+        return changed
 
     class Meta:
         verbose_name = "Vehicle"
@@ -165,6 +208,177 @@ class VehicleImage(models.Model):
         pass
 
 
+def get_chunked_upload_path(upload_id):
+    """Generate the temporary path that chunks of an upload are written to."""
+    return os.path.join(settings.MEDIA_ROOT, "uploads", f"{upload_id}.part")
+
+
+class VehicleImageUpload(models.Model):
+    """Resumable upload session for a single vehicle document."""
+
+    class StatusChoices(models.TextChoices):
+        UPLOADING = "UPLOADING", "Uploading"
+        COMPLETED = "COMPLETED", "Completed"
+
+    # UUID as primary key for the upload session
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    vehicle = models.ForeignKey(
+        'VehicleInfo',
+        related_name='uploads',
+        on_delete=models.CASCADE
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="vehicle_image_uploads"
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    description = models.CharField(max_length=255, blank=True, null=True)
+    total_size = models.PositiveIntegerField()
+    # Hex encoded SHA-256 of the complete file, verified on commit
+    checksum = models.CharField(max_length=64)
+    # Number of bytes received so far, clients resume from here
+    offset = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.UPLOADING
+    )
+    image = models.ForeignKey(
+        'VehicleImage',
+        related_name='+',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Vehicle Image Upload'
+        verbose_name_plural = 'Vehicle Image Uploads'
+
+    def __str__(self):
+        return f"Upload ({self.id}) {self.offset}/{self.total_size}"
+
+    @property
+    def temp_path(self):
+        return get_chunked_upload_path(self.id)
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.total_size
+
+    # write_chunk's answer when another request moved the offset first
+    OFFSET_CONFLICT = -1
+
+    def write_chunk(self, stream, offset, chunk_size=64 * 1024):
+        """
+        Write the request stream to the temporary file starting at `offset`.
+        Returns the number of bytes written, None if the chunk would run past
+        the declared total size, or OFFSET_CONFLICT if the stored offset is no
+        longer `offset`.
+        """
+        remaining = self.total_size - offset
+        os.makedirs(os.path.dirname(self.temp_path), exist_ok=True)
+
+        with transaction.atomic():
+            # The row stays locked while the chunk is written, a second PUT
+            # at the same offset waits here and then finds the offset moved
+            locked = VehicleImageUpload.objects.select_for_update().filter(
+                id=self.id, offset=offset, status=self.StatusChoices.UPLOADING).exists()
+            if not locked:
+                return self.OFFSET_CONFLICT
+
+            mode = "r+b" if os.path.exists(self.temp_path) else "wb"
+            written = 0
+            with open(self.temp_path, mode) as part:
+                part.seek(offset)
+                while True:
+                    data = stream.read(chunk_size)
+                    if not data:
+                        break
+                    written += len(data)
+                    if written > remaining:
+                        return None
+                    part.write(data)
+                part.truncate(offset + written)
+
+            # updated_at tells the stale upload sweep the session is alive
+            updated = VehicleImageUpload.objects.filter(id=self.id, offset=offset).update(
+                offset=offset + written, updated_at=dj_timezone.now()
+            )
+            if not updated:
+                return self.OFFSET_CONFLICT
+        self.offset = offset + written
+        return written
+
+    def compute_checksum(self, chunk_size=64 * 1024):
+        sha256 = hashlib.sha256()
+        with open(self.temp_path, "rb") as part:
+            for data in iter(lambda: part.read(chunk_size), b""):
+                sha256.update(data)
+        return sha256.hexdigest()
+
+    def discard(self):
+        """Remove the temporary file and rewind the session."""
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.offset = 0
+        self.save(update_fields=["offset", "updated_at"])
+
+    @classmethod
+    def prune_stale(cls, now=None):
+        """
+        Delete the uploads nobody wrote to for CHUNKED_UPLOAD_EXPIRY_HOURS,
+        and every .part file as old, whether its session is left or not.
+        Returns the number of deleted sessions.
+        """
+        now = now or dj_timezone.now()
+        cutoff = now - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS)
+        deleted, _ = cls.objects.filter(
+            status=cls.StatusChoices.UPLOADING, updated_at__lt=cutoff).delete()
+
+        # A live session writes its file, an old one is never needed again
+        directory = os.path.dirname(get_chunked_upload_path(""))
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if name.endswith(".part") and os.path.getmtime(path) < cutoff.timestamp():
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+
+class Load(models.Model):
+    """A load broadcast to one or more vehicles in a single request."""
+
+    source = models.CharField(max_length=255, blank=True)
+    destination = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="created_loads"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Load'
+        verbose_name_plural = 'Loads'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Load ({self.id}) {self.source} to {self.destination}"
+
+
 class DriverNotification(models.Model):
     """Model to store driver notifications."""
 
@@ -221,42 +435,92 @@ class DriverNotification(models.Model):
         on_delete=models.SET_NULL,
     )
     reservation_time = models.DateTimeField(null=True, blank=True)
-    # 15 minutes reservation timeout
-    RESERVATION_TIMEOUT = timedelta(minutes=15)
+    # Stored so queries and the sweeper can tell live reservations apart
+    reserved_until = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Shared by every notification sent for the same load in one broadcast
+    load = models.ForeignKey(
+        Load,
+        related_name='notifications',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    RESERVATION_TIMEOUT = timedelta(minutes=settings.NOTIFICATION_RESERVATION_MINUTES)
+
+    class Reserved(Exception):
+        """Another user holds a live reservation on the notification."""
 
     @property
     def is_reserved(self):
         """Check if the notification is reserved."""
-        return self.reserved_by is not None and (
-            self.reservation_time + self.RESERVATION_TIMEOUT > timezone.now()
+        return self.reserved_by_id is not None and (
+            self.reserved_until is not None and self.reserved_until > dj_timezone.now()
+        )
+
+    @staticmethod
+    def available_to(user, now=None):
+        """Open notifications nobody else holds a live reservation on."""
+        now = now or dj_timezone.now()
+        return models.Q(location_read_lock=False) & (
+            models.Q(reserved_until__isnull=True) |
+            models.Q(reserved_until__lte=now) |
+            models.Q(reserved_by=user)
         )
 
     def reserve(self, user):
-        """Reserve the notification for a user."""
-        if not self.is_reserved or self.reserved_by == user:
-            self.is_read = True
+        """
+        Hold an open notification for `user` until reserved_until. One
+        conditional UPDATE, so two drivers cannot both get the hold.
+        """
+        now = dj_timezone.now()
+        until = now + self.RESERVATION_TIMEOUT
+        reserved = DriverNotification.objects.filter(
+            self.available_to(user, now), pk=self.pk,
+        ).update(reserved_by=user, reservation_time=now, reserved_until=until, updated_at=now)
+        if reserved:
             self.reserved_by = user
-            self.reservation_time = timezone.now()
-            self.save()
-            return True
-        return False
-
-    def unreserve(self):
-        """Unreserve the notification."""
-        if self.is_reserved:
+            self.reservation_time = now
+            self.reserved_until = until
+        return bool(reserved)
+
+    def unreserve(self, user):
+        """Give up the user's hold, a claimed notification stays with its winner."""
+        released = DriverNotification.objects.filter(
+            pk=self.pk, reserved_by=user, location_read_lock=False,
+        ).update(reserved_by=None, reservation_time=None, reserved_until=None, updated_at=dj_timezone.now())
+        if released:
             self.reserved_by = None
             self.reservation_time = None
-            self.save()
-            return True
-        return False
+            self.reserved_until = None
+        return bool(released)
+
+    @classmethod
+    def release_expired_reservations(cls, now=None):
+        """
+        Unreserve every open notification whose hold ran out, in one UPDATE.
+        Claimed notifications keep their winner. Returns the number released.
+        """
+        now = now or dj_timezone.now()
+        # Rows without reserved_until are not reserved either, see is_reserved
+        released = cls.objects.filter(
+            reserved_by__isnull=False, location_read_lock=False,
+        ).exclude(reserved_until__gt=now).update(
+            reserved_by=None,
+            reservation_time=None,
+            reserved_until=None,
+            updated_at=now,
+        )
+        if released:
+            invalidate_tags("notifications")
+        return released
 
     class Meta:
         verbose_name = 'Driver Notification'
         verbose_name_plural = 'Driver Notifications'
         constraints = [
             models.UniqueConstraint(
-                fields=['source', 'destination', 'created_at'],
-                name='unique_read_per_location',
+                fields=['load'],
+                name='unique_read_per_load',
                 condition=models.Q(location_read_lock=True)
             )
         ]
@@ -264,6 +528,30 @@ class DriverNotification(models.Model):
         indexes = [
             models.Index(fields=['vehicle', 'is_read']),
             models.Index(fields=['date']),
+            # Driver inbox: loads still open to everyone
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='notif_unlocked_idx',
+                condition=models.Q(location_read_lock=False),
+            ),
+            # Driver inbox: loads the driver has already read
+            models.Index(
+                fields=['reserved_by', '-created_at', '-id'],
+                name='notif_read_reserved_idx',
+                condition=models.Q(is_read=True),
+            ),
+            # Driver inbox: changes since the client's last sync
+            models.Index(fields=['updated_at'], name='notif_updated_idx'),
+            # Admin list filtered by state and load date
+            models.Index(
+                fields=['is_read', 'is_accepted', 'date'],
+                name='notif_state_date_idx',
+            ),
+            # Admin list filtered by creator, newest first
+            models.Index(
+                fields=['created_by', '-created_at', '-id'],
+                name='notif_creator_idx',
+            ),
         ]
 
     def __str__(self):
@@ -271,10 +559,9 @@ class DriverNotification(models.Model):
         return f"Notification ({self.id}) for {self.vehicle}"
 
     def clean(self):
-        if self.is_read and not self.pk:  # New instance being marked read
+        if self.is_read and not self.pk and self.load_id:  # New instance being marked read
             if DriverNotification.objects.filter(
-                source=self.source,
-                destination=self.destination,
+                load_id=self.load_id,
                 location_read_lock=True
             ).exists():
                 raise ValueError(
@@ -287,6 +574,172 @@ class DriverNotification(models.Model):
         super().save(*args, **kwargs)
 
 
+class NotificationClaim(models.Model):
+    """
+    One row per claimed load. The primary key is the load, so the INSERT
+    itself decides the winner and no rows have to be locked.
+    """
+
+    load = models.OneToOneField(
+        Load,
+        primary_key=True,
+        related_name='claim',
+        on_delete=models.CASCADE
+    )
+    notification = models.ForeignKey(
+        DriverNotification,
+        related_name='claims',
+        on_delete=models.CASCADE
+    )
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='notification_claims',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    claimed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Notification Claim'
+        verbose_name_plural = 'Notification Claims'
+
+    def __str__(self):
+        return f"Claim ({self.load_id}) by {self.claimed_by}"
+
+    @staticmethod
+    def get_load_id(notification):
+        """Notifications created before loads existed get a load of their own."""
+        if notification.load_id is None:
+            load = Load.objects.create(
+                source=notification.source,
+                destination=notification.destination,
+                created_by_id=notification.created_by_id,
+            )
+            DriverNotification.objects.filter(
+                pk=notification.pk, load__isnull=True
+            ).update(load=load)
+            notification.load_id = DriverNotification.objects.filter(
+                pk=notification.pk).values_list('load_id', flat=True).get()
+        return notification.load_id
+
+    @classmethod
+    def claim(cls, notification, user):
+        """
+        Try to claim the notification's load for `user`. Returns (won, new):
+        won is True if this notification is the user's claim on the load, new
+        is False when it already was (a repeated request). Raises
+        DriverNotification.Reserved, with the claim rolled back, when another
+        user holds the notification.
+        """
+        load_id = cls.get_load_id(notification)
+
+        with transaction.atomic():
+            # INSERT ... ON CONFLICT DO NOTHING, the first insert wins
+            cls.objects.bulk_create(
+                [cls(load_id=load_id, notification=notification, claimed_by=user)],
+                ignore_conflicts=True,
+            )
+            won = cls.objects.filter(
+                load_id=load_id, notification=notification, claimed_by=user).exists()
+
+            new = False
+            if won:
+                # The winner keeps the notification, a hold no longer expires.
+                # The hold is checked by the UPDATE itself, a reservation placed
+                # after the caller loaded the notification still counts
+                now = dj_timezone.now()
+                new = DriverNotification.objects.filter(
+                    DriverNotification.available_to(user, now), pk=notification.pk,
+                ).update(
+                    is_read=True,
+                    is_accepted=True,
+                    location_read_lock=True,
+                    reserved_by=user,
+                    reservation_time=now,
+                    reserved_until=None,
+                    updated_at=now,
+                )
+                if not new and not DriverNotification.objects.filter(
+                        pk=notification.pk, location_read_lock=True).exists():
+                    # Not a repeated claim: somebody else holds it, undo the insert
+                    raise DriverNotification.Reserved()
+                # Every other notification of the load is now taken
+                DriverNotification.objects.filter(
+                    load_id=load_id,
+                    is_read=False,
+                ).exclude(pk=notification.pk).update(
+                    is_accepted=True,
+                    updated_at=dj_timezone.now(),
+                )
+            else:
+                DriverNotification.objects.filter(
+                    pk=notification.pk, is_read=False
+                ).update(is_accepted=True, updated_at=dj_timezone.now())
+            invalidate_tags("notifications")
+
+        return won, bool(new)
+
+    @classmethod
+    def release(cls, notification):
+        """Give the load back so it can be claimed again."""
+        return cls.objects.filter(notification=notification).delete()
+
+
+class InboxEvent(models.Model):
+    """
+    Append-only log of driver inbox events. The auto-increment id is the
+    sequence number clients resume from after a reconnect.
+    """
+
+    class EventChoices(models.TextChoices):
+        CREATED = "notification.created", "Created"
+        CLAIMED = "notification.claimed", "Claimed"
+        WITHDRAWN = "notification.withdrawn", "Withdrawn"
+
+    vehicle = models.ForeignKey(
+        'VehicleInfo',
+        related_name='inbox_events',
+        on_delete=models.CASCADE
+    )
+    event = models.CharField(max_length=30, choices=EventChoices.choices)
+    # Plain UUID so withdrawn events survive the notification being deleted
+    notification_id = models.UUIDField()
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Inbox Event'
+        verbose_name_plural = 'Inbox Events'
+        indexes = [
+            models.Index(fields=['vehicle', 'id']),
+            models.Index(fields=['vehicle', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event} #{self.id} for {self.vehicle_id}"
+
+    @classmethod
+    def prune(cls, now=None):
+        """
+        Delete the events older than INBOX_EVENT_RETENTION_DAYS. Sockets
+        resuming from before that get a resync. Returns the number deleted.
+        """
+        now = now or dj_timezone.now()
+        cutoff = now - timedelta(days=settings.INBOX_EVENT_RETENTION_DAYS)
+        deleted, _ = cls.objects.filter(created_at__lt=cutoff).delete()
+        return deleted
+
+    def as_message(self):
+        return {
+            "seq": self.id,
+            "event": self.event,
+            "notification_id": str(self.notification_id),
+            "data": self.payload,
+        }
+
+
 class UserFCMDevice(models.Model):
     """Model to store user's FCM device tokens"""
     
@@ -342,15 +795,91 @@ class Display(models.Model):
     def __str__(self):
         return f"{self.user.username}'s display ({self.items})"
 
+    # Cached effective items are kept for a day, version bumps retire them sooner
+    PERMISSIONS_TIMEOUT = 60 * 60 * 24
+
+    @staticmethod
+    def permissions_version_key(scope):
+        return f"display:version:{scope}"
+
+    @classmethod
+    def invalidate_permissions(cls, user_id=None, role=None):
+        """
+        Bump the version stamp so cached items of the user (or whole role) are
+        ignored, once the current transaction commits. Bumping earlier would
+        let a concurrent request cache the old rows under the new version.
+        """
+        scopes = []
+        if user_id is not None:
+            scopes.append(f"user:{user_id}")
+        if role is not None:
+            scopes.append(f"role:{role}")
+
+        def bump():
+            for scope in scopes:
+                key = cls.permissions_version_key(scope)
+                cache.add(key, 1, timeout=None)
+                cache.incr(key)
+        transaction.on_commit(bump)
+
+    @classmethod
+    def role_items(cls, role):
+        config = RolePermissionConfig.objects.filter(role=role).values_list('items', flat=True).first()
+        return set(config or [])
+
+    @classmethod
+    def effective_items(cls, user: User):
+        """
+        Role defaults plus the user's own Display rows, cached per user.
+        Display rows only add items: deleting a user's row does not take away
+        an item of the role, change the role config (sync_role_items) for that.
+        """
+        version_keys = [
+            cls.permissions_version_key(f"role:{user.role}"),
+            cls.permissions_version_key(f"user:{user.pk}"),
+        ]
+        versions = cache.get_many(version_keys)
+        key = "display:items:{}:{}:{}".format(
+            user.pk, versions.get(version_keys[0], 0), versions.get(version_keys[1], 0))
+
+        items = cache.get(key)
+        if items is None:
+            items = cls.role_items(user.role)
+            items.update(cls.objects.filter(user=user).values_list('items', flat=True))
+            items = sorted(items)
+            cache.set(key, items, timeout=cls.PERMISSIONS_TIMEOUT)
+        return items
+
     # Utility function to get all the items that a user has access to
     @classmethod
     def get_user_items(cls, user: User):
-        return cls.objects.filter(user=user).values_list('items', flat=True)
+        return cls.effective_items(user)
     
+    # Utility function to give every user of a role exactly the given items
+    @classmethod
+    def sync_role_items(cls, role, items):
+        items = set(items)
+        user_ids = list(User.objects.filter(role=role).values_list('id', flat=True))
+
+        desired = {(user_id, item) for user_id in user_ids for item in items}
+        existing = set(cls.objects.filter(user__role=role).values_list('user_id', 'items'))
+
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, items=item) for user_id, item in desired - existing],
+            ignore_conflicts=True,
+        )
+        # Every user of the role should have every item, so anything else goes
+        if existing - desired:
+            cls.objects.filter(user__role=role).exclude(items__in=items).delete()
+
+        # bulk_create sends no signals
+        cls.invalidate_permissions(role=role)
+        return len(user_ids)
+
     # Utility function to check if a user has access to a specific item
     @classmethod
     def has_access(cls, user: User, item: str) -> bool:
-        return cls.objects.filter(user=user, items=item).exists()
+        return item in cls.effective_items(user)
 
     # A method to get all users for a particular item
     @classmethod
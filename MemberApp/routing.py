@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r"^ws/vehicleinfo/$", consumers.VehicleInfoConsumer.as_asgi()),
+    re_path(r"^ws/notifications/$", consumers.DriverInboxConsumer.as_asgi()),
 ]
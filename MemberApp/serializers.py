@@ -1,12 +1,12 @@
 import re
 import logging
 from rest_framework import serializers
-from .models import VehicleInfo, VehicleCapacity, VehicleImage, DriverNotification
+from .models import VehicleInfo, VehicleCapacity, VehicleImage, DriverNotification, VehicleImageUpload, NotificationClaim, Load
 from AdminApp.models import User
 
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinValueValidator
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import io
 from django.core.files.uploadedfile import InMemoryUploadedFile
 import os
@@ -17,9 +17,18 @@ from drf_extra_fields.fields import Base64ImageField
 from datetime import timedelta
 from django.db import transaction
 
+from django.utils import timezone
+from MemberApp.utils import schedule_file_deletion, remove_upload_part
+from services.inbox_service import publish_claimed
+
 # Logger setup
 logger = logging.getLogger(__name__)
 
+MAX_DOCUMENT_SIZE = 5 * 1024 * 1024  # 5MB
+VALID_DOCUMENT_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.pdf']
+# Chunked uploads become VehicleImages, documents that are not images are refused at init
+VALID_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+
 
 class CreateVehicleInfoSerializer(serializers.ModelSerializer):
     # Adding RegexValidator directly to the vehicle_number field
@@ -285,7 +294,39 @@ class CreateVehicleCapacitySerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CreateDocumentSerializer(serializers.ModelSerializer):
+class ImageCompressionMixin:
+    """Shared image compression used by the document upload serializers."""
+
+    def compress_image(self, img):
+        """Compress image by resizing if it's too large."""
+        max_width, max_height = 1200, 1200  # Max dimensions (change as needed)
+        img_width, img_height = img.size
+
+        # If the image is larger than the max size, resize it
+        if img_width > max_width or img_height > max_height:
+            img.thumbnail((max_width, max_height))  # Maintain aspect ratio
+
+        return img
+
+    def save_image(self, image):
+        """Compress and return the processed image."""
+        img = Image.open(image)
+        img_format = img.format  # Ensure the correct format for saving
+        img = self.compress_image(img)
+
+        # Save the image back into a temporary file buffer
+        img_io = io.BytesIO()
+        # Adjust quality as needed
+        img.save(img_io, format=img_format, quality=85)
+        img_io.seek(0)
+
+        # Create a new InMemoryUploadedFile with the compressed image data
+        return InMemoryUploadedFile(
+            img_io, None, image.name, image.content_type, img_io.getbuffer().nbytes, None
+        )
+
+
+class CreateDocumentSerializer(ImageCompressionMixin, serializers.ModelSerializer):
     """Serializer for creating multiple VehicleImage instances."""
 
     images = serializers.ListField(
@@ -316,49 +357,18 @@ class CreateDocumentSerializer(serializers.ModelSerializer):
 
     def validate_images(self, value):
         """Custom validation for multiple images."""
-        MAX_SIZE = 5 * 1024 * 1024  # 5MB
-        valid_extensions = ['.jpg', '.jpeg', '.png', '.pdf']
-
         for img in value:
             # Check file size
-            if img.size > MAX_SIZE:
+            if img.size > MAX_DOCUMENT_SIZE:
                 raise serializers.ValidationError(
                     f"Image {img.name} size exceeds the 5MB limit.")
             # Check file type
-            if not any(img.name.lower().endswith(ext) for ext in valid_extensions):
+            if not any(img.name.lower().endswith(ext) for ext in VALID_DOCUMENT_EXTENSIONS):
                 raise serializers.ValidationError(
                     f"Invalid image format for {img.name}. Only JPG, JPEG, and PNG are allowed.")
 
         return value
 
-    def compress_image(self, img):
-        """Compress image by resizing if it's too large."""
-        max_width, max_height = 1200, 1200  # Max dimensions (change as needed)
-        img_width, img_height = img.size
-
-        # If the image is larger than the max size, resize it
-        if img_width > max_width or img_height > max_height:
-            img.thumbnail((max_width, max_height))  # Maintain aspect ratio
-
-        return img
-
-    def save_image(self, image):
-        """Compress and return the processed image."""
-        img = Image.open(image)
-        img_format = img.format  # Ensure the correct format for saving
-        img = self.compress_image(img)
-
-        # Save the image back into a temporary file buffer
-        img_io = io.BytesIO()
-        # Adjust quality as needed
-        img.save(img_io, format=img_format, quality=85)
-        img_io.seek(0)
-
-        # Create a new InMemoryUploadedFile with the compressed image data
-        return InMemoryUploadedFile(
-            img_io, None, image.name, image.content_type, img_io.getbuffer().nbytes, None
-        )
-
     def create(self, validated_data):
         """Handle creating multiple VehicleImage instances."""
         vehicle = validated_data['vehicle']
@@ -379,10 +389,110 @@ class CreateDocumentSerializer(serializers.ModelSerializer):
         image_count = vehicle.images.count()
         if image_count >= 1:
             vehicle.status = vehicle.StatusChoices.IN_PROGRESS
-        vehicle.save(update_fields=["status"])
+        vehicle.save(update_fields=["status", "updated_at"])
         return vehicle_images
 
 
+class ChunkedUploadInitSerializer(serializers.ModelSerializer):
+    """Serializer for starting a resumable VehicleImage upload."""
+
+    class Meta:
+        model = VehicleImageUpload
+        fields = ['id', 'vehicle', 'filename', 'content_type', 'description',
+                  'total_size', 'checksum', 'offset', 'status']
+        read_only_fields = ['id', 'offset', 'status']
+
+    def validate_vehicle(self, value):
+        # Admins and staff upload for any vehicle, a driver only for their own
+        user = self.context["request"].user
+        if not user.is_staff and value.alternate_number != user.number:
+            raise serializers.ValidationError(
+                "You can only upload images for your own vehicle.")
+        return value
+
+    def validate_filename(self, value):
+        if not any(value.lower().endswith(ext) for ext in VALID_IMAGE_EXTENSIONS):
+            raise serializers.ValidationError(
+                f"Invalid image format for {value}. Only JPG, JPEG, and PNG are allowed.")
+        return os.path.basename(value)
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File size must be positive.")
+        if value > MAX_DOCUMENT_SIZE:
+            raise serializers.ValidationError(
+                "Image size exceeds the 5MB limit.")
+        return value
+
+    def validate_checksum(self, value):
+        value = value.lower()
+        if not re.match(r'^[0-9a-f]{64}$', value):
+            raise serializers.ValidationError(
+                "Checksum must be a hex encoded SHA-256 digest.")
+        return value
+
+
+class ChunkedUploadCommitSerializer(ImageCompressionMixin, serializers.Serializer):
+    """Verify a completed upload and hand it to the VehicleImage creation flow."""
+
+    def validate(self, attrs):
+        upload = self.instance
+        if upload.status == VehicleImageUpload.StatusChoices.COMPLETED:
+            raise serializers.ValidationError(
+                {"upload_id": "This upload has already been committed."})
+        if not upload.is_complete:
+            raise serializers.ValidationError({
+                "offset": f"Upload is incomplete, {upload.offset} of {upload.total_size} bytes received."
+            })
+        if upload.compute_checksum() != upload.checksum:
+            # The stored bytes are unusable, make the client start over
+            upload.discard()
+            raise serializers.ValidationError(
+                {"checksum": "Checksum mismatch, please upload the file again."})
+
+        try:
+            with open(upload.temp_path, "rb") as part:
+                uploaded = InMemoryUploadedFile(
+                    part, None, upload.filename, upload.content_type,
+                    upload.total_size, None
+                )
+                attrs["image"] = self.save_image(uploaded)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+            upload.discard()
+            raise serializers.ValidationError(
+                {"upload_id": "The uploaded file is not a valid image."})
+        return attrs
+
+    def update(self, instance, validated_data):
+        vehicle_image = VehicleImage(
+            vehicle=instance.vehicle,
+            image=validated_data["image"],
+            description=instance.description
+        )
+        try:
+            with transaction.atomic():
+                vehicle_image.save()
+                # Of two concurrent commits of the upload only one gets here
+                committed = VehicleImageUpload.objects.filter(
+                    id=instance.id, status=VehicleImageUpload.StatusChoices.UPLOADING,
+                ).update(image=vehicle_image, status=VehicleImageUpload.StatusChoices.COMPLETED,
+                         updated_at=timezone.now())
+                if not committed:
+                    raise serializers.ValidationError(
+                        {"upload_id": "This upload has already been committed."})
+        except Exception:
+            # The image file is stored before its row, nothing refers to it now
+            if vehicle_image.image:
+                vehicle_image.image.delete(save=False)
+            raise
+
+        instance.image = vehicle_image
+        instance.status = VehicleImageUpload.StatusChoices.COMPLETED
+        temp_path = instance.temp_path
+        transaction.on_commit(lambda: remove_upload_part(temp_path))
+        return vehicle_image
+
+
 #
 class VehicleImageSerializer(serializers.ModelSerializer):
     """Serializer for VehicleImage instances."""
@@ -419,17 +529,11 @@ class DeleteDocumentSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 "The list of image IDs cannot be empty.")
 
-        # Validate the existence of all images
-        invalid_ids = []
-        for image_id in value:
-            try:
-                UUID(str(image_id))  # Ensure it's a valid UUID
-            except ValueError:
-                invalid_ids.append(image_id)
-                continue
-
-            if not VehicleImage.objects.filter(id=image_id).exists():
-                invalid_ids.append(image_id)
+        # Validate the existence of all images with a single query
+        existing_ids = set(
+            VehicleImage.objects.filter(id__in=value).values_list('id', flat=True)
+        )
+        invalid_ids = [image_id for image_id in value if image_id not in existing_ids]
 
         if invalid_ids:
             raise serializers.ValidationError(
@@ -438,37 +542,33 @@ class DeleteDocumentSerializer(serializers.Serializer):
 
         return value
 
-    def delete_images(self, user_id):
+    def delete_images(self):
         """Delete the images based on the validated UUIDs and remove associated files."""
         image_ids = self.validated_data['image_ids']
-        deleted_count = 0
-        errors = []
-        affected_vehicles = set()  # Track vehicles whose images are deleted
-
-        for image_id in image_ids:
-            try:
-                # Fetch the image instance
-                image_instance = VehicleImage.objects.get(id=image_id)
-
-                # Build the file path
-                image_path = os.path.join(f"{settings.MEDIA_ROOT}/docs/", str(user_id),
-                                          os.path.basename(image_instance.image.name))
-
-                # Delete the file from the file system
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-
-                # Delete the database record
-                image_instance.delete()
-                deleted_count += 1
-            except VehicleImage.DoesNotExist:
-                errors.append(f"Image with ID {image_id} does not exist.")
-            except Exception as e:
-                errors.append(f"Error deleting image {image_id}: {str(e)}")
-
-            # Update the status of all affected vehicles
-        for vehicle in affected_vehicles:
-            vehicle.update_status()
+
+        images = VehicleImage.objects.filter(id__in=image_ids)
+        rows = list(images.values_list('id', 'vehicle_id', 'image'))
+        affected_vehicles = {vehicle_id for _, vehicle_id, _ in rows}  # Track vehicles whose images are deleted
+        file_names = [name for _, _, name in rows]
+
+        # Validated, but deleted by a concurrent request since
+        found = {image_id for image_id, _, _ in rows}
+        errors = [
+            f"Image with ID {image_id} does not exist."
+            for image_id in dict.fromkeys(image_ids) if image_id not in found
+        ]
+
+        with transaction.atomic():
+            # Queryset delete skips VehicleImage.delete(), so status is recomputed below
+            _, deleted = VehicleImage.objects.filter(id__in=found).delete()
+            deleted_count = deleted.get(VehicleImage._meta.label, 0)
+
+            # Only touch the filesystem once the rows are really gone
+            transaction.on_commit(lambda: schedule_file_deletion(file_names))
+
+            # Update the status of all affected vehicles once
+            for vehicle in VehicleInfo.objects.filter(id__in=affected_vehicles):
+                vehicle.update_status()
 
         return deleted_count, errors
 
@@ -541,64 +641,70 @@ class NotificationReadSerializer(serializers.ModelSerializer):
         model = DriverNotification
         fields = ["is_read"]
 
-    def validate_is_read(self, value):
-        if not value:
-            return value
-
-        with transaction.atomic():
-            # Lock all notifications with same source/destination and similar timestamp
-            similar_notifications = DriverNotification.objects.select_for_update().filter(
-                source=self.instance.source,
-                destination=self.instance.destination,
-                created_at__gte=self.instance.created_at - timedelta(minutes=1),
-                created_at__lte=self.instance.created_at + timedelta(minutes=1)
-            )
+    def update(self, instance, validated_data):
+        if not validated_data.get("is_read"):
+            return instance
 
-            # Check if any similar notification is already read
-            if similar_notifications.filter(
-                is_read=True,
-                is_accepted=True,
-                location_read_lock=True
-            ).exclude(pk=self.instance.pk).exists():
-                self.instance.is_accepted = True
-                self.instance.save(update_fields=["is_accepted"])
-                raise serializers.ValidationError({
-                    "vehicle_id": self.instance.vehicle.id,
-                    "is_accepted": self.instance.is_accepted,
+        user = self.context["request"].user
+        # A single conditional insert decides the winner of the load, the
+        # reservation is checked in the same transaction
+        try:
+            won, new = NotificationClaim.claim(instance, user)
+        except DriverNotification.Reserved:
+            raise serializers.ValidationError({
+                "is_read": {
+                    "vehicle_id": instance.vehicle_id,
+                    "is_accepted": instance.is_accepted,
+                    "msg": "This notification is reserved by another user."
+                }
+            })
+        if not won:
+            instance.is_accepted = True
+            raise serializers.ValidationError({
+                "is_read": {
+                    "vehicle_id": instance.vehicle_id,
+                    "is_accepted": instance.is_accepted,
                     "msg": "This notification batch is already read by another user."
-                })
-
-            # Mark all similar notifications as accepted
-            similar_notifications.filter(is_read=False).update(is_accepted=True)
-
-            # Mark current notification as read
-            self.instance.is_read = True
-            self.instance.is_accepted = True
-            self.instance.location_read_lock = True
-            self.instance.save(update_fields=[
-                'is_read',
-                'is_accepted',
-                'location_read_lock'
-            ])
-
-        return value
+                }
+            })
+
+        instance.refresh_from_db()
+        # The claim made the user reserved_by, no need to load it again
+        instance.reserved_by = user
+        # A repeated claim changes nothing, its events went out the first time
+        if new:
+            publish_claimed(instance)
+        return instance
 
 class VehicleSerializer(serializers.ModelSerializer):
     class Meta:
         model = VehicleInfo
         fields = "__all__"
 
+class NotificationLoadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Load
+        fields = ['id', 'source', 'destination', 'created_by', 'created_at']
+
 class NotificationDetailSerializer(serializers.ModelSerializer):
+    """
+    Flat read serializer, related rows must be select_related:
+    created_by, reserved_by and vehicle.
+    """
     created_by = UserBasicSerializer(read_only=True)
-    
+    reserved_by = UserBasicSerializer(read_only=True)
+    vehicle = VehicleSerializer(read_only=True)
+    rate = serializers.FloatField(read_only=True)
+    weight = serializers.FloatField(read_only=True)
+    is_reserved = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = DriverNotification
         fields = [
             'id', 'source', 'destination', 'rate', 'weight',
             'date', 'message', 'contact', 'model', 'is_read', 'is_accepted', 
-            'created_by', 'created_at', 'reserved_by', 'is_reserved'
+            'created_by', 'created_at', 'reserved_by', 'is_reserved', 'vehicle'
         ]
-        depth = 1
 
     def get_creator_name(self, obj):
         if obj.created_by:
@@ -607,19 +713,25 @@ class NotificationDetailSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        if instance.rate:
-            data['rate'] = float(instance.rate)
-        if instance.weight:
-            data['weight'] = float(instance.weight)
-        if instance.is_read:
-            data['vehicle'] = VehicleSerializer(instance.vehicle).data
+        # The vehicle is only disclosed once the notification is read
+        if not instance.is_read:
+            data.pop('vehicle')
         return data
 
 class ReadNotificationSerializer(serializers.ModelSerializer):
+    """Related rows must be select_related: vehicle, created_by, reserved_by and load."""
+    vehicle = VehicleSerializer(read_only=True)
+    created_by = UserBasicSerializer(read_only=True)
+    reserved_by = UserBasicSerializer(read_only=True)
+    load = NotificationLoadSerializer(read_only=True)
+
     class Meta:
         model = DriverNotification
-        fields = '__all__'
-        depth = 1
+        fields = [
+            'id', 'vehicle', 'source', 'destination', 'rate', 'weight', 'date', 'message',
+            'contact', 'model', 'is_read', 'is_accepted', 'created_at', 'updated_at',
+            'location_read_lock', 'created_by', 'reserved_by', 'reservation_time', 'reserved_until', 'load'
+        ]
 
     def to_representation(self, instance):
         if instance.is_read:
@@ -666,6 +778,8 @@ class UpdateNotificationByIdSerializer(serializers.ModelSerializer):
             instance.is_read = False
             instance.is_accepted = False
             instance.location_read_lock = False
+            # Rejected by the admin, the load can be claimed again
+            NotificationClaim.release(instance)
 
         for attr, value in validated_data.items():
             if attr != "is_read":
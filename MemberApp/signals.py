@@ -1,21 +1,65 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import VehicleInfo, RolePermissionConfig, Display, User
+from .models import VehicleInfo, RolePermissionConfig, Display, User, DriverNotification, Load
+from AuthApp.models import Driver
+from AdminApp.caching import invalidate_on_change
 from .serializers import GetAllVehicleInfoSerializer  # or use a manual dict
+from services.vehicle_broadcast import broadcast_vehicle_change, vehicle_route
+
+
+# updated_at changes on every save, it is not a change by itself
+SNAPSHOT_FIELDS = tuple(
+    field.attname for field in VehicleInfo._meta.concrete_fields if field.attname != "updated_at")
+
+
+def vehicleinfo_snapshot(instance):
+    # Straight from __dict__, a deferred field is left out instead of loaded
+    values = instance.__dict__
+    return {name: values[name] for name in SNAPSHOT_FIELDS if name in values}
+
+
+@receiver(post_init, sender=VehicleInfo)
+def vehicleinfo_loaded(sender, instance, **kwargs):
+    # Remember what was loaded so post_save can tell what actually changed
+    instance._broadcast_snapshot = vehicleinfo_snapshot(instance)
 
 
 @receiver(post_save, sender=VehicleInfo)
-def vehicleinfo_updated(sender, instance, **kwargs):
-    # Serialize the instance
-    data = GetAllVehicleInfoSerializer(instance).data
+def vehicleinfo_updated(sender, instance, created, update_fields=None, **kwargs):
+    previous = instance._broadcast_snapshot
+    current = vehicleinfo_snapshot(instance)
+    instance._broadcast_snapshot = current
+
+    # A field deferred at load time has no previous value, it changed if it was saved
+    saved = set(update_fields or ())
+    changed = [
+        name for name, value in current.items()
+        if created or (previous[name] != value if name in previous else name in saved)
+    ]
+    # Nothing changed, nothing to tell the clients
+    if not changed:
+        return
+
+    # Serialize only the changed fields
+    serializer = GetAllVehicleInfoSerializer(instance)
+    fields = serializer.fields
+    changes = {}
+    for name in changed:
+        if name == "capacity_id":
+            changes["capacity"] = serializer.get_capacity(instance)
+        elif name in fields:
+            changes[name] = fields[name].to_representation(getattr(instance, name))
 
-    # Send to WebSocket group
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "vehicleinfo_updates", {"type": "send_vehicleinfo", "data": data}
-    )
+    broadcast_vehicle_change(
+        instance.id, "vehicle.created" if created else "vehicle.updated", changes,
+        route=vehicle_route(current), previous=None if created else vehicle_route(previous))
+
+
+@receiver(post_delete, sender=VehicleInfo)
+def vehicleinfo_deleted(sender, instance, **kwargs):
+    broadcast_vehicle_change(
+        instance.id, "vehicle.deleted", {},
+        previous=vehicle_route(instance._broadcast_snapshot))
 
 
 @receiver(post_save, sender=User)
@@ -23,7 +67,29 @@ def apply_default_permissions(sender, instance, created, **kwargs):
     if created:
         try:
             config = RolePermissionConfig.objects.get(role=instance.role)
-            for item in config.items:
-                Display.objects.get_or_create(user=instance, items=item)
+            Display.objects.bulk_create(
+                [Display(user=instance, items=item) for item in config.items],
+                ignore_conflicts=True,
+            )
+            Display.invalidate_permissions(user_id=instance.pk)
         except RolePermissionConfig.DoesNotExist:
             pass
+
+
+@receiver(post_save, sender=Display)
+@receiver(post_delete, sender=Display)
+def display_changed(sender, instance, **kwargs):
+    Display.invalidate_permissions(user_id=instance.user_id)
+
+
+@receiver(post_save, sender=RolePermissionConfig)
+@receiver(post_delete, sender=RolePermissionConfig)
+def role_permissions_changed(sender, instance, **kwargs):
+    Display.invalidate_permissions(role=instance.role)
+
+
+# Tags of the cached responses (AdminApp.caching) built from these rows
+invalidate_on_change(VehicleInfo, "vehicles")
+invalidate_on_change(DriverNotification, "notifications")
+invalidate_on_change(Load, "loads")
+invalidate_on_change(Driver, "drivers")
@@ -1,3 +1,911 @@
-from django.test import TestCase
+import gzip
+import base64
+import json
+import os
+import time
+import threading
+import hashlib
+import uuid
+from io import BytesIO, StringIO
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.testing import (
+    TEST_SETTINGS, QueryCountTestCase, fake_external_services, make_image, race_claims, seed_claim_race,
+)
+from MemberApp.consumers import DriverInboxConsumer, VehicleInfoConsumer, MAX_SUBSCRIBED_VEHICLES
+from MemberApp.models import (
+    VehicleInfo, VehicleImage, DriverNotification, NotificationClaim, InboxEvent, Display, RolePermissionConfig,
+    VehicleImageUpload, get_chunked_upload_path,
+)
+from MemberApp.serializers import DeleteDocumentSerializer
+from services import vehicle_broadcast
+from services.inbox_service import inbox_group
 
 # Create your tests here.
+
+
+class VehicleEndpointQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+
+    def test_create_vehicle(self):
+        data = {
+            "model": "Eicher Pro", "name": "New Owner", "number": "9555555555",
+            "alternate_number": "9666666666", "address": "Surat", "vehicle_type": "open",
+            "vehicle_number": "MH-12-AB-1234", "capacity": "3.5",
+        }
+        with self.assertMaxQueries(3):
+            response = self.client.post(reverse("create-vehicle"), data, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_all_vehicle_info(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("all-vehicle-info"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_all_vehicle_info_not_modified(self):
+        etag = self.get_etag(reverse("all-vehicle-info"))
+        # Authentication and the validator aggregate, nothing is written
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("all-vehicle-info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.vehicle.save()
+        response = self.client.get(reverse("all-vehicle-info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # A serialized capacity changes without a vehicle write
+        etag = response["ETag"]
+        capacity = self.vehicle.capacity
+        capacity.capacity = "7.5"
+        capacity.save()
+        response = self.client.get(reverse("all-vehicle-info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_all_vehicle_info_does_not_write(self):
+        VehicleImage.objects.filter(vehicle=self.vehicle).delete()
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("all-vehicle-info"))
+        self.assertEqual(response.status_code, 200)
+        # Repairing the status is left to sync_vehicle_statuses
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.status, VehicleInfo.StatusChoices.IN_PROGRESS)
+
+        out = StringIO()
+        call_command("sync_vehicle_statuses", stdout=out)
+        self.assertIn("Updated", out.getvalue())
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.status, VehicleInfo.StatusChoices.IN_COMPLETE)
+
+    def test_vehicle(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("vehicle"), {"vehicle_id": self.vehicle.id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_vehicle_not_modified(self):
+        params = {"vehicle_id": self.vehicle.id}
+        etag = self.get_etag(reverse("vehicle"), params)
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("vehicle"), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_update_vehicle(self):
+        data = {
+            "model": "Tata Ace", "name": "Owner 0", "number": self.vehicle.number,
+            "alternate_number": self.vehicle.alternate_number, "address": "Surat",
+            "vehicle_type": "open", "status": "IN_PROGRESS",
+            "vehicle_number": self.vehicle.vehicle_number, "capacity": "5.0",
+        }
+        with self.assertMaxQueries(10):
+            response = self.client.post(
+                f"{reverse('update-vehicle')}?vehicle_id={self.vehicle.id}", data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_capacities(self):
+        with self.assertMaxQueries(5):
+            response = self.client.get(reverse("vehicle-capacity-list"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_capacity(self):
+        with self.assertMaxQueries(3):
+            response = self.client.post("/api/member/create-capacity", {"capacity": "7.5"}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_delete_vehicle(self):
+        vehicle = self.fixtures["vehicles"][-1]
+        with self.assertMaxQueries(12):
+            response = self.client.post(f"{reverse('delete-vehicle')}?vehicle_id={vehicle.id}")
+        self.assertEqual(response.data["status"], 200)
+        self.assertFalse(VehicleInfo.objects.filter(id=vehicle.id).exists())
+
+
+class VehicleBroadcastSignalTests(QueryCountTestCase):
+
+    def test_deferred_load(self):
+        # Snapshots must not load deferred fields, that would recurse through post_init
+        with self.assertMaxQueries(1):
+            vehicles = list(VehicleInfo.objects.only("id"))
+        self.assertTrue(vehicles)
+        self.assertTrue(list(VehicleInfo.objects.defer("address", "status")))
+
+    def test_deferred_save_broadcasts_saved_fields(self):
+        vehicle = VehicleInfo.objects.only("id").get(id=self.vehicle.id)
+        vehicle.location_status = "IN_TRANSIT"
+        with mock.patch("MemberApp.signals.broadcast_vehicle_change") as broadcast:
+            vehicle.save(update_fields=["location_status"])
+        (vehicle_id, event, changes), kwargs = broadcast.call_args
+        self.assertEqual(event, "vehicle.updated")
+        self.assertEqual(changes, {"location_status": "IN_TRANSIT"})
+        self.assertIsNone(kwargs["previous"]["status"])
+
+
+class DocumentEndpointQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+
+    def test_upload_images(self):
+        data = {"vehicle": str(self.vehicle.id), "images": [make_image("a.png"), make_image("b.png")]}
+        with self.assertMaxQueries(6):
+            response = self.client.post(reverse("upload-images"), data, format="multipart")
+        self.assertEqual(response.status_code, 201)
+
+    def test_chunked_upload(self):
+        content = make_image().read()
+        data = {
+            "vehicle": str(self.vehicle.id), "filename": "rc.png", "content_type": "image/png",
+            "total_size": len(content), "checksum": hashlib.sha256(content).hexdigest(),
+        }
+        with self.assertMaxQueries(4):
+            response = self.client.post(reverse("upload-images-init"), data, format="json")
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data["upload_id"]
+
+        # Three of them are the savepoint and the row lock held while the chunk is written
+        with self.assertMaxQueries(7):
+            response = self.client.put(
+                f"{reverse('upload-images-chunk')}?upload_id={upload_id}&offset=0",
+                content, content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("upload-images-chunk"), {"upload_id": upload_id})
+        self.assertEqual(response.status_code, 200)
+
+        # Two of them are the savepoint around the image row and the session update
+        with self.assertMaxQueries(9):
+            response = self.client.post(f"{reverse('upload-images-commit')}?upload_id={upload_id}")
+        self.assertEqual(response.status_code, 201)
+
+    def start_upload(self, content):
+        data = {
+            "vehicle": str(self.vehicle.id), "filename": "rc.png", "content_type": "image/png",
+            "total_size": len(content), "checksum": hashlib.sha256(content).hexdigest(),
+        }
+        upload_id = self.client.post(reverse("upload-images-init"), data, format="json").data["upload_id"]
+        response = self.client.put(
+            f"{reverse('upload-images-chunk')}?upload_id={upload_id}&offset=0",
+            content, content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 200)
+        return VehicleImageUpload.objects.get(id=upload_id)
+
+    def test_commit_not_an_image(self):
+        upload = self.start_upload(b"not an image at all")
+        images = VehicleImage.objects.count()
+
+        response = self.client.post(f"{reverse('upload-images-commit')}?upload_id={upload.id}")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("upload_id", response.json()["errors"])
+        self.assertEqual(VehicleImage.objects.count(), images)
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.offset), (VehicleImageUpload.StatusChoices.UPLOADING, 0))
+
+    def test_init_rejects_other_drivers_vehicle(self):
+        content = make_image().read()
+        data = {
+            "vehicle": str(self.vehicle.id), "filename": "rc.png", "content_type": "image/png",
+            "total_size": len(content), "checksum": hashlib.sha256(content).hexdigest(),
+        }
+        self.authenticate(self.fixtures["drivers"][1])
+        response = self.client.post(reverse("upload-images-init"), data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("vehicle", response.json()["errors"])
+
+        self.authenticate(self.driver)
+        response = self.client.post(reverse("upload-images-init"), data, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_init_rejects_documents(self):
+        data = {
+            "vehicle": str(self.vehicle.id), "filename": "rc.pdf", "content_type": "application/pdf",
+            "total_size": 100, "checksum": "0" * 64,
+        }
+        response = self.client.post(reverse("upload-images-init"), data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("filename", response.json()["errors"])
+
+    def test_concurrent_chunk_conflicts(self):
+        content = make_image().read()
+        upload = VehicleImageUpload.objects.create(
+            vehicle=self.vehicle, created_by=self.admin, filename="rc.png",
+            total_size=len(content), checksum=hashlib.sha256(content).hexdigest())
+        first, second = VehicleImageUpload.objects.get(id=upload.id), VehicleImageUpload.objects.get(id=upload.id)
+
+        self.assertEqual(first.write_chunk(BytesIO(content), 0), len(content))
+        # The second request read offset 0 before the first one stored its chunk
+        self.assertEqual(second.write_chunk(BytesIO(content), 0), VehicleImageUpload.OFFSET_CONFLICT)
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, len(content))
+        os.remove(upload.temp_path)
+
+    def test_commit_removes_part_after_commit(self):
+        upload = self.start_upload(make_image().read())
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(f"{reverse('upload-images-commit')}?upload_id={upload.id}")
+            self.assertEqual(response.status_code, 201)
+        self.assertTrue(os.path.exists(upload.temp_path))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(os.path.exists(upload.temp_path))
+
+    def test_prune_uploads(self):
+        stale = self.start_upload(b"abandoned")
+        fresh = self.start_upload(b"still uploading")
+        expired = time.time() - (settings.CHUNKED_UPLOAD_EXPIRY_HOURS * 3600 + 60)
+        VehicleImageUpload.objects.filter(id=stale.id).update(
+            updated_at=timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS, minutes=1))
+        os.utime(stale.temp_path, (expired, expired))
+        # A file whose session is gone already
+        orphan = get_chunked_upload_path(uuid.uuid4())
+        open(orphan, "wb").close()
+        os.utime(orphan, (expired, expired))
+
+        out = StringIO()
+        call_command("prune_uploads", stdout=out)
+        self.assertIn("Deleted 1 ", out.getvalue())
+        self.assertFalse(VehicleImageUpload.objects.filter(id=stale.id).exists())
+        self.assertFalse(os.path.exists(stale.temp_path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(fresh.temp_path))
+
+    def test_vehicle_images(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("user-vehicle-images"), {"user_id": self.vehicle.id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_images(self):
+        images = list(VehicleImage.objects.values_list("id", "vehicle_id")[:10])
+        image_ids = [str(image_id) for image_id, _ in images]
+        vehicle_count = len({vehicle_id for _, vehicle_id in images})
+        # The status of every affected vehicle is recomputed
+        with self.assertMaxQueries(10 + 3 * vehicle_count):
+            response = self.client.delete(reverse("delete-images"), {"image_ids": image_ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_images_reports_unmatched(self):
+        image_ids = [str(image_id) for image_id in VehicleImage.objects.values_list("id", flat=True)[:3]]
+        serializer = DeleteDocumentSerializer(data={"image_ids": image_ids})
+        self.assertTrue(serializer.is_valid())
+        # Another request deletes one of them after validation
+        VehicleImage.objects.filter(id=image_ids[0]).delete()
+
+        deleted_count, errors = serializer.delete_images()
+        self.assertEqual(deleted_count, 2)
+        self.assertEqual(errors, [f"Image with ID {image_ids[0]} does not exist."])
+        self.assertFalse(VehicleImage.objects.filter(id__in=image_ids).exists())
+
+    def test_verify_documents(self):
+        image_ids = [str(image.id) for image in self.vehicle.images.all()[:1]]
+        with self.assertMaxQueries(13):
+            response = self.client.post(
+                f"{reverse('verify-document')}?vehicle_id={self.vehicle.id}",
+                {"image_ids": image_ids}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+
+class NotificationEndpointQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+        self.open_notification = DriverNotification.objects.filter(is_accepted=False).first()
+        self.claimed_notification = DriverNotification.objects.filter(is_read=True).first()
+
+    def notification_data(self):
+        return {
+            "source": "Surat", "destination": "Mumbai", "rate": "1800.00", "weight": "3.0",
+            "date": "2025-01-01", "message": "Same day", "contact": "9000000000",
+        }
+
+    def test_create_notification(self):
+        data = {"vehicle_id": str(self.vehicle.id), **self.notification_data()}
+        with self.assertMaxQueries(8):
+            response = self.client.post(reverse("create-notifications"), data, format="json")
+        self.assertEqual(response.data["status"], 201)
+
+    def test_create_notifications_bulk(self):
+        vehicles = self.fixtures["vehicles"][:20]
+        data = {
+            "vehicle_ids": [str(vehicle.id) for vehicle in vehicles],
+            "notifications": [self.notification_data()],
+        }
+        # One notification per vehicle, device tokens for every push in one query
+        with self.assertMaxQueries(5 + 3 * len(vehicles)):
+            response = self.client.post(reverse("create-notifications"), data, format="json")
+        self.assertEqual(response.data["status"], 201)
+
+    def test_get_notifications(self):
+        with self.assertMaxQueries(5):
+            response = self.client.get(
+                reverse("get-notifications"), {"vehicle_id": self.vehicle.id, "lang": "hi"})
+        self.assertEqual(response.data["status"], 200)
+
+    def test_get_notifications_not_modified(self):
+        params = {"vehicle_id": self.vehicle.id, "lang": "hi"}
+        etag = self.get_etag(reverse("get-notifications"), params)
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("get-notifications"), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Another language is another representation
+        response = self.client.get(
+            reverse("get-notifications"), {**params, "lang": "en"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_locked_notifications(self):
+        self.authenticate(self.driver)
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("locked-notifications"))
+        self.assertEqual(response.data["status"], 200)
+
+    def test_locked_notifications_not_modified(self):
+        self.authenticate(self.driver)
+        etag = self.get_etag(reverse("locked-notifications"))
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("locked-notifications"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.open_notification.delete()
+        response = self.client.get(reverse("locked-notifications"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_mark_notification_read(self):
+        self.authenticate(self.driver)
+        with self.assertMaxQueries(14):
+            response = self.client.post(
+                f"{reverse('mark-notification-read')}?notification_id={self.open_notification.id}",
+                {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_get_all_notifications(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("get-all-notifications"))
+        self.assertEqual(response.data["status"], 200)
+        self.assertTrue(response.data["data"])
+        self.assertTrue(response.data["creators"])
+        self.assertFalse([item for item in response.data["data"] if item["is_accepted"] and not item["is_read"]])
+
+    def test_get_all_notifications_pages(self):
+        expected = DriverNotification.objects.exclude(is_read=False, is_accepted=True).count()
+        seen = []
+        params = {"limit": 7}
+        while True:
+            # Later pages skip the creators query
+            with self.assertMaxQueries(3 if "cursor" in params else 4):
+                response = self.client.get(reverse("get-all-notifications"), params)
+            self.assertEqual(response.data["status"], 200)
+            self.assertEqual("creators" in response.data, "cursor" not in params)
+            seen.extend(item["id"] for item in response.data["data"])
+            if not response.data["next_cursor"]:
+                break
+            params["cursor"] = response.data["next_cursor"]
+        self.assertEqual(len(seen), expected)
+        self.assertEqual(len(set(seen)), expected)
+
+    def test_get_all_notifications_bad_cursor(self):
+        created_at = timezone.now().isoformat()
+        for cursor in ("not-base64!", base64.urlsafe_b64encode(f"{created_at}|not-a-uuid".encode()).decode()):
+            response = self.client.get(reverse("get-all-notifications"), {"cursor": cursor})
+            self.assertEqual(response.data["status"], 400)
+            self.assertEqual(response.data["message"], "Invalid cursor.")
+
+    def test_get_all_notifications_rejected(self):
+        response = self.client.get(reverse("get-all-notifications"), {"is_read": "false", "is_accepted": "true"})
+        self.assertTrue(response.data["data"])
+        self.assertTrue(all(item["is_accepted"] and not item["is_read"] for item in response.data["data"]))
+
+    def test_get_read_notifications(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("get-read-notifications"))
+            data = self.get_json(response)
+        self.assertEqual(data["status"], 200)
+        self.assertTrue(all(item["is_read"] for item in data["data"]))
+        self.assertTrue(data["data"])
+        for item in data["data"]:
+            self.assertNotIn("password", item["created_by"] or {})
+            self.assertNotIn("password", item["reserved_by"] or {})
+
+    def test_get_read_notifications_compressed(self):
+        response = self.client.get(reverse("get-read-notifications"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertNotIn("Content-Length", response)
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(json.loads(body)["status"], 200)
+
+    def test_update_notification(self):
+        with self.assertMaxQueries(7):
+            response = self.client.post(
+                f"{reverse('update-notification-by-id')}?notification_id={self.claimed_notification.id}",
+                {"is_read": False}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_bulk_delete_notifications(self):
+        notification_ids = DriverNotification.objects.filter(is_read=False).values_list("id", flat=True)[:25]
+        ids = ",".join(str(notification_id) for notification_id in notification_ids)
+        # Notifications are looked up and deleted one by one
+        with self.assertMaxQueries(3 + 3 * len(notification_ids)):
+            response = self.client.post(f"{reverse('bulk-delete-notifications')}?notification_ids={ids}")
+        self.assertEqual(response.data["status"], 200)
+
+    def test_get_notification(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(
+                reverse("get-notification"), {"notification_id": self.claimed_notification.id})
+        self.assertEqual(response.data["status"], 200)
+        data = response.data["notification"]
+        self.assertEqual(data["vehicle"]["id"], str(self.claimed_notification.vehicle_id))
+        self.assertNotIn("password", data["reserved_by"])
+
+    def test_register_fcm(self):
+        self.authenticate(self.driver)
+        with self.assertMaxQueries(8):
+            response = self.client.post(f"{reverse('register-fcm')}?token=new-fcm-token&device_id=pixel")
+        self.assertEqual(response.data["status"], 200)
+
+
+class DisplayPermissionEndpointQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+
+    def test_create_display(self):
+        with self.assertMaxQueries(13):
+            response = self.client.post(
+                reverse("create-display"), {"role": "staff", "items": ["dashboard", "teams"]}, format="json")
+        self.assertEqual(response.data["status"], 201)
+
+    def test_get_display(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse("get-display"), {"role": "staff"})
+        self.assertEqual(response.data["status"], 200)
+
+    def test_user_rows_only_add_items(self):
+        RolePermissionConfig.objects.update_or_create(role="staff", defaults={"items": ["dashboard"]})
+        user = self.staff_user
+        with self.captureOnCommitCallbacks(execute=True):
+            Display.objects.filter(user=user).exclude(items="dashboard").delete()
+            Display.objects.get_or_create(user=user, items="dashboard")
+            Display.objects.create(user=user, items="teams")
+        self.assertEqual(Display.effective_items(user), ["dashboard", "teams"])
+
+        # Without its row the user keeps the role's item, loses the extra one
+        with self.captureOnCommitCallbacks(execute=True):
+            Display.objects.filter(user=user).delete()
+        self.assertEqual(Display.effective_items(user), ["dashboard"])
+
+    def test_invalidated_on_commit(self):
+        user = self.staff_user
+        Display.effective_items(user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Display.objects.create(user=user, items="partners")
+            # Not committed yet, the cached items still stand
+            self.assertNotIn("partners", Display.effective_items(user))
+        for callback in callbacks:
+            callback()
+        self.assertIn("partners", Display.effective_items(user))
+
+
+class NotificationReservationTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_driver = self.fixtures["drivers"][1]
+        self.held = DriverNotification.objects.filter(reserved_until__isnull=False)
+
+    def inbox_ids(self, user):
+        self.authenticate(user)
+        response = self.client.get(reverse("locked-notifications"), {"limit": 100})
+        self.assertEqual(response.data["status"], 200)
+        ids = {row["id"] for row in response.data["data"]}
+        while response.data["next_cursor"]:
+            response = self.client.get(
+                reverse("locked-notifications"), {"limit": 100, "cursor": response.data["next_cursor"]})
+            ids |= {row["id"] for row in response.data["data"]}
+        return ids
+
+    def test_reservation_expiry(self):
+        notification = self.held.first()
+        self.assertTrue(notification.is_reserved)
+
+        notification.reserved_until = timezone.now() - timedelta(seconds=1)
+        self.assertFalse(notification.is_reserved)
+        notification.reserved_until = None
+        self.assertFalse(notification.is_reserved)
+
+    def test_reserve(self):
+        notification = DriverNotification.objects.filter(location_read_lock=False, reserved_by=None).first()
+        self.authenticate(self.driver)
+        url = f"{reverse('reserve-notification')}?notification_id={notification.id}"
+        with self.assertMaxQueries(4):
+            response = self.client.post(url, {"reserve": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+        # Somebody else's live hold cannot be taken over or claimed
+        self.authenticate(self.other_driver)
+        response = self.client.post(url, {"reserve": True}, format="json")
+        self.assertEqual(response.data["status"], 409)
+        response = self.client.post(
+            f"{reverse('mark-notification-read')}?notification_id={notification.id}", {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 400)
+        self.assertFalse(NotificationClaim.objects.filter(notification=notification).exists())
+
+        self.authenticate(self.driver)
+        response = self.client.post(url, {"reserve": False}, format="json")
+        self.assertEqual(response.data["status"], 200)
+        self.assertIsNone(DriverNotification.objects.get(id=notification.id).reserved_by)
+
+    def test_claim_checks_reservation_when_claiming(self):
+        notification = DriverNotification.objects.filter(location_read_lock=False, reserved_by=None).first()
+        stale = DriverNotification.objects.get(id=notification.id)
+        # The hold is placed after the claimant loaded the notification
+        self.assertTrue(notification.reserve(self.other_driver))
+        self.assertFalse(stale.is_reserved)
+
+        with self.assertRaises(DriverNotification.Reserved):
+            NotificationClaim.claim(stale, self.driver)
+        self.assertFalse(NotificationClaim.objects.filter(notification=notification).exists())
+        notification.refresh_from_db()
+        self.assertEqual(notification.reserved_by_id, self.other_driver.id)
+        self.assertFalse(notification.location_read_lock)
+
+    def test_expired_reservation_reappears(self):
+        notification = self.held.exclude(reserved_by=self.other_driver).first()
+        self.assertIn(str(notification.id), self.inbox_ids(notification.reserved_by))
+        self.assertNotIn(str(notification.id), self.inbox_ids(self.other_driver))
+
+        # Expired, but not swept yet
+        DriverNotification.objects.filter(id=notification.id).update(
+            reserved_until=timezone.now() - timedelta(seconds=1))
+        self.assertIn(str(notification.id), self.inbox_ids(self.other_driver))
+
+    def test_claim_keeps_notification(self):
+        notification = self.held.first()
+        self.authenticate(notification.reserved_by)
+        response = self.client.post(
+            f"{reverse('mark-notification-read')}?notification_id={notification.id}", {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+        claimed = DriverNotification.objects.get(id=notification.id)
+        self.assertEqual(claimed.reserved_by_id, notification.reserved_by_id)
+        self.assertIsNone(claimed.reserved_until)
+        DriverNotification.release_expired_reservations()
+        self.assertEqual(DriverNotification.objects.get(id=notification.id).reserved_by_id, claimed.reserved_by_id)
+
+    def test_release_reservations(self):
+        claimed = DriverNotification.objects.filter(location_read_lock=True, reserved_by__isnull=False).count()
+        live = self.held.count()
+        expired = list(self.held.values_list("pk", flat=True)[:3])
+        self.held.filter(pk__in=expired).update(reserved_until=timezone.now() - timedelta(minutes=1))
+
+        out = StringIO()
+        with self.assertMaxQueries(1):
+            call_command("release_reservations", stdout=out)
+        self.assertIn("Released 3 ", out.getvalue())
+        self.assertEqual(self.held.count(), live - 3)
+        self.assertFalse(DriverNotification.objects.filter(
+            pk__in=expired).exclude(reserved_until=None, reservation_time=None, reserved_by=None))
+        # Claims are not reservations, the sweeper leaves them alone
+        self.assertEqual(
+            DriverNotification.objects.filter(location_read_lock=True, reserved_by__isnull=False).count(), claimed)
+
+
+class InboxSinceTests(QueryCountTestCase):
+
+    def sync(self, since):
+        self.authenticate(self.driver)
+        response = self.client.get(reverse("locked-notifications"), {"since": since.isoformat(), "limit": 200})
+        self.assertEqual(response.data["status"], 200)
+        return {row["id"] for row in response.data["data"]}, set(response.data["removed"])
+
+    def test_claimed_after_since(self):
+        other_driver = self.fixtures["drivers"][1]
+        notification = DriverNotification.objects.filter(
+            location_read_lock=False, reserved_by=None).exclude(load=None).first()
+        since = timezone.now()
+        self.assertEqual(self.sync(since), (set(), set()))
+
+        self.authenticate(other_driver)
+        response = self.client.post(
+            f"{reverse('mark-notification-read')}?notification_id={notification.id}", {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+
+        data, removed = self.sync(since)
+        self.assertIn(str(notification.id), removed)
+        self.assertNotIn(str(notification.id), data)
+        # The rest of the load is still listed, now as accepted
+        siblings = {str(pk) for pk in DriverNotification.objects.filter(
+            load=notification.load).exclude(pk=notification.pk).values_list("pk", flat=True)}
+        self.assertEqual(data, siblings)
+
+    def test_reservation_expired_after_since(self):
+        notification = DriverNotification.objects.filter(
+            reserved_until__isnull=False).exclude(reserved_by=self.driver).first()
+        since = timezone.now() - timedelta(minutes=5)
+        # Held before the last sync, ran out afterwards without a write
+        DriverNotification.objects.filter(pk=notification.pk).update(
+            reserved_until=timezone.now() - timedelta(minutes=1), updated_at=since - timedelta(minutes=1))
+
+        data, removed = self.sync(since)
+        self.assertIn(str(notification.id), data)
+        self.assertNotIn(str(notification.id), removed)
+
+
+class VehicleInfoSubscribeTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.consumer = VehicleInfoConsumer()
+        self.consumer.filters = {}
+        self.consumer.subscribed_groups = []
+        self.consumer.send = mock.AsyncMock()
+
+    def subscribe(self, filters):
+        async_to_sync(self.consumer.receive)(text_data=json.dumps({"action": "subscribe", "filters": filters}))
+        return [json.loads(call.kwargs["text_data"]) for call in self.consumer.send.call_args_list]
+
+    def test_parse_vehicle_ids(self):
+        vehicle_id = uuid.uuid4()
+        filters = self.consumer.parse_filters({"vehicle_ids": [str(vehicle_id).upper()], "status": "active"})
+        self.assertEqual(filters, {"vehicle_ids": {str(vehicle_id)}, "status": {"active"}})
+
+    def test_invalid_vehicle_id(self):
+        sent = self.subscribe({"vehicle_ids": ["../../etc", str(uuid.uuid4())]})
+        self.assertEqual(sent, [{"event": "error", "msg": "Invalid vehicle id."}])
+        self.assertEqual(self.consumer.subscribed_groups, [])
+
+    def test_too_many_vehicle_ids(self):
+        sent = self.subscribe({"vehicle_ids": [str(uuid.uuid4()) for _ in range(MAX_SUBSCRIBED_VEHICLES + 1)]})
+        self.assertEqual(sent[0]["event"], "error")
+        self.assertEqual(self.consumer.subscribed_groups, [])
+
+    def test_malformed_filters(self):
+        for filters in (["status"], {"status": {"a": 1}}, {"vehicle_ids": [{"id": 1}]}):
+            self.consumer.send.reset_mock()
+            self.assertEqual(self.subscribe(filters)[0]["event"], "error")
+        # Not an object at all is ignored
+        self.consumer.send.reset_mock()
+        async_to_sync(self.consumer.receive)(text_data="[1, 2]")
+        self.consumer.send.assert_not_called()
+
+
+class VehicleBroadcastSequenceTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_flush_takes_one_block(self):
+        broadcaster = vehicle_broadcast.VehicleBroadcaster(interval_ms=60_000)
+        for _ in range(3):
+            broadcaster.publish(str(uuid.uuid4()), "vehicle.updated", {"status": "active"})
+        broadcaster._timer.cancel()
+        # Another worker numbering its own events meanwhile
+        other = vehicle_broadcast.next_sequence()
+        vehicle_broadcast.store_events([{"data": {"seq": other}, "route": None}])
+
+        sent = []
+
+        async def group_send(group, message):
+            # Every event of the flush is in the backlog before the first one goes out
+            self.assertEqual(len(vehicle_broadcast.get_events_since(other)), 3)
+            sent.append(message["data"]["seq"])
+
+        with mock.patch("services.vehicle_broadcast.get_channel_layer",
+                        return_value=mock.Mock(group_send=group_send)):
+            broadcaster.flush()
+
+        self.assertEqual(sorted(set(sent)), [other + 1, other + 2, other + 3])
+        self.assertEqual(vehicle_broadcast.current_sequence(), other + 3)
+
+    def test_bootstrap_waits_on_the_event_loop(self):
+        # Another worker is rebuilding the snapshot
+        built = vehicle_broadcast.build_snapshot()
+        cache.delete(vehicle_broadcast.SNAPSHOT_KEY)
+        cache.add(vehicle_broadcast.SNAPSHOT_LOCK_KEY, 1)
+
+        async def other_worker_done(seconds):
+            cache.set(vehicle_broadcast.SNAPSHOT_KEY, built)
+            cache.delete(vehicle_broadcast.SNAPSHOT_LOCK_KEY)
+
+        with mock.patch("services.vehicle_broadcast.asyncio.sleep", side_effect=other_worker_done) as sleep, \
+                mock.patch("services.vehicle_broadcast.build_snapshot") as build:
+            snapshot, events = async_to_sync(vehicle_broadcast.get_bootstrap)()
+        sleep.assert_called_once_with(vehicle_broadcast.SNAPSHOT_WAIT)
+        # The waiting socket got the other worker's snapshot
+        build.assert_not_called()
+        self.assertEqual(snapshot, built)
+        self.assertEqual(events, [])
+
+
+class InboxEventTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.vehicle = self.fixtures["vehicles"][0]
+        self.consumer = DriverInboxConsumer()
+        self.consumer.groups_joined = [inbox_group(self.vehicle.id)]
+
+    def add_event(self, **fields):
+        return InboxEvent.objects.create(
+            vehicle=self.vehicle, event=InboxEvent.EventChoices.CREATED, notification_id=uuid.uuid4(), **fields)
+
+    def replay(self, since):
+        events = DriverInboxConsumer.get_events_since.__wrapped__(self.consumer, since)
+        return None if events is None else [event["seq"] for event in events]
+
+    def test_repeated_claim_publishes_once(self):
+        notification = DriverNotification.objects.filter(location_read_lock=False, reserved_by=None).first()
+        url = f"{reverse('mark-notification-read')}?notification_id={notification.id}"
+        self.authenticate(self.driver)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+        published = InboxEvent.objects.count()
+        self.assertTrue(published)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 200)
+        self.assertEqual(InboxEvent.objects.count(), published)
+
+        # Nobody else can claim it afterwards
+        self.authenticate(self.fixtures["drivers"][1])
+        response = self.client.post(url, {"is_read": True}, format="json")
+        self.assertEqual(response.data["status"], 400)
+        self.assertEqual(InboxEvent.objects.count(), published)
+
+    def test_non_object_messages_ignored(self):
+        self.consumer.send = mock.AsyncMock()
+        for text_data in ("[]", "1", "null", '"resume"'):
+            async_to_sync(self.consumer.receive)(text_data=text_data)
+        self.consumer.send.assert_not_called()
+
+    def test_replay_includes_late_commits(self):
+        old = self.add_event()
+        InboxEvent.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        # Numbered first, committed after the client saw `seen`
+        late = self.add_event()
+        seen = self.add_event()
+        newer = self.add_event()
+
+        self.assertEqual(self.replay(seen.id), [late.id, seen.id, newer.id])
+        self.assertEqual(self.replay(0), [old.id, late.id, seen.id, newer.id])
+
+    def test_prune(self):
+        kept = self.add_event()
+        pruned = self.add_event()
+        InboxEvent.objects.filter(pk=pruned.pk).update(
+            created_at=timezone.now() - timedelta(days=settings.INBOX_EVENT_RETENTION_DAYS, minutes=1))
+
+        out = StringIO()
+        call_command("prune_inbox_events", stdout=out)
+        self.assertIn("Deleted 1 ", out.getvalue())
+        self.assertEqual(list(InboxEvent.objects.values_list("pk", flat=True)), [kept.pk])
+        # Resuming from a pruned event needs a resync
+        self.assertIsNone(self.replay(pruned.id))
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite serializes writers, there is no race to test")
+@override_settings(**TEST_SETTINGS)
+class NotificationClaimRaceTests(TransactionTestCase):
+    """Drivers race for one load through the real endpoint, each on its own connection."""
+
+    claimants = 25
+    rounds = 3
+
+    def setUp(self):
+        fakes = fake_external_services()
+        fakes.__enter__()
+        self.addCleanup(fakes.__exit__, None, None, None)
+
+    def test_exactly_one_winner(self):
+        for number in range(self.rounds):
+            with self.subTest(round=number):
+                load, pairs = seed_claim_race(self.claimants, start=number * self.claimants)
+                race = race_claims(pairs)
+
+                self.assertEqual(len(race["winners"]), 1, race["errors"])
+                self.assertEqual(race["rejected"], self.claimants - 1)
+                self.assertEqual(race["deadlocks"], 0)
+                self.assertEqual(race["errors"], [])
+                claim = NotificationClaim.objects.get(load=load)
+                self.assertEqual(claim.claimed_by_id, race["winners"][0])
+                self.assertEqual(DriverNotification.objects.filter(load=load, is_read=True).count(), 1)
+                self.assertFalse(DriverNotification.objects.filter(load=load, is_accepted=False).exists())
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite serializes writers, there is no race to test")
+@override_settings(**TEST_SETTINGS)
+class ReserveClaimRaceTests(TransactionTestCase):
+    """One driver reserves the notification another one claims, at the same instant."""
+
+    rounds = 10
+
+    def setUp(self):
+        fakes = fake_external_services()
+        fakes.__enter__()
+        self.addCleanup(fakes.__exit__, None, None, None)
+
+    def race(self, notification, claimant, reserver):
+        barrier = threading.Barrier(2)
+        results = {}
+
+        def post(name, user, url, data):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+            try:
+                barrier.wait(30)
+                results[name] = client.post(url, data, format="json").data["status"]
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=post, args=(
+                "claim", claimant, f"{reverse('mark-notification-read')}?notification_id={notification.id}",
+                {"is_read": True})),
+            threading.Thread(target=post, args=(
+                "reserve", reserver, f"{reverse('reserve-notification')}?notification_id={notification.id}",
+                {"reserve": True})),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        return results
+
+    def test_claim_or_reservation_wins(self):
+        for number in range(self.rounds):
+            with self.subTest(round=number):
+                load, [(notification, claimant), (_, reserver)] = seed_claim_race(2, start=number * 2)
+                results = self.race(notification, claimant, reserver)
+
+                notification.refresh_from_db()
+                claimed = NotificationClaim.objects.filter(load=load).exists()
+                if results.get("claim") == 200:
+                    self.assertEqual(results.get("reserve"), 409)
+                    self.assertTrue(claimed)
+                    self.assertEqual(notification.reserved_by_id, claimant.id)
+                    self.assertTrue(notification.location_read_lock)
+                else:
+                    self.assertEqual(results, {"claim": 400, "reserve": 200})
+                    self.assertFalse(claimed)
+                    self.assertEqual(notification.reserved_by_id, reserver.id)
+                    self.assertFalse(notification.location_read_lock)
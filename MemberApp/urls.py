@@ -7,12 +7,16 @@ from MemberApp.views import (
     VehicleCapacityListView,
     CreateVehicleCapacityView,
     VehicleImageUploadView,
+    ChunkedUploadInitView,
+    ChunkedUploadChunkView,
+    ChunkedUploadCommitView,
     UserVehicleImagesView,
     DeleteImagesView,
     VehicleNotificationAPIView,
     GetByIdVehicleNotification,
     LocationLockedNotifications,
     MarkNotificationRead,
+    ReserveNotification,
     DeleteVehicleById,
     GetAllNotifications,
     GetReadNotifications,
@@ -48,6 +52,11 @@ urlpatterns = [
     # uplode image
     path("upload-images", VehicleImageUploadView.as_view(), name="upload-images"),
     #
+    # resumable upload: start, send chunks / check offset, commit
+    path("upload-images/init", ChunkedUploadInitView.as_view(), name="upload-images-init"),
+    path("upload-images/chunk", ChunkedUploadChunkView.as_view(), name="upload-images-chunk"),
+    path("upload-images/commit", ChunkedUploadCommitView.as_view(), name="upload-images-commit"),
+    #
     # view all images according to
     path("vehicle/images", UserVehicleImagesView.as_view(), name="user-vehicle-images"),
     #
@@ -81,6 +90,13 @@ urlpatterns = [
         name="mark-notification-read",
     ),
     #
+    # Hold a notification for a few minutes before claiming it
+    path(
+        "notifications/reserve/",
+        ReserveNotification.as_view(),
+        name="reserve-notification",
+    ),
+    #
     # delete vehicle by id
     path("delete-vehicle", DeleteVehicleById.as_view(), name="delete-vehicle"),
     #
@@ -0,0 +1,83 @@
+import os
+import uuid
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Filesystem clean-up that should not hold up the request thread
+file_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="file-cleanup")
+
+
+def _remove_file(name: str):
+    try:
+        default_storage.delete(name)
+    except Exception as e:
+        logger.error(f"Error deleting file {name}: {str(e)}")
+
+
+def schedule_file_deletion(names):
+    """Unlink the given storage names in the background."""
+    for name in names:
+        if name:
+            file_executor.submit(_remove_file, name)
+
+
+def remove_upload_part(path: str):
+    """Remove the temporary file of a chunked upload, `manage.py prune_uploads` collects any leftovers."""
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.error(f"Error deleting file {path}: {str(e)}")
+
+
+def encode_cursor(created_at, pk) -> str:
+    """Opaque keyset cursor pointing just after (created_at, pk)."""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """The (created_at, pk) of a cursor, ValueError for anything encode_cursor did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, pk = raw.split("|", 1)
+        created_at = parse_datetime(created_at)
+        # Checked here, a malformed pk would only fail inside the queryset
+        pk = uuid.UUID(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+    if created_at is None:
+        raise ValueError("Invalid cursor.")
+    return created_at, pk
+
+
+def paginate_by_created_at(queryset, cursor=None, limit=50):
+    """
+    Keyset pagination over (-created_at, -id). Returns the rows of the page
+    and the cursor for the next page (None on the last page).
+    """
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+    return rows, next_cursor
+
+
+def get_page_limit(value, default=50, maximum=200) -> int:
+    if value and str(value).isdigit():
+        return max(1, min(int(value), maximum))
+    return default
@@ -1,4 +1,4 @@
-from rest_framework import status
+from rest_framework import status, serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import RetrieveAPIView
@@ -6,19 +6,31 @@ from rest_framework.permissions import BasePermission
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, JSONParser
 
-from AdminApp.renderers import UserRenderer
+from AdminApp.renderers import UserRenderer, StreamingJSONResponse
+from AdminApp.conditional import Validators
+from AdminApp.async_views import AsyncAPIView
+from AdminApp.routers import ReplicaReadMixin
+from AdminApp.metrics import request_metrics
 
 import asyncio
+import hashlib
+from asgiref.sync import sync_to_async
 from googletrans import Translator
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction, connection
+from django.core.exceptions import ValidationError
 from datetime import datetime
 
-from MemberApp.models import VehicleInfo, VehicleImage, DriverNotification, UserFCMDevice, Display, RolePermissionConfig
+from MemberApp.models import VehicleInfo, VehicleImage, DriverNotification, UserFCMDevice, Display, RolePermissionConfig, VehicleImageUpload, Load
 
-from services.notification_service import send_push_notification
-from django.db.models import Q
+from services.notification_service import device_tokens, send_push_to_devices
+from services.inbox_service import publish_created, publish_withdrawn
+from MemberApp.utils import paginate_by_created_at, get_page_limit
+from django.db.models import Q, Value, Count, Max, Exists, OuterRef
+from django.contrib.postgres.aggregates import ArrayAgg
 from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
@@ -29,7 +41,8 @@ from MemberApp.serializers import CreateVehicleInfoSerializer, GetAllVehicleInfo
     GetByIdVehicleInfoSerializer, UpdateVehicleInfoByIDSerializer, VehicleCapacitySerializer, \
     CreateVehicleCapacitySerializer, CreateDocumentSerializer, DeleteDocumentSerializer, \
     VehicleImageSerializer, VehicleNotificationCreateSerializer, BulkVehicleNotificationSerializer, GetVehicleNotificationByIdSerializer, NotificationDetailSerializer, NotificationReadSerializer, \
-    ReadNotificationSerializer, UpdateNotificationByIdSerializer, UserBasicSerializer
+    ReadNotificationSerializer, UpdateNotificationByIdSerializer, UserBasicSerializer, \
+    ChunkedUploadInitSerializer, ChunkedUploadCommitSerializer
 
 import logging
 
@@ -39,8 +52,11 @@ logger = logging.getLogger(__name__)
 # Create your views here.
 
 async def translate_text(text, target_language):
-    cache_key = f"translation_{target_language}_{hash(text)}"
-    cached = cache.get(cache_key)
+    # hash() is salted per process, every worker must compute the same key
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    cache_key = f"translation_{target_language}_{digest}"
+    cached = await cache.aget(cache_key)
+    request_metrics.record_cache("translation", hit=bool(cached))
     if cached:
         return cached
     
@@ -48,7 +64,7 @@ async def translate_text(text, target_language):
         translated = await translator.translate(text, dest=target_language)
         if translated.text == text and target_language == "hi":
             translated = await translator.translate(text, dest="mr")
-        cache.set(cache_key, translated.text, 60*60*24*30) # Cache for 30 days (in seconds)
+        await cache.aset(cache_key, translated.text, 60*60*24*30) # Cache for 30 days (in seconds)
         return translated.text
 
 class IsAdminUser(BasePermission):
@@ -67,17 +83,25 @@ class CreateVehicleAPI(APIView):
         return Response({"message": "Vehicle information created successfully", "vehicle_id": vehicle_id}, status=status.HTTP_201_CREATED)
 
 
-class GetAllVehicleInfoAPI(APIView):
+class GetAllVehicleInfoAPI(ReplicaReadMixin, APIView):
     renderer_classes = [UserRenderer]
     permission_classes = [IsAuthenticated]
+    query_budget = 4
 
     def get(self, request, *args, **kwargs):
         try:
-            vehicles = VehicleInfo.objects.all().order_by('id')
-            for vehicle in vehicles:
-                vehicle.update_status()
+            vehicles = VehicleInfo.objects.select_related('capacity').order_by('id')
+
+            # The serialized capacity can change, or be deleted, without a vehicle write
+            validators = Validators.for_queryset(
+                request, vehicles,
+                capacity_modified=Max('capacity__updated_at'), capacities=Count('capacity'))
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+
             serializer = GetAllVehicleInfoSerializer(vehicles, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return validators.apply(Response(serializer.data, status=status.HTTP_200_OK))
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
             error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
@@ -94,9 +118,15 @@ class GetByIdVehicleInfo(RetrieveAPIView):
     def get(self, request, *args, **kwargs):
         try:
             vehicle_id = request.query_params.get('vehicle_id', None)
-            vehicle = VehicleInfo.objects.get(id=vehicle_id)
+            vehicle = VehicleInfo.objects.select_related('capacity').get(id=vehicle_id)
+
+            validators = Validators.for_instance(request, vehicle)
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+
             serializer = GetByIdVehicleInfoSerializer(vehicle)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return validators.apply(Response(serializer.data, status=status.HTTP_200_OK))
         except VehicleInfo.DoesNotExist:
             return Response({"error": "Vehicle not found"}, status=404)
 
@@ -127,9 +157,7 @@ class VehicleCapacityListView(APIView):
 
     def get(self, request, *args, **kwargs):
         try:
-            capacities = VehicleInfo.objects.all()
-            for vehicle in capacities:
-                vehicle.update_status()
+            capacities = VehicleInfo.objects.select_related('capacity')
             serializer = VehicleCapacitySerializer(capacities, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -174,6 +202,113 @@ class VehicleImageUploadView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Resumable upload: init -> PUT chunks -> commit
+class ChunkedUploadInitView(APIView):
+    """API View for starting a resumable VehicleImage upload."""
+    renderer_classes = [UserRenderer]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = ChunkedUploadInitSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            upload = serializer.save(created_by=request.user)
+            return Response({
+                "upload_id": str(upload.id),
+                "offset": upload.offset,
+                "total_size": upload.total_size,
+            }, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ChunkedUploadChunkView(APIView):
+    """API View for resuming (GET) and appending chunks (PUT) to an upload."""
+    renderer_classes = [UserRenderer]
+    permission_classes = [IsAuthenticated]
+
+    def get_upload(self, request):
+        upload_id = request.query_params.get('upload_id', None)
+        try:
+            return VehicleImageUpload.objects.get(
+                id=upload_id,
+                created_by=request.user,
+                status=VehicleImageUpload.StatusChoices.UPLOADING,
+            )
+        except (ValueError, ValidationError, VehicleImageUpload.DoesNotExist):
+            return None
+
+    def get(self, request, *args, **kwargs):
+        upload = self.get_upload(request)
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "upload_id": str(upload.id),
+            "offset": upload.offset,
+            "total_size": upload.total_size,
+        }, status=status.HTTP_200_OK)
+
+    def put(self, request, *args, **kwargs):
+        upload = self.get_upload(request)
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        offset = request.query_params.get('offset', None)
+        if offset is None or not offset.isdigit():
+            return Response({"error": "A numeric offset is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Chunks must be appended at the server's offset, the client resumes from there
+        if int(offset) != upload.offset:
+            return Response({
+                "error": "Offset mismatch",
+                "offset": upload.offset,
+            }, status=status.HTTP_409_CONFLICT)
+
+        written = upload.write_chunk(request.stream, upload.offset) if request.stream else 0
+        if written == upload.OFFSET_CONFLICT:
+            # A concurrent PUT advanced the offset first
+            upload.refresh_from_db(fields=["offset"])
+            return Response({
+                "error": "Offset mismatch",
+                "offset": upload.offset,
+            }, status=status.HTTP_409_CONFLICT)
+        if written is None:
+            return Response({
+                "error": "Chunk exceeds the declared file size",
+                "offset": upload.offset,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "upload_id": str(upload.id),
+            "offset": upload.offset,
+            "total_size": upload.total_size,
+        }, status=status.HTTP_200_OK)
+
+
+class ChunkedUploadCommitView(APIView):
+    """API View for verifying a finished upload and creating the VehicleImage."""
+    renderer_classes = [UserRenderer]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        upload_id = request.query_params.get('upload_id', None)
+        try:
+            upload = VehicleImageUpload.objects.select_related('vehicle').get(
+                id=upload_id, created_by=request.user)
+        except (ValueError, ValidationError, VehicleImageUpload.DoesNotExist):
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ChunkedUploadCommitSerializer(upload, data={})
+        if serializer.is_valid():
+            try:
+                vehicle_image = serializer.save()
+            except serializers.ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                "message": "Images uploaded successfully!",
+                "image_id": str(vehicle_image.id),
+            }, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 # API for get all images uploaded earlier
 class UserVehicleImagesView(APIView):
     """API View to retrieve all VehicleImage instances for a specific user."""
@@ -183,7 +318,7 @@ class UserVehicleImagesView(APIView):
     def get(self, request, *args, **kwargs):
         # Filter images by user_id (assuming a relationship exists between Vehicle and User)
         user_id = request.query_params.get('user_id', None)
-        images = VehicleImage.objects.filter(vehicle_id=user_id)
+        images = VehicleImage.objects.filter(vehicle_id=user_id).select_related('vehicle__capacity')
 
         if not images.exists():
             return Response(
@@ -204,8 +339,7 @@ class DeleteImagesView(APIView):
     def delete(self, request, *args, **kwargs):
         serializer = DeleteDocumentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user_id = request.query_params.get('user_id', None)
-        deleted_count, errors = serializer.delete_images(user_id)
+        deleted_count, errors = serializer.delete_images()
 
         response_data = {
             "message": f"{deleted_count} images were successfully deleted."}
@@ -214,16 +348,30 @@ class DeleteImagesView(APIView):
 
         return Response(response_data, status=status.HTTP_200_OK)
 
-class VehicleNotificationAPIView(APIView):
+class VehicleNotificationAPIView(AsyncAPIView):
     renderer_classes = [UserRenderer]
     permission_classes = [IsAuthenticated]
 
-    def post(self, request):
+    async def post(self, request):
+        pushes = []
         if 'vehicle_ids' in request.data and 'notifications' in request.data:
-            return self.handle_bulk_create(request)
-        return self.handle_single_create(request)
+            response = await sync_to_async(self.handle_bulk_create)(request, pushes)
+        else:
+            response = await sync_to_async(self.handle_single_create)(request, pushes)
+
+        # FCM is slow and needs no database, every push is sent at once off the request thread
+        tokens = await sync_to_async(device_tokens)({push["user_id"] for push in pushes} - {None})
+        send = sync_to_async(send_push_to_devices, thread_sensitive=False)
+        await asyncio.gather(*(
+            send(tokens[push["user_id"]], push["title"], push["body"], push["data"])
+            for push in pushes if push["user_id"] in tokens
+        ))
+        return Response(response)
 
-    def handle_single_create(self, request):
+    def queue_push(self, pushes, user, title, body, data):
+        pushes.append({"user_id": user, "title": title, "body": body, "data": data})
+
+    def handle_single_create(self, request, pushes):
         response = {"status": 400}
         serializer = VehicleNotificationCreateSerializer(data=request.data)
         if serializer.is_valid():
@@ -236,11 +384,18 @@ class VehicleNotificationAPIView(APIView):
                 response["status"] = 400
                 response["message"] = "User not found"
 
+            load = Load.objects.create(
+                source=serializer.validated_data.get('source', ''),
+                destination=serializer.validated_data.get('destination', ''),
+                created_by=request.user,
+            )
             notification = DriverNotification.objects.create(
                 vehicle=vehicle,
                 created_by=request.user,
+                load=load,
                 **serializer.validated_data
             )
+            publish_created([notification])
 
             # Send push notification with all details
             notification_data = {
@@ -255,7 +410,8 @@ class VehicleNotificationAPIView(APIView):
                 "contact": notification.contact,
             }
 
-            send_push_notification(
+            self.queue_push(
+                pushes,
                 user=user,
                 title=f"New Delivery: {notification.source} to \n {notification.destination}",
                 body=f"Vehicle Type: {vehicle.model} \n Body Type: {vehicle.vehicle_type}",
@@ -266,11 +422,12 @@ class VehicleNotificationAPIView(APIView):
             response["message"] = "Notification created successfully"
             response["notification_id"] = str(notification.id)
             response["vehicle_id"] = str(vehicle_id)
+        else:
+            response["status"] = 400
+            response["message"] = "Invalid data"
+        return response
 
-        response["status"] = 400
-        response["message"] = "Invalid data"
-
-    def handle_bulk_create(self, request):
+    def handle_bulk_create(self, request, pushes):
         response = {"status": 400}
         try:
             # Transform data if coming in the {0: {...}, 1: {...}} format
@@ -288,8 +445,19 @@ class VehicleNotificationAPIView(APIView):
             notifications_data = bulk_serializer.validated_data['notifications']
 
             created_notifications = []
+            created_objects = []
             errors = []
 
+            # Each load is broadcast to every vehicle, all copies share one Load
+            loads = [
+                Load.objects.create(
+                    source=notification_data.get('source', ''),
+                    destination=notification_data.get('destination', ''),
+                    created_by=request.user,
+                )
+                for notification_data in notifications_data
+            ]
+
             for vehicle_id in vehicle_ids:
                 vehicle = VehicleInfo.objects.get(id=vehicle_id)
                 user = User.objects.filter(number=vehicle.alternate_number).first()
@@ -299,15 +467,17 @@ class VehicleNotificationAPIView(APIView):
                     response["status"] = 400
                     response["message"] = "User not found"
 
-                for notification_data in notifications_data:
+                for load, notification_data in zip(loads, notifications_data):
                     # Remove vehicle_id from notification data if present
                     notification_data.pop('vehicle_id', None)
 
                     notification = DriverNotification.objects.create(
                         vehicle=vehicle,
                         created_by=request.user,
+                        load=load,
                         **notification_data
                     )
+                    created_objects.append(notification)
 
                     # Send push notification with all details
                     notification_data = {
@@ -322,7 +492,8 @@ class VehicleNotificationAPIView(APIView):
                         "contact": notification.contact,
                     }
 
-                    send_push_notification(
+                    self.queue_push(
+                        pushes,
                         user=user,
                         title=f"New Delivery: {notification.source} to \n {notification.destination}",
                         body=f"Vehicle Type: {vehicle.model} \n Body Type: {vehicle.vehicle_type}",
@@ -343,27 +514,30 @@ class VehicleNotificationAPIView(APIView):
                     response["status"] = status_code
                     response["data"] = response_data
 
+            # Push the new loads to connected drivers
+            publish_created(created_objects)
+
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
             error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
             error += f"\nLine: {e.__traceback__.tb_lineno}"
             error += f"\nMessage: {str(e)}"
             logger.error(error)
-        return Response(response)
+        return response
 
 
-class GetByIdVehicleNotification(APIView):
+class GetByIdVehicleNotification(AsyncAPIView):
     renderer_classes = [UserRenderer]
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         response = {"status": 400}
         try:
             vehicle_id = request.query_params.get('vehicle_id', None)
             lang = request.query_params.get('lang', 'en')
 
-            vehicle = VehicleInfo.objects.get(id=vehicle_id)
-            notifications = DriverNotification.objects.filter(vehicle=vehicle)
+            vehicle = await VehicleInfo.objects.aget(id=vehicle_id)
+            notifications = DriverNotification.objects.filter(vehicle=vehicle).select_related('created_by')
 
             # Apply optional filters
             is_read = request.query_params.get('is_read')
@@ -371,6 +545,11 @@ class GetByIdVehicleNotification(APIView):
                 notifications = notifications.filter(
                     is_read=is_read.lower() == 'true')
 
+            validators = await sync_to_async(Validators.for_queryset)(request, notifications)
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+
             # Apply sorting
             sort = request.query_params.get('sort', 'desc')
             if sort == 'asc':
@@ -383,24 +562,27 @@ class GetByIdVehicleNotification(APIView):
             if limit and limit.isdigit():
                 notifications = notifications[:int(limit)]
 
+            rows = [notification async for notification in notifications]
             serializer = GetVehicleNotificationByIdSerializer(
-                notifications, many=True)
-            
-            if serializer.data:
-                for notification in serializer.data:
-                    if 'source' in notification and notification['source']:
-                        notification['source'] = asyncio.run(translate_text(notification['source'], target_language=lang))
+                rows, many=True)
 
-                    if 'destination' in notification and notification['destination']:
-                        notification['destination'] = asyncio.run(translate_text(notification['destination'], target_language=lang))
-
-                    if 'message' in notification and notification['message']:
-                        notification['message'] = asyncio.run(translate_text(notification['message'], target_language=lang))
+            # Every text of the page is translated concurrently
+            texts = [
+                (notification, field) for notification in serializer.data
+                for field in ('source', 'destination', 'message')
+                if notification.get(field)
+            ]
+            translations = await asyncio.gather(*(
+                translate_text(notification[field], target_language=lang) for notification, field in texts
+            ))
+            for (notification, field), translation in zip(texts, translations):
+                notification[field] = translation
 
             response["status"] = 200
             response["vehicle_number"] = vehicle.vehicle_number
-            response["count"] = notifications.count()
+            response["count"] = len(rows)
             response["notifications"] = serializer.data
+            return validators.apply(Response(response))
 
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
@@ -419,14 +601,57 @@ class LocationLockedNotifications(APIView):
         response = {"status": 400}
         
         try:
-            notifications = DriverNotification.objects.filter(
-                Q(location_read_lock=False) |
-                Q(is_read=True, reserved_by=request.user)
-            ).distinct()
+            cursor = request.query_params.get('cursor', None)
+            since = request.query_params.get('since', None)
+            limit = get_page_limit(request.query_params.get('limit'))
+
+            # Both predicates are covered by partial indexes, loads another
+            # driver holds a live reservation on are left out
+            now = timezone.now()
+            inbox = DriverNotification.available_to(request.user, now) | Q(is_read=True, reserved_by=request.user)
+            notifications = DriverNotification.objects.filter(inbox).select_related(
+                'created_by', 'vehicle', 'reserved_by')
+            versioned = notifications
+
+            # Only fetch what changed after the client's last sync: rows written
+            # since then, and rows whose hold ran out without a write
+            removed = None
+            if since:
+                since_date = parse_datetime(since)
+                if since_date is None:
+                    response["message"] = "Invalid since parameter"
+                    return Response(response)
+                changed = DriverNotification.objects.filter(
+                    Q(updated_at__gt=since_date) | Q(reserved_until__gt=since_date, reserved_until__lte=now))
+                notifications = notifications.filter(pk__in=changed.values('pk'))
+                # Rows that left the inbox (claimed, held by another driver),
+                # sent once on the first page so the client can drop them
+                if not cursor:
+                    removed = changed.filter(updated_at__gt=since_date).exclude(inbox)
+                versioned = changed
+
+            # Reservations expire before the sweeper writes, count the live ones too
+            validators = Validators.for_queryset(
+                request, versioned,
+                reserved=Count('pk', filter=Q(reserved_until__gt=now)),
+            )
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
 
-            serializer = NotificationDetailSerializer(notifications, many=True)
+            try:
+                page, next_cursor = paginate_by_created_at(notifications, cursor, limit)
+            except ValueError as e:
+                response["message"] = str(e)
+                return Response(response)
+
+            serializer = NotificationDetailSerializer(page, many=True)
             response["status"] = 200
             response["data"] = serializer.data
+            response["next_cursor"] = next_cursor
+            if removed is not None:
+                response["removed"] = [str(pk) for pk in removed.values_list('pk', flat=True)]
+            return validators.apply(Response(response))
 
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
@@ -449,20 +674,18 @@ class MarkNotificationRead(APIView):
             notification = DriverNotification.objects.get(id=notification_id)
 
             serializer = NotificationReadSerializer(
-                notification, data=request.data, partial=True)
-            
+                notification, data=request.data, partial=True, context={"request": request})
+
             if serializer.is_valid():
-                serializer.save()
+                try:
+                    serializer.save()
+                except serializers.ValidationError as e:
+                    return self.claim_error_response(e.detail)
                 response["status"] = 200
                 response["data"] = NotificationDetailSerializer(
                     notification).data
             else:
-                error_data = serializer.errors.get("is_read", {})
-                response["status"] = 400
-                response["vehicle_id"] = str(error_data.get("vehicle_id", ""))
-                response["is_accepted"] = str(error_data.get("is_accepted", ""))
-                response["msg"] = str(error_data.get("msg", "Validation error."))
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
+                return self.claim_error_response(serializer.errors)
 
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
@@ -472,6 +695,54 @@ class MarkNotificationRead(APIView):
             logger.error(error)
         return Response(response)
 
+    def claim_error_response(self, errors):
+        error_data = errors.get("is_read", {})
+        if not isinstance(error_data, dict):
+            error_data = {"msg": error_data[0] if error_data else "Validation error."}
+        response = {"status": 400}
+        response["vehicle_id"] = str(error_data.get("vehicle_id", ""))
+        response["is_accepted"] = str(error_data.get("is_accepted", ""))
+        response["msg"] = str(error_data.get("msg", "Validation error."))
+        return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ReserveNotification(APIView):
+    renderer_classes = [UserRenderer]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        response = {"status": 400}
+
+        try:
+            notification_id = request.query_params.get('notification_id', None)
+            notification = DriverNotification.objects.get(id=notification_id)
+
+            # {"reserve": false} gives the hold back
+            if request.data.get("reserve", True):
+                done = notification.reserve(request.user)
+                message = "This notification is not available."
+            else:
+                done = notification.unreserve(request.user)
+                message = "This notification is not reserved by you."
+
+            if done:
+                response["status"] = 200
+                response["reserved_until"] = notification.reserved_until
+            else:
+                response["status"] = 409
+                response["msg"] = message
+
+        except DriverNotification.DoesNotExist:
+            response["status"] = 404
+            response["msg"] = "Notification not found."
+        except Exception as e:
+            error = f"\nType: {type(e).__name__}"
+            error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+            error += f"\nLine: {e.__traceback__.tb_lineno}"
+            error += f"\nMessage: {str(e)}"
+            logger.error(error)
+        return Response(response)
+
 
 class DeleteVehicleById(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
@@ -501,9 +772,10 @@ class DeleteVehicleById(APIView):
         return Response(response)
 
 
-class GetAllNotifications(APIView):
+class GetAllNotifications(ReplicaReadMixin, APIView):
     renderer_classes = [UserRenderer]
     permission_classes = [IsAuthenticated]
+    query_budget = 8
 
     def get(self, request, *args, **kwargs):
         response = {"status": 400}
@@ -512,8 +784,11 @@ class GetAllNotifications(APIView):
             is_accepted = request.query_params.get("is_accepted", None)
             creator_name = request.query_params.get("username", None)
             filter_by_date = request.query_params.get("date", None)
+            cursor = request.query_params.get("cursor", None)
+            limit = get_page_limit(request.query_params.get("limit"))
 
-            notifications = DriverNotification.objects.select_related('created_by').all()
+            notifications = DriverNotification.objects.select_related('created_by', 'reserved_by', 'vehicle').all()
+            rejected = False
 
             # Apply filters
             if is_read is not None and is_accepted is not None:
@@ -529,6 +804,7 @@ class GetAllNotifications(APIView):
 
                 elif is_accepted_bool and not is_read_bool:
                     # Rejected notifications
+                    rejected = True
                     notifications = notifications.filter(
                         is_read=False,
                         is_accepted=True,
@@ -540,7 +816,11 @@ class GetAllNotifications(APIView):
                         is_read=False,
                         is_accepted=False,
                     )
-            
+
+            # Copies another driver claimed first are only listed when asked for
+            if not rejected:
+                notifications = notifications.exclude(is_read=False, is_accepted=True)
+
             if creator_name:
                 notifications = notifications.filter(
                     created_by__name=creator_name
@@ -552,18 +832,22 @@ class GetAllNotifications(APIView):
                     date=filter_date
                 )
 
-            creator_ids = notifications.values_list('created_by', flat=True).distinct()
-            creators = User.objects.filter(id__in=creator_ids)
+            try:
+                page, next_cursor = paginate_by_created_at(notifications, cursor, limit)
+            except ValueError as e:
+                response["message"] = str(e)
+                return Response(response)
 
-            serializer = NotificationDetailSerializer(notifications, many=True)
-            filtered_data = [
-                item for item in serializer.data
-                if not (item.get("is_read") is False and item.get("is_accepted") is True)
-            ]
-            creator_serializer = UserBasicSerializer(creators, many=True)
             response["status"] = 200
-            response["data"] = filtered_data
-            response["creators"] = creator_serializer.data
+            response["data"] = NotificationDetailSerializer(page, many=True).data
+            response["next_cursor"] = next_cursor
+            # Creators do not change between pages, only the first one carries them
+            if not cursor:
+                creators = User.objects.filter(
+                    Exists(notifications.filter(created_by=OuterRef('pk')))
+                ).only('id', 'email', 'name', 'number').order_by('name')
+                response["creators"] = UserBasicSerializer(creators, many=True).data
+            return Response(response)
 
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
@@ -574,17 +858,18 @@ class GetAllNotifications(APIView):
         return Response(response)
 
 
-class GetReadNotifications(APIView):
+class GetReadNotifications(ReplicaReadMixin, APIView):
     renderer_classes = [UserRenderer]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         response = {"status": 400}
         try:
-            notifications = DriverNotification.objects.filter(is_read=True)
-            serializer = ReadNotificationSerializer(notifications, many=True)
-            response["status"] = 200
-            response["data"] = serializer.data
+            notifications = DriverNotification.objects.filter(is_read=True).select_related(
+                'vehicle', 'created_by', 'reserved_by', 'load')
+            serializer = ReadNotificationSerializer()
+            return StreamingJSONResponse(
+                request, notifications, serializer.to_representation, envelope={"status": 200})
 
         except Exception as e:
             error = f"\nType: {type(e).__name__}"
@@ -650,6 +935,7 @@ class BulkDeleteNotifications(APIView):
                 response["message"] = "Notification IDs are invalid"
 
             if valid_notifications:
+                publish_withdrawn(valid_notifications)
                 for notification in valid_notifications:
                     notification.delete()
                     response["status"] = 200
@@ -675,7 +961,8 @@ class GetNotificationByIdView(APIView):
             if not notification_id:
                 response["status"] = 400
                 response["message"] = "No notification ID provided"
-            notification = DriverNotification.objects.get(id=notification_id)
+            notification = DriverNotification.objects.select_related(
+                'created_by', 'reserved_by', 'vehicle').get(id=notification_id)
             serializer = NotificationDetailSerializer(notification)
             if serializer:
                 response["status"] = 200
@@ -738,32 +1025,25 @@ class CreateDisplayPermissionsView(APIView):
             if role not in ['staff', 'admin']:
                 response["status"] = 400
                 response["message"] = "Role must be either 'staff' or 'admin'"
+                return Response(response)
 
             if not items:
                 response["status"] = 400
                 response["message"] = "Items list cannot be empty."
+                return Response(response)
 
-            # Get all users of this role
-            users = User.objects.filter(role=role)
+            with transaction.atomic():
+                # Only add the missing rows and drop the ones no longer wanted
+                user_count = Display.sync_role_items(role, items)
 
-            # First remove all existing permissions for this role
-            Display.objects.filter(user__role=role).delete()
-
-            for user in users:
-                for item in items:
-                    Display.objects.get_or_create(user=user, items=item)
-
-            # Also set default permissions for future users
-            role_config, created = RolePermissionConfig.objects.get_or_create(
-                role=role,
-                defaults={'items': items}
-            )
-            if not created:
-                role_config.items = items
-                role_config.save()
+                # Also set default permissions for future users
+                RolePermissionConfig.objects.update_or_create(
+                    role=role,
+                    defaults={'items': items}
+                )
 
             response["status"] = 201
-            response["message"] = f"Permissions updated for {len(users)} {role} users"
+            response["message"] = f"Permissions updated for {user_count} {role} users"
 
         except Exception as e:
                 error = f"\nType: {type(e).__name__}"
@@ -775,6 +1055,7 @@ class CreateDisplayPermissionsView(APIView):
     
 class GetDisplayPermissionsView(APIView):
     permission_classes=[IsAuthenticated]
+    query_budget = 6
 
     def get(self, request, *args, **kwargs):
         response = { "status": 400 }
@@ -786,18 +1067,32 @@ class GetDisplayPermissionsView(APIView):
                 response["status"] = 400
                 response["message"] = "Role parameter must be either 'staff' or 'admin'"
 
-            if role == "staff":
-                users = User.objects.filter(role="staff")
-            else:
-                users = User.objects.filter(role="admin")
+            if role != "staff":
+                role = "admin"
+
+            role_items = Display.role_items(role)
+            users = User.objects.filter(role=role).order_by('id')
 
-            roles_and_items = []
-            for user in users:
-                accessible_items = Display.get_user_items(user)
-                roles_and_items.append({
-                    "role": user.role,
-                    "items": accessible_items
-                })
+            if connection.vendor == "postgresql":
+                # One grouped query instead of one query per user
+                rows = users.annotate(
+                    accessible_items=ArrayAgg('display__items', distinct=True, default=Value([]))
+                ).values_list('role', 'accessible_items')
+            else:
+                grouped = {}
+                for user_id, user_role, item in users.values_list('id', 'role', 'display__items'):
+                    entry = grouped.setdefault(user_id, (user_role, []))
+                    if item is not None:
+                        entry[1].append(item)
+                rows = grouped.values()
+
+            roles_and_items = [
+                {
+                    "role": user_role,
+                    "items": sorted(role_items.union(item for item in items if item))
+                }
+                for user_role, items in rows
+            ]
 
             response["status"] = 200
             response["data"] = roles_and_items
@@ -846,13 +1141,13 @@ class VerifyDocumentView(APIView):
 
             if vehicle.images.count() >= 6:
                 vehicle.status = vehicle.StatusChoices.COMPLETED
-                vehicle.save(update_fields=["status"])
+                vehicle.save(update_fields=["status", "updated_at"])
             elif vehicle.images.count() == 0:
                 vehicle.status = vehicle.StatusChoices.IN_COMPLETE
-                vehicle.save(update_fields=["status"])
+                vehicle.save(update_fields=["status", "updated_at"])
             else:
                 vehicle.status = vehicle.StatusChoices.IN_PROGRESS
-                vehicle.save(update_fields=["status"])
+                vehicle.save(update_fields=["status", "updated_at"])
 
             response["status"] = 200
             response["message"] = "Verification complete"
@@ -0,0 +1,294 @@
+"""
+Load-testing harness for the hot API paths.
+
+Spins up the ASGI application in-process against a throwaway test database
+(Postgres, or SQLite with DATABASE_ENGINE=sqlite3), seeds it at each scale
+with the query-count test fixtures and drives the endpoints concurrently
+through httpx. Latency percentiles and RPS are written as JSON so two
+releases can be compared:
+
+    python Scripts/benchmark.py --scales 500,2000 --requests 200 --concurrency 20 --output before.json
+
+--connections runs the same load once per connection mode, e.g. Postgres
+with a new connection per request against the psycopg pool:
+
+    python Scripts/benchmark.py --connections per-request,pool --output pool.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from collections import Counter
+from itertools import cycle
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import httpx  # noqa: E402
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test.utils import setup_databases, teardown_databases, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from config.asgi import application  # noqa: E402
+from AdminApp.metrics import body_status  # noqa: E402
+from config.testing import (  # noqa: E402
+    DRIVER_COUNT, VEHICLES_PER_LOAD, TEST_SETTINGS, fake_external_services, percentile, seed_fixtures,
+)
+from MemberApp.models import DriverNotification  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+ENDPOINTS = [
+    "locked-notifications",
+    "get-notifications",
+    "mark-read",
+    "all-vehicle-info",
+    "dashboard-summary",
+    "update-location",
+]
+
+CONNECTION_MODES = ("per-request", "pool")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def connection_mode():
+    settings_dict = connections["default"].settings_dict
+    return "pool" if settings_dict.get("OPTIONS", {}).get("pool") else "per-request"
+
+
+def use_connection_mode(mode, pool_options):
+    """
+    Switches the default database between a pool and a new connection per
+    request. The settings dict is shared by every thread's connection.
+    """
+    connection = connections["default"]
+    connection.close()
+    if connection.vendor == "postgresql":
+        connection.close_pool()
+    options = connection.settings_dict.setdefault("OPTIONS", {})
+    if mode == "pool":
+        options["pool"] = pool_options or True
+    else:
+        options.pop("pool", None)
+    connection.settings_dict["CONN_MAX_AGE"] = 0
+
+
+def build_requests(fixtures):
+    """One request factory per endpoint, each call returns (method, url, kwargs)."""
+    admin = {"Authorization": f"Bearer {AccessToken.for_user(fixtures['admin'])}"}
+    driver_user = fixtures["drivers"][0]
+    driver = {"Authorization": f"Bearer {AccessToken.for_user(driver_user)}"}
+    vehicles = cycle(fixtures["vehicles"])
+    phones = cycle(user.number for user in fixtures["drivers"])
+    # One open notification per load, every claim after the first one of a load is a conflict
+    open_notifications = iter({
+        load_id: notification_id for notification_id, load_id in
+        DriverNotification.objects.filter(is_accepted=False).values_list("id", "load_id")
+    }.values())
+
+    def mark_read():
+        notification_id = next(open_notifications, None)
+        return "POST", f"{reverse('mark-notification-read')}?notification_id={notification_id}", {
+            "headers": driver, "json": {"is_read": True}}
+
+    return {
+        "locked-notifications": lambda: ("GET", reverse("locked-notifications"), {"headers": driver}),
+        "get-notifications": lambda: ("GET", reverse("get-notifications"), {
+            "headers": admin, "params": {"vehicle_id": str(next(vehicles).id), "lang": "en"}}),
+        "mark-read": mark_read,
+        "all-vehicle-info": lambda: ("GET", reverse("all-vehicle-info"), {"headers": admin}),
+        "dashboard-summary": lambda: ("GET", reverse("dashboard-view"), {"headers": admin}),
+        "update-location": lambda: ("POST", reverse("update_location"), {"json": {
+            "phone": next(phones), "latitude": "21.1702", "longitude": "72.8311",
+            "location_status": "ON_LOCATION"}}),
+    }
+
+
+def status_label(response):
+    try:
+        reported = body_status(response.json())
+    except ValueError:
+        reported = None
+    if reported is None or reported == response.status_code:
+        return response.status_code
+    return f"{response.status_code}/{reported}"
+
+
+def is_error(label):
+    """
+    Exceptions and 4xx/5xx statuses. A failure counts the same whether the
+    view sent it as the HTTP code or reported it in the body.
+    """
+    if isinstance(label, int):
+        return label >= 400
+    code, _, reported = label.partition("/")
+    if not reported:
+        # The name of the exception the request raised
+        return True
+    return max(int(code), int(reported)) >= 400
+
+
+async def drive(client, make_request, total, concurrency):
+    """
+    Fires `total` requests from `concurrency` workers, returns latencies and
+    status codes. A failure reported in the body is counted as "200/400".
+    """
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            method, url, kwargs = make_request()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                statuses[status_label(response)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def summarize(endpoint, scale, mode, latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    errors = sum(count for label, count in statuses.items() if is_error(label))
+    result = {
+        "endpoint": endpoint,
+        "scale": scale,
+        "connections": mode,
+        "requests": sum(statuses.values()),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items(), key=str)},
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+    if latencies:
+        result.update({
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(latencies[-1], 2),
+        })
+    return result
+
+
+async def run_endpoints(factories, scale, mode, endpoints, total, concurrency, warmup):
+    transport = httpx.ASGITransport(app=application)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        for endpoint in endpoints:
+            await drive(client, factories[endpoint], warmup, 1)
+            latencies, statuses, elapsed = await drive(client, factories[endpoint], total, concurrency)
+            result = summarize(endpoint, scale, mode, latencies, statuses, elapsed)
+            print(f"  {endpoint:<22} p50={result.get('p50_ms')}ms p95={result.get('p95_ms')}ms "
+                  f"p99={result.get('p99_ms')}ms rps={result['rps']}", file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def print_comparison(results, modes):
+    """RPS per endpoint and scale side by side, one column per connection mode."""
+    rps = {(result["endpoint"], result["scale"], result["connections"]): result["rps"] for result in results}
+    print(f"{'endpoint':<22} {'scale':>6} " + " ".join(f"{mode:>12}" for mode in modes), file=sys.stderr)
+    for endpoint, scale in dict.fromkeys((result["endpoint"], result["scale"]) for result in results):
+        print(f"{endpoint:<22} {scale:>6} " + " ".join(
+            f"{rps.get((endpoint, scale, mode))!s:>12}" for mode in modes), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="500,2000",
+                        help=f"comma separated vehicle counts, {VEHICLES_PER_LOAD * 2} notifications per vehicle")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and scale")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--connections",
+                        help=f"comma separated connection modes to compare ({', '.join(CONNECTION_MODES)}), "
+                             "defaults to the configured one")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales.split(",")]
+    endpoints = args.endpoints.split(",")
+    if min(scales) < DRIVER_COUNT:
+        parser.error(f"every scale needs at least {DRIVER_COUNT} vehicles")
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    modes = args.connections.split(",") if args.connections else [connection_mode()]
+    unknown = set(modes) - set(CONNECTION_MODES)
+    if unknown:
+        parser.error(f"unknown connection modes: {', '.join(sorted(unknown))}")
+    if "pool" in modes and connections["default"].vendor != "postgresql":
+        parser.error("the pool connection mode needs Postgres")
+    # The configured sizes and timeouts, or psycopg's defaults
+    pool_options = settings.DATABASES["default"].get("OPTIONS", {}).get("pool")
+
+    # Same isolation as the test suite, outbound calls are faked and nothing leaves the process
+    overrides = override_settings(
+        **TEST_SETTINGS,
+        VEHICLEINFO_BROADCAST_INTERVAL_MS=0,
+        QUERY_BUDGET_STRICT=False,
+        DEBUG=False,
+    )
+    results = []
+    with overrides, fake_external_services():
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for mode in modes:
+                use_connection_mode(mode, pool_options)
+                for scale in scales:
+                    print(f"scale {scale}, connections {mode}", file=sys.stderr)
+                    factories = build_requests(seed_fixtures(scale, scale * 2))
+                    results.extend(asyncio.run(run_endpoints(
+                        factories, scale, mode, endpoints, args.requests, args.concurrency, args.warmup)))
+                    call_command("flush", interactive=False, verbosity=0)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    if len(modes) > 1:
+        print_comparison(results, modes)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "database": settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1],
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "connections": modes,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Stress harness for the notification claim race.
+
+Every round broadcasts one load to --claimants vehicles and has that many
+drivers hit notifications/mark-read at the same instant, each from its own
+thread and DB connection. It checks that every round has exactly one winner
+and reports lock wait times, deadlocks and throughput as JSON. Run it
+against Postgres before and after any change to the claim logic:
+
+    python Scripts/claim_stress.py --claimants 50 --rounds 20 --output claims.json
+
+Exits non-zero if a round ends with no winner or more than one.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment, override_settings,
+)
+
+from config.testing import TEST_SETTINGS, fake_external_services, percentile, race_claims, seed_claim_race  # noqa: E402
+from MemberApp.models import DriverNotification, NotificationClaim  # noqa: E402
+
+
+def distribution(samples):
+    if not samples:
+        return None
+    return {
+        "mean_ms": round(statistics.fmean(samples), 2),
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+def run_round(number, claimants):
+    load, pairs = seed_claim_race(claimants, start=number * claimants)
+    race = race_claims(pairs)
+    claims = NotificationClaim.objects.filter(load=load).count()
+    read = DriverNotification.objects.filter(load=load, is_read=True).count()
+    return {
+        "round": number,
+        "winners": len(race["winners"]),
+        "claims": claims,
+        "read_notifications": read,
+        "consistent": len(race["winners"]) == claims == read == 1,
+        "rejected": race["rejected"],
+        "errors": race["errors"],
+        "deadlocks": race["deadlocks"],
+        "throughput": round(claimants / race["elapsed_s"], 2),
+        "latencies_ms": race["latencies_ms"],
+        "lock_waits_ms": race["lock_waits_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claimants", type=int, default=50, help="concurrent drivers per load")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    rounds = []
+    with override_settings(**TEST_SETTINGS, QUERY_BUDGET_STRICT=False, DEBUG=False), fake_external_services():
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for number in range(args.rounds):
+                result = run_round(number, args.claimants)
+                print(f"round {number:<3} winners={result['winners']} deadlocks={result['deadlocks']} "
+                      f"errors={len(result['errors'])} throughput={result['throughput']}/s", file=sys.stderr)
+                rounds.append(result)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    latencies = sorted(latency for result in rounds for latency in result.pop("latencies_ms"))
+    lock_waits = sorted(wait for result in rounds for wait in result.pop("lock_waits_ms"))
+    report = {
+        "database": settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1],
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "claimants": args.claimants,
+        "rounds": len(rounds),
+        "inconsistent_rounds": [result["round"] for result in rounds if not result["consistent"]],
+        "deadlocks": sum(result["deadlocks"] for result in rounds),
+        "errors": sum(len(result["errors"]) for result in rounds),
+        "throughput": round(statistics.fmean(result["throughput"] for result in rounds), 2) if rounds else None,
+        "latency": distribution(latencies),
+        "lock_wait": distribution(lock_waits),
+        "results": rounds,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+    sys.exit(1 if report["inconsistent_rounds"] else 0)
+
+
+if __name__ == "__main__":
+    main()
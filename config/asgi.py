@@ -12,16 +12,21 @@ import django
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
-import MemberApp.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
+# Routing imports consumers and models, so it has to come after setup()
+import MemberApp.routing  # noqa: E402
+from MemberApp.middleware import JWTAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
-        URLRouter(
-            MemberApp.routing.websocket_urlpatterns
+        JWTAuthMiddleware(
+            URLRouter(
+                MemberApp.routing.websocket_urlpatterns
+            )
         )
     ),
 })
@@ -12,10 +12,12 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 
-from decouple import config
+from decouple import config, Csv
 
 from datetime import timedelta
 
+from copy import deepcopy
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -60,6 +62,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "AdminApp.middleware.QueryMetricsMiddleware",
+    "AdminApp.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -69,8 +73,23 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "AdminApp.middleware.AccessTokenBlacklistMiddleware",
+    "AdminApp.middleware.PrimaryPinMiddleware",
 ]
 
+# Views declaring a query_budget log when they exceed it, or raise when this is set (tests)
+QUERY_BUDGET_STRICT = config("QUERY_BUDGET_STRICT", default=False, cast=bool)
+# Addresses allowed to scrape /api/user/metrics without a token, none by default.
+# REMOTE_ADDR is only the scraper's address when nothing proxies the app: behind
+# a reverse proxy or load balancer every request comes from the proxy, so keep
+# this empty there and scrape with an admin token.
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="", cast=Csv())
+
+# Responses smaller than this are sent uncompressed, streams are always compressed
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", default=1024, cast=int)
+COMPRESSION_GZIP_LEVEL = config("COMPRESSION_GZIP_LEVEL", default=6, cast=int)
+# Brotli is only offered when the package is installed
+COMPRESSION_BROTLI_QUALITY = config("COMPRESSION_BROTLI_QUALITY", default=5, cast=int)
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -92,15 +111,48 @@ TEMPLATES = [
 # WSGI_APPLICATION = 'config.wsgi.application'
 ASGI_APPLICATION = "config.asgi.application"
 
+# Channels and the cache share one Redis server
+REDIS_URL = config("REDIS_URL", default="redis://127.0.0.1:6379")
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+            "hosts": [REDIS_URL],
         },
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        # A database of its own, cache.clear() flushes it whole
+        "LOCATION": config("CACHE_REDIS_URL", default=f"{REDIS_URL}/1"),
+        "KEY_PREFIX": "kana",
+    },
+}
+# Default lifetime of responses cached with AdminApp.caching.cache_response
+VIEW_CACHE_TIMEOUT = config("VIEW_CACHE_TIMEOUT", default=60, cast=int)
+
+# Vehicle changes saved within this window are merged into one broadcast (0 sends immediately)
+VEHICLEINFO_BROADCAST_INTERVAL_MS = config("VEHICLEINFO_BROADCAST_INTERVAL_MS", default=250, cast=int)
+# Changes kept for reconnecting clients, further behind than this they get a fresh snapshot
+VEHICLEINFO_BACKLOG_SIZE = config("VEHICLEINFO_BACKLOG_SIZE", default=1000, cast=int)
+
+# How long a driver holds a reserved notification
+NOTIFICATION_RESERVATION_MINUTES = config("NOTIFICATION_RESERVATION_MINUTES", default=15, cast=int)
+# Seconds between runs of `manage.py release_reservations --loop`
+RESERVATION_SWEEP_INTERVAL = config("RESERVATION_SWEEP_INTERVAL", default=60, cast=int)
+
+# Chunked uploads without a write for this long are deleted by `manage.py prune_uploads`
+CHUNKED_UPLOAD_EXPIRY_HOURS = config("CHUNKED_UPLOAD_EXPIRY_HOURS", default=24, cast=int)
+
+# Days of driver inbox events kept for resuming sockets, see `manage.py prune_inbox_events`
+INBOX_EVENT_RETENTION_DAYS = config("INBOX_EVENT_RETENTION_DAYS", default=7, cast=int)
+# Events are numbered on insert but may commit out of order, a resume replays
+# this many seconds before the client's last event as well
+INBOX_REPLAY_OVERLAP_SECONDS = config("INBOX_REPLAY_OVERLAP_SECONDS", default=30, cast=int)
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -118,18 +170,74 @@ CSRF_TRUSTED_ORIGINS = ["https://api.kanalogistics.co"]
 # Setting this to True can be dangerous, as it allows any website to make cross-origin requests to yours
 CORS_ALLOW_ALL_ORIGINS = True
 
-CORS_ALLOW_METHODS = ["GET", "POST", "DELETE"]
+CORS_ALLOW_METHODS = ["GET", "POST", "PUT", "DELETE"]
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": config("DATABASE_NAME"),
-        "USER": config("DATABASE_USER"),
-        "PASSWORD": config("DATABASE_PASSWORD"),
-        "HOST": config("DATABASE_HOST"),
-        "PORT": config("DATABASE_PORT"),
+# "sqlite3" is a fallback for local benchmarks and tests without a Postgres server
+DATABASE_ENGINE = config("DATABASE_ENGINE", default="postgresql")
+
+if DATABASE_ENGINE == "sqlite3":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / config("DATABASE_NAME", default="db.sqlite3"),
+        }
     }
-}
+    # A copy of the database file stands in for a lagging replica
+    if config("DATABASE_REPLICA_NAME", default=""):
+        DATABASES["replica"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / config("DATABASE_REPLICA_NAME"),
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    # Under ASGI every request runs on a new thread, so a persistent connection is never
+    # reused. psycopg 3's pool keeps connections across requests instead.
+    DATABASE_POOL = config("DATABASE_POOL", default=True, cast=bool)
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DATABASE_NAME"),
+            "USER": config("DATABASE_USER"),
+            "PASSWORD": config("DATABASE_PASSWORD"),
+            "HOST": config("DATABASE_HOST"),
+            "PORT": config("DATABASE_PORT"),
+            # Django refuses persistent connections next to a pool
+            "CONN_MAX_AGE": 0 if DATABASE_POOL else config("DATABASE_CONN_MAX_AGE", default=60, cast=int),
+            # Pooled and persistent connections are checked before they are handed out
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "connect_timeout": config("DATABASE_CONNECT_TIMEOUT", default=5, cast=int),
+                # Postgres cancels a runaway query instead of letting it hold a connection
+                "options": f"-c statement_timeout={config('DATABASE_STATEMENT_TIMEOUT_MS', default=30000, cast=int)}",
+            },
+        }
+    }
+    if DATABASE_POOL:
+        # Sizes are per worker process, all workers together must fit in Postgres' max_connections
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": config("DATABASE_POOL_MIN_SIZE", default=2, cast=int),
+            "max_size": config("DATABASE_POOL_MAX_SIZE", default=10, cast=int),
+            # Seconds a request waits for a free connection before it fails
+            "timeout": config("DATABASE_POOL_TIMEOUT", default=10, cast=int),
+            # Connections above min_size are closed after idling this long
+            "max_idle": config("DATABASE_POOL_MAX_IDLE", default=300, cast=int),
+            "max_lifetime": config("DATABASE_POOL_MAX_LIFETIME", default=1800, cast=int),
+        }
+    if config("DATABASE_REPLICA_HOST", default=""):
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": config("DATABASE_REPLICA_HOST"),
+            "PORT": config("DATABASE_REPLICA_PORT", default=config("DATABASE_PORT")),
+            "OPTIONS": deepcopy(DATABASES["default"]["OPTIONS"]),
+            # Tests run against the primary's test database only
+            "TEST": {"MIRROR": "default"},
+        }
+
+# Reporting views (AdminApp.routers.ReplicaReadMixin) read from the replica when one is configured
+DATABASE_ROUTERS = ["AdminApp.routers.ReplicaRouter"]
+DATABASE_REPLICA = "replica" if "replica" in DATABASES else None
+# How long a user's reads stay on the primary after they wrote
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=5, cast=int)
 
 
 # Password validation
@@ -155,7 +263,11 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework.authentication.TokenAuthentication",
-    ]
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "AdminApp.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
 # JWT Settings
@@ -0,0 +1,338 @@
+"""
+Shared fixtures for the query-count test suites in each app's tests.py and
+the harnesses in Scripts/ (benchmark, claim race).
+
+The data set is sized like production (500 vehicles, 5k notifications, 50
+users) so endpoints that issue a query per row blow well past their bounds.
+Outbound calls (FCM, MSG91, Nominatim, googletrans) are replaced by local fakes.
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from PIL import Image
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.utils import timezone
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from AdminApp.models import User
+from AuthApp.models import Driver
+from MemberApp.models import (
+    VehicleInfo, VehicleCapacity, VehicleImage, DriverNotification, Load,
+    NotificationClaim, UserFCMDevice, Display, RolePermissionConfig,
+)
+
+VEHICLE_COUNT = 500
+LOAD_COUNT = 1000
+VEHICLES_PER_LOAD = 5  # 5k notifications
+STAFF_COUNT = 9
+DRIVER_COUNT = 40  # plus one admin and the staff, 50 users
+PASSWORD = "password"
+
+# Settings every harness runs under, nothing leaves the process
+TEST_SETTINGS = {
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "PASSWORD_HASHERS": ["django.contrib.auth.hashers.MD5PasswordHasher"],
+    "MEDIA_ROOT": os.path.join(tempfile.gettempdir(), "kana-test-media"),
+    # A test replica mirrors the primary, but cannot see rows of an open test transaction
+    "DATABASE_REPLICA": None,
+}
+
+
+class FakeTranslation:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTranslator:
+    """Stands in for googletrans.Translator, returns the text unchanged."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def translate(self, text, dest="en"):
+        return FakeTranslation(text)
+
+
+@contextmanager
+def fake_external_services():
+    with mock.patch("MemberApp.views.send_push_to_devices", return_value={"status": 200}), \
+            mock.patch("MemberApp.views.Translator", FakeTranslator), \
+            mock.patch("AuthApp.views.send_otp_api", return_value={"type": "success"}), \
+            mock.patch("AuthApp.views.verify_otp", return_value={"type": "success"}), \
+            mock.patch("AuthApp.views.get_location", return_value="Ring Road, Surat, Gujarat, India"):
+        yield
+
+
+def make_image(name="document.png", size=(64, 64)):
+    """A small real PNG for the upload endpoints."""
+    buffer = BytesIO()
+    Image.new("RGB", size, color=(200, 120, 40)).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+def seed_fixtures(vehicle_count=VEHICLE_COUNT, load_count=LOAD_COUNT):
+    """Bulk-loads the shared data set, returns the interesting rows.
+
+    The benchmark seeds larger scales; vehicle_count must cover DRIVER_COUNT.
+    """
+    password = make_password(PASSWORD)
+
+    admin = User.objects.create(
+        email="admin@kana.test", name="Admin", number="9000000000",
+        role="admin", is_active=True, is_admin=True, password=password)
+
+    staff = User.objects.bulk_create([
+        User(email=f"staff{i}@kana.test", name=f"Staff {i}", number=f"91000000{i:02d}",
+             role="staff", is_active=True, password=password)
+        for i in range(STAFF_COUNT)
+    ])
+    drivers = User.objects.bulk_create([
+        User(email=f"driver{i}@kana.test", name=f"Driver {i}", number=f"92000000{i:02d}",
+             is_active=True, password=password)
+        for i in range(DRIVER_COUNT)
+    ])
+    Driver.objects.bulk_create([
+        Driver(user=user, name=user.name, email=user.email, number=user.number)
+        for user in drivers
+    ])
+
+    capacities = VehicleCapacity.objects.bulk_create([
+        VehicleCapacity(capacity=Decimal(value)) for value in ("1.5", "2.5", "5.0", "9.0", "16.0")
+    ])
+    vehicles = VehicleInfo.objects.bulk_create([
+        VehicleInfo(
+            model="Tata Ace", name=f"Owner {i}", number=f"93{i:08d}",
+            # The first vehicles belong to the driver users
+            alternate_number=drivers[i].number if i < DRIVER_COUNT else f"94{i:08d}",
+            address=("Ring Road, Surat, Gujarat" if i % 2 else "FC Road, Pune, Maharashtra"),
+            capacity=capacities[i % len(capacities)],
+            vehicle_type=("open", "close")[i % 2],
+            status=VehicleInfo.StatusChoices.IN_PROGRESS if i < DRIVER_COUNT else VehicleInfo.StatusChoices.IN_COMPLETE,
+            location_status=("ON_LOCATION", "OFF_LOCATION", "IN_TRANSIT")[i % 3],
+            vehicle_number=f"GJ-{i // 10000:02d}-ES-{i % 10000:04d}",
+        )
+        for i in range(vehicle_count)
+    ])
+    VehicleImage.objects.bulk_create([
+        VehicleImage(vehicle=vehicle, image=f"vehicle_images/{vehicle.id}/{n}.jpg", description="RC")
+        for vehicle in vehicles[:DRIVER_COUNT] for n in range(2)
+    ])
+
+    creators = [admin] + staff
+    loads = Load.objects.bulk_create([
+        Load(source=f"Surat {i}", destination=f"Pune {i}", created_by=creators[i % len(creators)])
+        for i in range(load_count)
+    ])
+
+    notifications = []
+    claims = []
+    today = date.today()
+    now = timezone.now()
+    for i, load in enumerate(loads):
+        # Every tenth load has been claimed by the first recipient, on another
+        # tenth a driver holds a reservation before claiming
+        claimed = i % 10 == 0
+        for n in range(VEHICLES_PER_LOAD):
+            vehicle = vehicles[(i * VEHICLES_PER_LOAD + n) % vehicle_count]
+            winner = claimed and n == 0
+            held = i % 10 == 5 and n == 0
+            notifications.append(DriverNotification(
+                vehicle=vehicle, load=load, source=load.source, destination=load.destination,
+                rate=Decimal("1500.00"), weight=Decimal("2.5"), date=today - timedelta(days=i % 30),
+                message="Urgent load", contact="9000000000", created_by=load.created_by,
+                is_read=winner, is_accepted=claimed, location_read_lock=winner,
+                reserved_by=drivers[i % DRIVER_COUNT] if winner or held else None,
+                reservation_time=now if winner or held else None,
+                reserved_until=now + DriverNotification.RESERVATION_TIMEOUT if held else None,
+            ))
+    notifications = DriverNotification.objects.bulk_create(notifications)
+
+    for notification in notifications:
+        if notification.location_read_lock:
+            claims.append(NotificationClaim(
+                load_id=notification.load_id, notification=notification, claimed_by=notification.reserved_by))
+    NotificationClaim.objects.bulk_create(claims)
+
+    UserFCMDevice.objects.bulk_create([
+        UserFCMDevice(user=user, registration_id=f"fcm-token-{user.number}", device_id=f"device-{user.number}")
+        for user in drivers
+    ])
+
+    staff_items = ["dashboard", "members", "notifications"]
+    RolePermissionConfig.objects.create(role="staff", items=staff_items)
+    Display.objects.bulk_create([
+        Display(user=user, items=item) for user in staff for item in staff_items
+    ])
+
+    return {
+        "admin": admin,
+        "staff": staff,
+        "drivers": drivers,
+        "vehicles": vehicles,
+        "capacities": capacities,
+        "notifications": notifications,
+    }
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(samples) - 1, round(percent / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def seed_claim_race(claimants, start=0):
+    """One load broadcast to `claimants` vehicles, returns (notification, driver user) pairs."""
+    users = User.objects.bulk_create([
+        User(email=f"racer{i}@kana.test", name=f"Racer {i}", number=f"95{i:08d}", is_active=True)
+        for i in range(start, start + claimants)
+    ])
+    capacity, _ = VehicleCapacity.objects.get_or_create(capacity=Decimal("2.5"))
+    vehicles = VehicleInfo.objects.bulk_create([
+        VehicleInfo(
+            model="Tata Ace", name=user.name, number=user.number, alternate_number=user.number,
+            address="Ring Road, Surat, Gujarat", capacity=capacity, vehicle_type="open",
+            vehicle_number=f"GJ-05-RC-{user.number[-6:]}",
+        )
+        for user in users
+    ])
+    load = Load.objects.create(source="Surat", destination="Mumbai")
+    notifications = DriverNotification.objects.bulk_create([
+        DriverNotification(
+            vehicle=vehicle, load=load, source=load.source, destination=load.destination,
+            rate=Decimal("1500.00"), weight=Decimal("2.5"), date=date.today(),
+            message="Urgent load", contact="9000000000",
+        )
+        for vehicle in vehicles
+    ])
+    return load, list(zip(notifications, users))
+
+
+def race_claims(pairs, timeout=60):
+    """
+    Fires one mark-read per (notification, user) pair from its own thread and
+    DB connection, all released at the same instant.
+
+    Every result records the response, the request latency and the time spent
+    in the claim INSERT, which is where losers wait on the winner's row lock.
+    """
+    barrier = threading.Barrier(len(pairs))
+    results = [None] * len(pairs)
+
+    def claim(index, notification, user):
+        result = {"user_id": user.id, "lock_wait_ms": 0.0, "errors": []}
+
+        def timed(execute, sql, params, many, context):
+            if not sql.lstrip().upper().startswith("INSERT") or "notificationclaim" not in sql.lower():
+                return execute(sql, params, many, context)
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            except Exception as e:
+                result["errors"].append(type(e).__name__)
+                result["deadlock"] = "deadlock" in str(e).lower()
+                raise
+            finally:
+                result["lock_wait_ms"] += (time.perf_counter() - started) * 1000
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        url = f"{reverse('mark-notification-read')}?notification_id={notification.id}"
+        try:
+            with connection.execute_wrapper(timed):
+                barrier.wait(timeout)
+                started = time.perf_counter()
+                response = client.post(url, {"is_read": True}, format="json")
+                result["latency_ms"] = (time.perf_counter() - started) * 1000
+            result["http_status"] = response.status_code
+            result["status"] = response.data.get("status")
+        except Exception as e:
+            result["errors"].append(type(e).__name__)
+        finally:
+            connection.close()
+        results[index] = result
+
+    threads = [
+        threading.Thread(target=claim, args=(index, notification, user))
+        for index, (notification, user) in enumerate(pairs)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "claimants": len(pairs),
+        "winners": [result["user_id"] for result in results if result and result.get("status") == 200],
+        "rejected": sum(1 for result in results if result and result.get("http_status") == 400),
+        "errors": [error for result in results if result for error in result["errors"]],
+        "deadlocks": sum(1 for result in results if result and result.get("deadlock")),
+        "latencies_ms": sorted(result["latency_ms"] for result in results if result and "latency_ms" in result),
+        "lock_waits_ms": sorted(result["lock_wait_ms"] for result in results if result),
+        "elapsed_s": elapsed,
+    }
+
+
+@override_settings(**TEST_SETTINGS, QUERY_BUDGET_STRICT=True)
+class QueryCountTestCase(APITestCase):
+    """Base class: seeded data, faked outbound calls and a query bound assertion."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = seed_fixtures()
+        cls.admin = cls.fixtures["admin"]
+        cls.staff_user = cls.fixtures["staff"][0]
+        cls.driver = cls.fixtures["drivers"][0]
+        cls.vehicle = cls.fixtures["vehicles"][0]
+
+    def setUp(self):
+        # Cached responses would outlive the rolled back rows they were built from
+        cache.clear()
+        fakes = fake_external_services()
+        fakes.__enter__()
+        self.addCleanup(fakes.__exit__, None, None, None)
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def get_etag(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        return response["ETag"]
+
+    def get_json(self, response):
+        """Decoded body, a streamed response is drained here, inside any assertMaxQueries block."""
+        if response.streaming:
+            return json.loads(b"".join(response.streaming_content))
+        return json.loads(response.content)
+
+    @contextmanager
+    def assertMaxQueries(self, maximum):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > maximum:
+            queries = "\n".join(
+                f"{index}. {query['sql']}" for index, query in enumerate(context.captured_queries, start=1))
+            self.fail(f"{executed} queries executed, {maximum} allowed\n{queries}")
@@ -0,0 +1,103 @@
+from django.db import transaction
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from MemberApp.models import InboxEvent, DriverNotification
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def inbox_group(vehicle_id):
+    """Channel group every socket of the vehicle's driver is subscribed to."""
+    return f"inbox_vehicle_{vehicle_id}"
+
+
+def notification_payload(notification):
+    return {
+        "notification_id": str(notification.id),
+        "vehicle_id": str(notification.vehicle_id),
+        "load_id": notification.load_id,
+        "source": notification.source,
+        "destination": notification.destination,
+        "rate": str(notification.rate),
+        "weight": str(notification.weight),
+        "date": str(notification.date) if notification.date else None,
+        "contact": notification.contact,
+        "is_read": notification.is_read,
+        "is_accepted": notification.is_accepted,
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+def _send(events):
+    try:
+        channel_layer = get_channel_layer()
+        send = async_to_sync(channel_layer.group_send)
+        for event in events:
+            send(inbox_group(event.vehicle_id), {
+                "type": "inbox_event",
+                "message": event.as_message(),
+            })
+    except Exception as e:
+        error = f"\nType: {type(e).__name__}"
+        error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+        error += f"\nLine: {e.__traceback__.tb_lineno}"
+        error += f"\nMessage: {str(e)}"
+        logger.error(error)
+
+
+def publish_events(events):
+    """Persist the events and push them to the drivers once committed."""
+    if not events:
+        return []
+    events = InboxEvent.objects.bulk_create(events)
+    transaction.on_commit(lambda: _send(events))
+    return events
+
+
+def publish_created(notifications):
+    return publish_events([
+        InboxEvent(
+            vehicle_id=notification.vehicle_id,
+            event=InboxEvent.EventChoices.CREATED,
+            notification_id=notification.id,
+            payload=notification_payload(notification),
+        )
+        for notification in notifications
+    ])
+
+
+def publish_withdrawn(notifications):
+    return publish_events([
+        InboxEvent(
+            vehicle_id=notification.vehicle_id,
+            event=InboxEvent.EventChoices.WITHDRAWN,
+            notification_id=notification.id,
+            payload={"notification_id": str(notification.id), "load_id": notification.load_id},
+        )
+        for notification in notifications
+    ])
+
+
+def publish_claimed(notification):
+    """Tell the winner it got the load and withdraw it from everyone else."""
+    events = [InboxEvent(
+        vehicle_id=notification.vehicle_id,
+        event=InboxEvent.EventChoices.CLAIMED,
+        notification_id=notification.id,
+        payload=notification_payload(notification),
+    )]
+    siblings = DriverNotification.objects.filter(
+        load_id=notification.load_id
+    ).exclude(pk=notification.pk).only('id', 'vehicle_id', 'load_id')
+    events.extend(
+        InboxEvent(
+            vehicle_id=sibling.vehicle_id,
+            event=InboxEvent.EventChoices.WITHDRAWN,
+            notification_id=sibling.id,
+            payload={"notification_id": str(sibling.id), "load_id": sibling.load_id},
+        )
+        for sibling in siblings
+    )
+    return publish_events(events)
@@ -20,16 +20,28 @@ except Exception as e:
     logger.error(error)
 
 
+def device_tokens(users):
+    """FCM registration ids of every given user, in one query: {user_id: [token, ...]}."""
+    tokens = {}
+    for user_id, token in UserFCMDevice.objects.filter(user__in=users).values_list("user_id", "registration_id"):
+        tokens.setdefault(user_id, []).append(token)
+    return tokens
+
+
 def send_push_notification(user, title, body, data=None):
+    fcm_tokens = list(UserFCMDevice.objects.filter(user=user).values_list("registration_id", flat=True))
+    return send_push_to_devices(fcm_tokens, title, body, data)
+
+
+def send_push_to_devices(fcm_tokens, title, body, data=None):
+    """Does not touch the database, so it can run on any thread."""
     response = {"status": 400}
 
     try:
-        devices = UserFCMDevice.objects.filter(user=user)
-        if not devices.exists():
+        if not fcm_tokens:
             response["status"] = 400
             response["message"] = "No active devices found"
-
-        fcm_tokens = [device.registration_id for device in devices]
+            return Response(response)
 
         # create a message
         message = messaging.MulticastMessage(
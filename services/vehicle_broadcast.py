@@ -0,0 +1,258 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from MemberApp.models import VehicleInfo
+from MemberApp.serializers import GetAllVehicleInfoSerializer
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+VEHICLEINFO_GROUP = "vehicleinfo_updates"
+
+# Attributes subscribers can filter on, sent with every event for routing
+ROUTE_FIELDS = ("status", "location_status", "vehicle_type", "address")
+
+
+SEQUENCE_KEY = "vehicleinfo:seq"
+SNAPSHOT_KEY = "vehicleinfo:snapshot"
+SNAPSHOT_LOCK_KEY = "vehicleinfo:snapshot:lock"
+
+# How long a sequenced event stays available for replay
+BACKLOG_TIMEOUT = 60 * 60
+
+# A bootstrap waiting for another worker's snapshot rebuild checks every
+# SNAPSHOT_WAIT seconds, SNAPSHOT_ATTEMPTS times before building one itself
+SNAPSHOT_WAIT = 0.1
+SNAPSHOT_ATTEMPTS = 50
+
+
+def vehicle_group(vehicle_id):
+    """Channel group for sockets subscribed to a single vehicle."""
+    return f"vehicleinfo_{vehicle_id}"
+
+
+def vehicle_route(values):
+    """
+    Routing attributes of a vehicle, from an instance snapshot or a values() row.
+    A field deferred when the instance was loaded is routed as None.
+    """
+    if values is None:
+        return None
+    return {field: values.get(field) for field in ROUTE_FIELDS}
+
+
+class VehicleBroadcaster:
+    """
+    Coalesces vehicle changes and sends them to the vehicleinfo group at most
+    once per interval. Several saves of the same vehicle inside one interval
+    are merged into a single message carrying only the changed fields.
+    """
+
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def publish(self, vehicle_id, event, changes, route=None, previous=None):
+        with self._lock:
+            pending = self._pending.get(vehicle_id)
+            if pending is None:
+                pending = self._pending[vehicle_id] = {
+                    "data": {"event": event, "id": vehicle_id, "changes": {}},
+                    "route": {"current": route, "previous": previous},
+                }
+            # A vehicle created inside the window stays a create, a delete wins
+            if event != "vehicle.updated":
+                pending["data"]["event"] = event
+            pending["data"]["changes"].update(changes)
+            # Keep where the vehicle started the window and where it ended up
+            pending["route"]["current"] = route
+
+            if self.interval <= 0:
+                flush_now = True
+            else:
+                flush_now = False
+                if self._timer is None:
+                    self._timer = threading.Timer(self.interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+
+        if not pending:
+            return
+        try:
+            # One block of numbers for the whole flush, stored before any is
+            # sent so a client seeing a gap finds the missing events
+            first = next_sequence(len(pending)) - len(pending) + 1
+            for seq, message in enumerate(pending.values(), start=first):
+                message["data"]["seq"] = seq
+            store_events(pending.values())
+
+            channel_layer = get_channel_layer()
+            send = async_to_sync(channel_layer.group_send)
+            for vehicle_id, message in pending.items():
+                message = {"type": "send_vehicleinfo", **message}
+                send(VEHICLEINFO_GROUP, message)
+                send(vehicle_group(vehicle_id), message)
+        except Exception as e:
+            error = f"\nType: {type(e).__name__}"
+            error += f"\nFile: {e.__traceback__.tb_frame.f_code.co_filename}"
+            error += f"\nLine: {e.__traceback__.tb_lineno}"
+            error += f"\nMessage: {str(e)}"
+            logger.error(error)
+
+
+broadcaster = VehicleBroadcaster(settings.VEHICLEINFO_BROADCAST_INTERVAL_MS)
+
+
+def broadcast_vehicle_change(vehicle_id, event, changes, route=None, previous=None):
+    """
+    Queue a vehicle change for broadcast once the current transaction commits.
+    route/previous are the vehicle's routing attributes after and before the change.
+    """
+    vehicle_id = str(vehicle_id)
+    transaction.on_commit(
+        lambda: broadcaster.publish(vehicle_id, event, changes, route, previous))
+
+
+def broadcast_status_changes(statuses):
+    """Broadcast the result of VehicleInfo.sync_statuses()."""
+    if not statuses:
+        return
+    rows = VehicleInfo.objects.filter(id__in=statuses).values("id", *ROUTE_FIELDS)
+    for row in rows:
+        previous_status, status = statuses[row["id"]]
+        route = vehicle_route(row)
+        broadcast_vehicle_change(
+            row["id"], "vehicle.updated", {"status": status},
+            route=route, previous={**route, "status": previous_status})
+
+
+def backlog_key(seq):
+    return f"vehicleinfo:event:{seq}"
+
+
+def current_sequence():
+    return cache.get(SEQUENCE_KEY, 0)
+
+
+def next_sequence(count=1):
+    """
+    Take `count` consecutive sequence numbers and return the last one. A
+    single INCR on the shared cache, so numbers are unique across workers.
+    """
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    return cache.incr(SEQUENCE_KEY, count)
+
+
+def store_events(messages):
+    """Keep sequenced events (data and route) around for clients that reconnect."""
+    cache.set_many(
+        {backlog_key(message["data"]["seq"]): message for message in messages}, timeout=BACKLOG_TIMEOUT)
+
+
+def get_events_since(since):
+    """
+    Events after `since` in sequence order, or None when the client is too far
+    behind (or part of the backlog expired) and needs a fresh snapshot.
+    """
+    current = current_sequence()
+    if since >= current:
+        return []
+    if current - since > settings.VEHICLEINFO_BACKLOG_SIZE:
+        return None
+
+    keys = [backlog_key(seq) for seq in range(since + 1, current + 1)]
+    events = cache.get_many(keys)
+    if len(events) != len(keys):
+        return None
+    return [events[key] for key in keys]
+
+
+def build_snapshot():
+    # Read the version first, anything saved meanwhile is replayed on top of it
+    version = current_sequence()
+    vehicles = VehicleInfo.objects.select_related('capacity').order_by('id')
+    snapshot = {
+        "version": version,
+        "vehicles": GetAllVehicleInfoSerializer(vehicles, many=True).data,
+    }
+    cache.set(SNAPSHOT_KEY, snapshot, timeout=None)
+    return snapshot
+
+
+def get_snapshot(force=False):
+    """
+    Cached fleet snapshot. It is only rebuilt from the database once the
+    backlog can no longer bring it up to date, and only by one worker at a
+    time so a reconnect storm does not turn into a query storm. Returns None
+    while another worker rebuilds it.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is not None and not force and \
+            current_sequence() - snapshot["version"] <= settings.VEHICLEINFO_BACKLOG_SIZE:
+        return snapshot
+
+    if cache.add(SNAPSHOT_LOCK_KEY, 1, timeout=30):
+        try:
+            return build_snapshot()
+        finally:
+            cache.delete(SNAPSHOT_LOCK_KEY)
+    return None
+
+
+def try_bootstrap(since=None, rebuild=False):
+    """
+    One attempt of get_bootstrap(), None when it has to wait for another
+    worker's snapshot. With rebuild the snapshot is built regardless.
+    """
+    if since is not None:
+        events = get_events_since(since)
+        if events is not None:
+            return None, events
+
+    snapshot = build_snapshot() if rebuild else get_snapshot()
+    if snapshot is None:
+        return None
+    events = get_events_since(snapshot["version"])
+    if events is None:
+        # The backlog moved past the snapshot while it was read
+        snapshot = build_snapshot() if rebuild else get_snapshot(force=True)
+        if snapshot is None:
+            return None
+        events = get_events_since(snapshot["version"]) or []
+    return snapshot, events
+
+
+async def get_bootstrap(since=None):
+    """
+    What a (re)connecting client needs: the events after `since` when the
+    backlog still has them, otherwise a snapshot plus the events after it.
+    Returns (snapshot or None, events).
+
+    Waiting for another worker's rebuild happens on the event loop, a worker
+    thread is only taken for each attempt.
+    """
+    attempt = database_sync_to_async(try_bootstrap)
+    for _ in range(SNAPSHOT_ATTEMPTS):
+        bootstrap = await attempt(since)
+        if bootstrap is not None:
+            return bootstrap
+        await asyncio.sleep(SNAPSHOT_WAIT)
+    # The rebuilding worker is gone, its lock expires on its own
+    return await attempt(since, rebuild=True)